@@ -213,6 +213,10 @@ def create_app(config_class=Config) -> Flask:
     print("✅ REGISTRO DE BLUEPRINTS FINALIZADO")
     print("=" * 60 + "\n")
 
+    # Comandos CLI (flask worker, ...)
+    from app.commands import registrar_comandos
+    registrar_comandos(app)
+
     # Healthcheck
     @app.get("/health")
     def health():
@@ -113,4 +113,129 @@ def reset_database_logic():
     except Exception as e:
         db.session.rollback() 
         logging.error(f"ERRO CRÍTICO durante o reset e população (Jeziel Oliveira): {e}", exc_info=True)
-        raise e
\ No newline at end of file
+        raise e
+
+# ==============================================================================
+# 🖥️ COMANDOS CLI (flask <comando>)
+# ==============================================================================
+def registrar_comandos(app):
+    import click
+
+    @app.cli.command('worker')
+    @click.option('--fila', 'filas', multiple=True, default=['mensagens', 'envios'], help='Fila(s) a consumir.')
+    @click.option('--threads', type=int, default=None, help='Threads por fila (padrão: FILA_WORKERS).')
+    def worker(filas, threads):
+        """Processo dedicado que consome a fila de mensagens (IA + resposta)."""
+        from app.services import fila_service
+        app.config['FILA_WORKERS_EMBUTIDOS'] = False
+        pool = fila_service.iniciar_workers(app, filas=list(filas), qtd=threads)
+        if pool is None:
+            return
+        logging.info(f"👷 Worker rodando para {list(filas)}. Ctrl+C para sair.")
+        try:
+            pool.aguardar()
+        except KeyboardInterrupt:
+            pool.parar()
+
+    @app.cli.command('grade-horarios')
+    @click.argument('barbearia_id', type=int)
+    @click.option('--materializar', is_flag=True, help='Grava em grade_horarios a grade convertida dos campos de texto.')
+    def grade_horarios(barbearia_id, materializar):
+        """Mostra (ou materializa) a grade semanal estruturada da loja."""
+        import json
+        from app.core import horarios
+        barbearia = db.session.get(Barbearia, barbearia_id)
+        if barbearia is None:
+            click.echo(f"Loja {barbearia_id} não encontrada.")
+            return
+        grade = barbearia.grade_horarios or horarios.grade_legada(barbearia)
+        origem = 'grade_horarios' if barbearia.grade_horarios else 'campos de texto (legado)'
+        click.echo(f"🗓️ {barbearia.nome_fantasia} — origem: {origem}")
+        click.echo(json.dumps(grade, ensure_ascii=False, indent=2))
+        if materializar and not barbearia.grade_horarios:
+            barbearia.grade_horarios = grade
+            db.session.commit()
+            click.echo("✅ Grade gravada em grade_horarios.")
+
+    @app.cli.command('excecao-horario')
+    @click.argument('barbearia_id', type=int)
+    @click.argument('data', type=click.DateTime(formats=['%Y-%m-%d', '%d/%m/%Y']))
+    @click.option('--profissional', 'profissional_id', type=int, default=None, help='Só para este profissional.')
+    @click.option('--abertura', default=None, help='Horário especial (HH:MM). Sem ele, o dia fica fechado.')
+    @click.option('--fechamento', default=None, help='Fim do horário especial (HH:MM).')
+    @click.option('--motivo', default=None, help='Ex: Feriado, Folga.')
+    def excecao_horario(barbearia_id, data, profissional_id, abertura, fechamento, motivo):
+        """Registra feriado/folga (ou horário especial) numa data."""
+        from app.models.tables import ExcecaoHorario
+        especial = bool(abertura and fechamento)
+        db.session.add(ExcecaoHorario(
+            barbearia_id=barbearia_id, profissional_id=profissional_id, data=data.date(),
+            fechado=not especial, abertura=abertura if especial else None,
+            fechamento=fechamento if especial else None, motivo=motivo
+        ))
+        db.session.commit()
+        situacao = f"{abertura}-{fechamento}" if especial else "fechado"
+        click.echo(f"✅ Exceção registrada: {data.date().strftime('%d/%m/%Y')} ({situacao}).")
+
+    @app.cli.command('auditar-consultas')
+    @click.option('--limite-linhas', type=int, default=None, help='Máximo de linhas numa varredura sequencial (padrão: 1000).')
+    @click.option('--semear/--sem-semear', default=True, help='Semeia massa sintética numa transação desfeita no fim.')
+    def auditar_consultas(limite_linhas, semear):
+        """EXPLAIN das consultas quentes; falha se alguma faz varredura sequencial grande."""
+        from app.services import auditoria_consultas
+        limite = limite_linhas or auditoria_consultas.LIMITE_LINHAS_PADRAO
+        try:
+            ids = auditoria_consultas.semear() if semear else None
+            resultado = auditoria_consultas.auditar(limite, ids)
+        finally:
+            db.session.rollback()
+
+        reprovadas = 0
+        for nome, varreduras, reprovada in resultado:
+            reprovadas += reprovada
+            detalhe = ', '.join(f"Seq Scan {tabela} ({linhas} linhas)" for tabela, linhas in varreduras) or 'só índices'
+            click.echo(f"{'❌' if reprovada else '✅'} {nome}: {detalhe}")
+        if reprovadas:
+            raise SystemExit(f"{reprovadas} consulta(s) com varredura sequencial acima de {limite} linhas.")
+        click.echo(f"Todas as {len(resultado)} consultas passaram (limite {limite} linhas).")
+
+    @app.cli.command('inventario-quartos')
+    @click.argument('barbearia_id', type=int, required=False)
+    def inventario_quartos_cmd(barbearia_id):
+        """Refaz o inventário de noites das pousadas (ou só de uma) a partir das reservas."""
+        from app.models.tables import Barbearia
+        from app.services import inventario_quartos
+        consulta = Barbearia.query.filter_by(business_type='pousada')
+        if barbearia_id:
+            consulta = consulta.filter_by(id=barbearia_id)
+        for loja in consulta.all():
+            gravadas = inventario_quartos.reconstruir(loja.id)
+            click.echo(f"✅ {loja.nome_fantasia}: {gravadas} noite(s) no inventário.")
+
+    @app.cli.command('arquivar-chatlogs')
+    @click.option('--pasta', default=None, help='Destino dos JSONL.gz (padrão: CHATLOG_ARQUIVO_DIR).')
+    @click.option('--meses-a-frente', type=int, default=2, help='Partições mensais criadas adiante (PostgreSQL).')
+    @click.option('--simular', is_flag=True, help='Só mostra o que seria arquivado.')
+    def arquivar_chatlogs(pasta, meses_a_frente, simular):
+        """Cria as partições dos próximos meses e arquiva o histórico fora do prazo do plano."""
+        from app.services import chatlog_particoes
+        for nome in ([] if simular else chatlog_particoes.garantir_particoes(meses_a_frente)):
+            click.echo(f"🗂️ Partição {nome} criada.")
+        resultado = chatlog_particoes.arquivar(pasta or app.config['CHATLOG_ARQUIVO_DIR'], simular=simular)
+        for descricao, linhas, arquivo in resultado:
+            destino = f" -> {arquivo}" if arquivo else ''
+            click.echo(f"{'🔎' if simular else '📦'} {descricao}: {linhas} linha(s){destino}")
+        if not resultado:
+            click.echo("Nada fora do prazo de guarda.")
+
+    @app.cli.command('conversas')
+    @click.argument('barbearia_id', type=int, required=False)
+    def conversas_cmd(barbearia_id):
+        """Refaz clientes e o índice de conversas do monitor (todas as lojas ou só uma)."""
+        from app.services import conversas
+        consulta = Barbearia.query
+        if barbearia_id:
+            consulta = consulta.filter_by(id=barbearia_id)
+        for loja in consulta.all():
+            clientes, total = conversas.reconstruir(loja.id)
+            click.echo(f"✅ {loja.nome_fantasia}: {clientes} cliente(s), {total} conversa(s).")
@@ -0,0 +1,200 @@
+"""
+Motor de disponibilidade de horários (único para utils, plugins e IA).
+
+Tudo é feito em minutos inteiros a partir da meia-noite do dia:
+1. o expediente do dia (calendário compilado da loja, já em minutos) vira um
+   intervalo [abre, fecha);
+2. agendamentos, almoço e "agora + 15 min" viram intervalos ocupados,
+   ordenados e mesclados;
+3. o complemento dentro do expediente é a lista de intervalos livres;
+4. uma única varredura nos intervalos livres devolve os inícios válidos
+   (grade de 30 em 30 a partir da abertura, cabendo a duração inteira).
+
+Custo O(n log n) nos agendamentos + O(horários devolvidos), em vez de testar
+cada horário candidato contra cada agendamento com localize() a cada passo.
+"""
+from datetime import datetime, time, timedelta
+
+import pytz
+from sqlalchemy import select
+
+from app.core import horarios
+from app.extensions import db
+from app.models.tables import Agendamento
+
+BR_TZ = pytz.timezone('America/Sao_Paulo')
+
+INTERVALO_MINUTOS = 30
+ANTECEDENCIA_MINUTOS = 15
+DURACAO_AGENDAMENTO_PADRAO = 30
+
+
+# ==============================================================================
+# 🧠 EXPEDIENTE DO DIA (vem do calendário compilado da loja, ver app/core/horarios.py)
+# ==============================================================================
+def expediente_do_dia(barbearia, dia, profissional_id=None, calendario=None):
+    """
+    Retorna (abre, fecha, pausas) em minutos para o dia, ou None se não há expediente.
+    `pausas` são intervalos (inicio, fim) fechados dentro do expediente.
+    """
+    calendario = calendario or horarios.calendario_da_loja(barbearia)
+    return calendario.expediente(dia, profissional_id)
+
+
+# ==============================================================================
+# ⚙️ INTERVALOS
+# ==============================================================================
+def mesclar(intervalos):
+    """Ordena e funde intervalos (inicio, fim) que se sobrepõem ou encostam."""
+    mesclados = []
+    for inicio, fim in sorted(intervalos):
+        if fim <= inicio:
+            continue
+        if mesclados and inicio <= mesclados[-1][1]:
+            if fim > mesclados[-1][1]:
+                mesclados[-1][1] = fim
+        else:
+            mesclados.append([inicio, fim])
+    return [(inicio, fim) for inicio, fim in mesclados]
+
+
+def intervalos_livres(abre, fecha, ocupados_mesclados):
+    """Complemento dos ocupados (já mesclados) dentro de [abre, fecha)."""
+    livres = []
+    cursor = abre
+    for inicio, fim in ocupados_mesclados:
+        if fim <= cursor:
+            continue
+        if inicio >= fecha:
+            break
+        if inicio > cursor:
+            livres.append((cursor, inicio))
+        cursor = max(cursor, fim)
+    if cursor < fecha:
+        livres.append((cursor, fecha))
+    return livres
+
+
+def inicios_validos(abre, fecha, ocupados, duracao, passo=INTERVALO_MINUTOS):
+    """
+    Inícios (minutos) da grade abre + k*passo em que [inicio, inicio + duracao) cabe
+    inteiro num intervalo livre.
+    """
+    resultado = []
+    for livre_ini, livre_fim in intervalos_livres(abre, fecha, mesclar(ocupados)):
+        # primeiro ponto da grade dentro do intervalo livre
+        k = -((abre - livre_ini) // passo)
+        inicio = abre + max(k, 0) * passo
+        while inicio + duracao <= livre_fim:
+            resultado.append(inicio)
+            inicio += passo
+    return resultado
+
+
+# ==============================================================================
+# 🔌 INTEGRAÇÃO COM O BANCO
+# ==============================================================================
+def consultar_ocupados(barbearia_id, profissional_ids, data_inicio, data_fim):
+    """
+    Agendamentos de vários profissionais em vários dias numa única consulta ao banco.
+    Retorna {(profissional_id, date): [(inicio, fim), ...]} em minutos do dia.
+    """
+    inicio_query = datetime.combine(data_inicio, time.min)
+    fim_query = datetime.combine(data_fim, time.min) + timedelta(days=1)
+
+    # Só colunas do próprio agendamento (duração/fim gravados nele): nenhum JOIN com servico
+    linhas = db.session.execute(
+        select(Agendamento.profissional_id, Agendamento.data_hora, Agendamento.data_hora_fim, Agendamento.duracao_minutos)
+        .where(
+            Agendamento.barbearia_id == barbearia_id,
+            Agendamento.profissional_id.in_(list(profissional_ids)),
+            Agendamento.data_hora >= inicio_query,
+            Agendamento.data_hora < fim_query
+        )
+    ).all()
+
+    ocupados = {}
+    for profissional_id, data_hora, data_hora_fim, duracao_minutos in linhas:
+        if data_hora_fim is not None:
+            duracao_ag = int((data_hora_fim - data_hora).total_seconds() // 60)
+        else:
+            duracao_ag = duracao_minutos or DURACAO_AGENDAMENTO_PADRAO
+        inicio = data_hora.hour * 60 + data_hora.minute
+        ocupados.setdefault((profissional_id, data_hora.date()), []).append((inicio, inicio + duracao_ag))
+    return ocupados
+
+
+def ocupados_do_dia(barbearia_id, profissional_id, dia):
+    """Agendamentos do profissional no dia, como intervalos (inicio, fim) em minutos (via cache de ocupação)."""
+    from app.services import ocupacao
+    return ocupacao.intervalos(ocupacao.bitmap_do_dia(barbearia_id, profissional_id, horarios._como_data(dia)))
+
+
+def ocupados_do_periodo(barbearia_id, profissional_ids, data_inicio, data_fim):
+    """
+    Agendamentos de vários profissionais em vários dias (via cache de ocupação; o que faltar
+    vem numa única consulta). Retorna {(profissional_id, date): [(inicio, fim), ...]}.
+    """
+    from app.services import ocupacao
+    bitmaps = ocupacao.bitmaps_do_periodo(barbearia_id, profissional_ids, data_inicio, data_fim)
+    return {chave: ocupacao.intervalos(bits) for chave, bits in bitmaps.items() if bits}
+
+
+def calcular_horarios(barbearia, profissional_id, dia, duracao, ocupados=None, agora=None, calendario=None):
+    """
+    Horários livres (datetimes com fuso de São Paulo) para o profissional no dia.
+    `ocupados` pode vir pronto (minutos); senão é buscado no banco.
+    `calendario` pode vir pronto (horarios.compilar); senão usa o da loja em cache.
+    """
+    agora = agora or datetime.now(BR_TZ)
+
+    # 🛑 TRAVA DE PASSADO
+    if dia.date() < agora.date():
+        return []
+
+    expediente = expediente_do_dia(barbearia, dia, profissional_id, calendario)
+    if expediente is None:
+        return []
+    abre, fecha, pausas = expediente
+
+    if ocupados is None:
+        ocupados = ocupados_do_dia(barbearia.id, profissional_id, dia)
+    ocupados = list(ocupados) + list(pausas)
+
+    # Hoje: nada que comece antes de agora + 15 min
+    if dia.date() == agora.date():
+        limite = agora.hour * 60 + agora.minute + ANTECEDENCIA_MINUTOS + (1 if agora.second or agora.microsecond else 0)
+        ocupados.append((0, limite))
+
+    meia_noite = BR_TZ.localize(datetime.combine(dia.date(), time.min))
+    return [meia_noite + timedelta(minutes=m) for m in inicios_validos(abre, fecha, ocupados, duracao)]
+
+
+def matriz_horarios(barbearia, profissional_ids, dias, duracao, agora=None):
+    """
+    Disponibilidade em lote: {(profissional_id, date): [datetimes livres]} para todos os
+    profissionais e dias pedidos, com UMA consulta de agendamentos para o período inteiro.
+    """
+    agora = agora or datetime.now(BR_TZ)
+    calendario = horarios.calendario_da_loja(barbearia)
+    profissional_ids = list(profissional_ids)
+    datas = sorted({horarios._como_data(d) for d in dias})
+    if not profissional_ids or not datas:
+        return {}
+
+    # Dias passados ou fechados nem entram na consulta
+    datas_uteis = [
+        d for d in datas
+        if d >= agora.date() and any(calendario.expediente(d, p) is not None for p in profissional_ids)
+    ]
+    ocupados = ocupados_do_periodo(barbearia.id, profissional_ids, datas_uteis[0], datas_uteis[-1]) if datas_uteis else {}
+
+    matriz = {}
+    for data in datas:
+        dia = datetime.combine(data, time.min)
+        for profissional_id in profissional_ids:
+            matriz[(profissional_id, data)] = calcular_horarios(
+                barbearia, profissional_id, dia, duracao,
+                ocupados=ocupados.get((profissional_id, data), []), agora=agora, calendario=calendario
+            )
+    return matriz
@@ -0,0 +1,236 @@
+"""
+Grade de horários estruturada da loja, compilada uma vez e guardada em memória.
+
+Formato de `Barbearia.grade_horarios` / `Profissional.grade_horarios` (JSON):
+
+    {"seg": [["09:00", "12:00"], ["13:00", "19:00"]], "ter": [...], "dom": []}
+
+- cada dia é uma lista de janelas abertas; o intervalo entre janelas é pausa (almoço);
+- lista vazia = fechado; dia ausente = usa o da loja (profissional) ou o legado (loja);
+- `ExcecaoHorario` sobrepõe uma data (feriado, folga, horário especial), para a loja
+  toda ou para um profissional.
+
+Sem grade estruturada, a loja continua funcionando pelos campos antigos
+(`dias_funcionamento`, `horario_abertura`...), convertidos aqui uma única vez.
+O resultado é um `Calendario` só com minutos inteiros: o motor de disponibilidade
+não interpreta mais nenhuma string por chamada.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+from cachetools import LRUCache
+
+BR_TZ = pytz.timezone('America/Sao_Paulo')
+
+DIAS_SEMANA = ('seg', 'ter', 'qua', 'qui', 'sex', 'sab', 'dom')
+# Almoço fixo das configurações da Carol (12h-13h)
+ALMOCO_CAROL = (12 * 60, 13 * 60)
+MAX_CALENDARIOS = 256
+
+_lock = threading.Lock()
+_calendarios = LRUCache(maxsize=MAX_CALENDARIOS)
+
+
+def _minutos(hhmm, padrao):
+    try:
+        h, m = map(int, str(hhmm).split(':'))
+        return h * 60 + m
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _como_data(dia):
+    return dia.date() if isinstance(dia, datetime) else dia
+
+
+# ==============================================================================
+# 🧾 GRADE LEGADA (dias_funcionamento + horários em texto, INCLUINDO CAROL LASH)
+# ==============================================================================
+def _expediente_legado(barbearia, dia_semana_int):
+    """(abre, fecha, pausas) em minutos para o dia da semana (0=Seg), ou None se fechado."""
+    h_abre_str = getattr(barbearia, 'horario_abertura', '09:00') or '09:00'
+    h_fecha_padrao = getattr(barbearia, 'horario_fechamento', '19:00') or '19:00'
+    h_fecha_sabado = getattr(barbearia, 'horario_fechamento_sabado', '14:00') or '14:00'
+    dias_func_str = getattr(barbearia, 'dias_funcionamento', 'Terça a Sábado') or 'Terça a Sábado'
+
+    dia_aberto = False
+    h_fecha_str = h_fecha_padrao
+
+    eh_carol = 'Carol' in dias_func_str
+
+    # CENÁRIO 1: CAROL MISTO (Terça a Sábado)
+    if dias_func_str == 'Carol: Terça a Sábado (Misto)':
+        if dia_semana_int in [1, 2, 3, 4, 5]:
+            dia_aberto = True
+            if dia_semana_int == 5:
+                h_fecha_str = h_fecha_sabado
+            elif dia_semana_int in [1, 3]:
+                # Ter/Qui até 22h (último às 20:30 com 1h30 de serviço)
+                h_fecha_str = '22:00'
+            elif dia_semana_int in [2, 4]:
+                # Qua/Sex até 19h (último às 17:30)
+                h_fecha_str = '19:00'
+
+    # CENÁRIO 2: CAROL SEMANA DE CURSO (Segunda a Sexta)
+    elif dias_func_str == 'Carol: Segunda a Sexta (Misto)':
+        if dia_semana_int in [0, 1, 2, 3, 4]:
+            dia_aberto = True
+            h_fecha_str = '22:00' if dia_semana_int in [1, 3] else '19:00'
+
+    # CENÁRIO 3: PADRÃO (Outras Lojas)
+    else:
+        dias_lower = dias_func_str.lower()
+        if 'segunda a sexta' in dias_lower and dia_semana_int < 5:
+            dia_aberto = True
+        elif 'segunda a sábado' in dias_lower and dia_semana_int < 6:
+            dia_aberto = True
+            if dia_semana_int == 5: h_fecha_str = h_fecha_sabado
+        elif 'terça a sábado' in dias_lower and 0 < dia_semana_int < 6:
+            dia_aberto = True
+            if dia_semana_int == 5: h_fecha_str = h_fecha_sabado
+        elif 'terça a sexta' in dias_lower and 0 < dia_semana_int < 5:
+            dia_aberto = True
+
+        # Travas Extras
+        if dia_semana_int == 5 and 'sábado' not in dias_lower and 'sabado' not in dias_lower:
+            dia_aberto = False
+        if dia_semana_int == 6 and 'domingo' not in dias_lower:
+            dia_aberto = False
+        if dia_semana_int == 0 and 'segunda' not in dias_lower:
+            dia_aberto = False
+
+    if not dia_aberto:
+        return None
+
+    abre, fecha = _minutos(h_abre_str, None), _minutos(h_fecha_str, None)
+    if abre is None or fecha is None:
+        abre, fecha = 9 * 60, 19 * 60
+
+    pausas = (ALMOCO_CAROL,) if eh_carol else ()
+    return abre, fecha, pausas
+
+
+def grade_legada(barbearia):
+    """Converte os campos antigos da loja para o formato de `grade_horarios`."""
+    grade = {}
+    for i, nome in enumerate(DIAS_SEMANA):
+        expediente = _expediente_legado(barbearia, i)
+        grade[nome] = [] if expediente is None else [
+            [f"{a // 60:02d}:{a % 60:02d}", f"{b // 60:02d}:{b % 60:02d}"] for a, b in _janelas(*expediente)
+        ]
+    return grade
+
+
+# ==============================================================================
+# ⚙️ COMPILAÇÃO (texto/JSON -> minutos)
+# ==============================================================================
+def _janelas(abre, fecha, pausas):
+    """Expediente com pausas -> janelas abertas."""
+    janelas, cursor = [], abre
+    for ini, fim in sorted(pausas):
+        if ini > cursor:
+            janelas.append((cursor, min(ini, fecha)))
+        cursor = max(cursor, fim)
+    if cursor < fecha:
+        janelas.append((cursor, fecha))
+    return janelas
+
+
+def _expediente_de_janelas(janelas):
+    """Janelas abertas ["09:00", "12:00"] -> (abre, fecha, pausas), ou None se fechado."""
+    intervalos = sorted(
+        (ini, fim) for ini, fim in (
+            (_minutos(j[0], None), _minutos(j[1], None)) for j in janelas or () if len(j) == 2
+        )
+        if ini is not None and fim is not None and fim > ini
+    )
+    if not intervalos:
+        return None
+    pausas = tuple(
+        (fim_anterior, ini) for (_, fim_anterior), (ini, _) in zip(intervalos, intervalos[1:]) if ini > fim_anterior
+    )
+    return intervalos[0][0], max(fim for _, fim in intervalos), pausas
+
+
+def _compilar_grade(grade, base):
+    """Tupla de 7 expedientes: dias presentes em `grade` sobrepõem os de `base`."""
+    grade = grade or {}
+    return tuple(
+        _expediente_de_janelas(grade[nome]) if nome in grade else base[i]
+        for i, nome in enumerate(DIAS_SEMANA)
+    )
+
+
+class Calendario:
+    """Expedientes da loja já em minutos: semana, sobreposições por profissional e exceções por data."""
+
+    __slots__ = ('semana', 'profissionais', 'excecoes')
+
+    def __init__(self, semana, profissionais=None, excecoes=None):
+        self.semana = semana
+        # {profissional_id: tupla de 7 expedientes}
+        self.profissionais = profissionais or {}
+        # {(profissional_id | None, date): expediente | None}
+        self.excecoes = excecoes or {}
+
+    def expediente(self, dia, profissional_id=None):
+        """(abre, fecha, pausas) em minutos, ou None se fechado para o profissional nesse dia."""
+        data = _como_data(dia)
+        if self.excecoes:
+            if (profissional_id, data) in self.excecoes:
+                return self.excecoes[(profissional_id, data)]
+            if (None, data) in self.excecoes:
+                return self.excecoes[(None, data)]
+        return self.profissionais.get(profissional_id, self.semana)[data.weekday()]
+
+
+def compilar(barbearia, profissionais=(), excecoes=()):
+    """Monta o `Calendario` a partir da loja, dos profissionais com grade própria e das exceções."""
+    legado = tuple(_expediente_legado(barbearia, i) for i in range(7))
+    semana = _compilar_grade(getattr(barbearia, 'grade_horarios', None), legado)
+
+    por_profissional = {
+        p.id: _compilar_grade(p.grade_horarios, semana)
+        for p in profissionais if getattr(p, 'grade_horarios', None)
+    }
+
+    por_data = {}
+    for excecao in excecoes:
+        if excecao.fechado:
+            expediente = None
+        else:
+            expediente = _expediente_de_janelas([[excecao.abertura, excecao.fechamento]])
+        por_data[(excecao.profissional_id, excecao.data)] = expediente
+
+    return Calendario(semana, por_profissional, por_data)
+
+
+# ==============================================================================
+# 🧠 CACHE POR LOJA (invalidado junto com a versão da config)
+# ==============================================================================
+def calendario_da_loja(barbearia):
+    """`Calendario` da loja, compilado só quando a config (loja, profissionais, exceções) muda."""
+    from app.models.tables import Profissional, ExcecaoHorario
+    from app.services.cache_modelos import versao_config
+
+    chave = (barbearia.id, versao_config(barbearia.id))
+    with _lock:
+        calendario = _calendarios.get(chave)
+    if calendario is not None:
+        return calendario
+
+    profissionais = Profissional.query.filter(
+        Profissional.barbearia_id == barbearia.id,
+        Profissional.grade_horarios.isnot(None)
+    ).all()
+    ontem = datetime.now(BR_TZ).date() - timedelta(days=1)
+    excecoes = ExcecaoHorario.query.filter(
+        ExcecaoHorario.barbearia_id == barbearia.id,
+        ExcecaoHorario.data >= ontem
+    ).all()
+
+    calendario = compilar(barbearia, profissionais, excecoes)
+    with _lock:
+        _calendarios[chave] = calendario
+    return calendario
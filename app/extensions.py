@@ -1,7 +1,32 @@
 # app/extensions.py
 # (Código completo, preservado e corrigido)
+import os
+import logging
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache # <-- ADICIONADO
 
 db = SQLAlchemy()
-cache = Cache() # <-- ADICIONADO
\ No newline at end of file
+cache = Cache() # <-- ADICIONADO
+
+# --- CLIENTE REDIS COMPARTILHADO (FILAS, TRAVAS, PAUSAS) ---
+_redis_client = None
+
+def obter_redis():
+    """
+    Retorna um cliente Redis único por processo (pool de conexões reaproveitado).
+    Usa REDIS_URL ou CACHE_REDIS_URL. Retorna None se não houver Redis configurado.
+    """
+    global _redis_client
+    if _redis_client is not None:
+        return _redis_client
+
+    redis_url = os.environ.get('REDIS_URL') or os.environ.get('CACHE_REDIS_URL')
+    if not redis_url:
+        return None
+    try:
+        import redis
+        _redis_client = redis.from_url(redis_url)
+    except Exception as e:
+        logging.error(f"Erro ao conectar no Redis: {e}")
+        _redis_client = None
+    return _redis_client
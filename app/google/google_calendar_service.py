@@ -46,7 +46,7 @@ class GoogleCalendarService:
 
         try:
             inicio = agendamento.data_hora.isoformat()
-            fim = (agendamento.data_hora + datetime.timedelta(minutes=agendamento.servico.duracao)).isoformat()
+            fim = agendamento.fim.isoformat()
 
             evento_body = {
                 'summary': f"✂️ {agendamento.nome_cliente} - {agendamento.servico.nome}",
@@ -1,8 +1,9 @@
 # app/models/tables.py
 from app.extensions import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_login import UserMixin
-from sqlalchemy import Text
+from sqlalchemy import Text, func, column, literal_column, event, DDL
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # ---------------------------------------------------------------------
@@ -13,6 +14,12 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 class Barbearia(db.Model):
     __tablename__ = 'barbearia'  # Garante que a FK 'barbearia.id' funcione sempre
+    __table_args__ = (
+        # Webhook da Meta: loja pelo phone_number_id (índice parcial, só lojas com Meta)
+        db.Index('ix_barbearia_meta_phone_number_id', 'meta_phone_number_id',
+                 postgresql_where=db.text('meta_phone_number_id IS NOT NULL'),
+                 sqlite_where=db.text('meta_phone_number_id IS NOT NULL')),
+    )
 
     business_type = db.Column(db.String(50), default='barbershop', server_default='barbershop', nullable=False)
     
@@ -50,6 +57,10 @@ class Barbearia(db.Model):
     
     dias_funcionamento = db.Column(db.String(50), default="Terça a Sábado") # Ex: "Segunda a Sexta"
 
+    # Grade semanal estruturada (app/core/horarios.py). Quando preenchida, tem prioridade
+    # sobre os campos de texto acima. Ex: {"seg": [["09:00", "12:00"], ["13:00", "19:00"]], "dom": []}
+    grade_horarios = db.Column(db.JSON, nullable=True)
+
     # Personalização Visual e de Comportamento (IA)
     cor_primaria = db.Column(db.String(7), nullable=True)      # Ex: "#EC4899" (Para o Painel)
     emojis_sistema = db.Column(db.String(100), nullable=True)  # Ex: "🦋✨💖" (Para a IA)
@@ -93,6 +104,9 @@ class Barbearia(db.Model):
     # ID exclusivo da sessão deste cliente lá no WAHA (ex: 'barbearia_do_joao_01').
     waha_session_id = db.Column(db.String(100), unique=True, nullable=True)
 
+    # Orçamento de tokens do histórico enviado à IA (None = padrão HISTORICO_LIMITE_TOKENS)
+    limite_tokens_historico = db.Column(db.Integer, nullable=True)
+
 # ---------------------------------------------------------------------
 # FASE DE EXPANSÃO: MODELOS ATUALIZADOS (AS "ETIQUETAS")
 # ---------------------------------------------------------------------
@@ -126,6 +140,9 @@ class User(UserMixin, db.Model):
 
 class Profissional(db.Model):
     __tablename__ = 'profissional'
+    __table_args__ = (
+        db.Index('ix_profissional_loja_nome', 'barbearia_id', 'nome'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
@@ -138,12 +155,18 @@ class Profissional(db.Model):
     # 👇 ADICIONE ESTAS DUAS LINHAS NOVAS 👇
     tipo = db.Column(db.String(50), default='humano')  # Ex: 'humano' ou 'quarto'
     capacidade = db.Column(db.Integer, default=1)      # Ex: 1 (cabeleireira) ou 4 (quarto quádruplo)
+
+    # Grade própria (mesmo formato da loja); só os dias informados sobrepõem a da loja
+    grade_horarios = db.Column(db.JSON, nullable=True)
     
     # A relação 'agendamentos' continua igual
     agendamentos = db.relationship('Agendamento', backref='profissional', lazy=True)
 
 class Servico(db.Model):
     __tablename__ = 'servico'
+    __table_args__ = (
+        db.Index('ix_servico_loja_nome', 'barbearia_id', 'nome'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
@@ -159,9 +182,34 @@ class Servico(db.Model):
 
 class Agendamento(db.Model):
     __tablename__ = 'agendamento'
+    # PostgreSQL recusa na própria escrita dois agendamentos sobrepostos do mesmo
+    # profissional/quarto (ver app/services/reserva_service.py)
+    __table_args__ = (
+        ExcludeConstraint(
+            ('profissional_id', '='),
+            (func.tsrange(column('data_hora'), column('data_hora_fim'), literal_column("'[)'")), '&&'),
+            name='agendamento_sem_sobreposicao',
+            using='gist',
+            where=column('data_hora_fim').isnot(None),
+        ).ddl_if(dialect='postgresql'),
+        # Agenda/disponibilidade: loja + profissional + período
+        db.Index('ix_agendamento_loja_prof_data', 'barbearia_id', 'profissional_id', 'data_hora'),
+        # Reserva/quartos e checagem de sobreposição: só profissional + período
+        db.Index('ix_agendamento_prof_data', 'profissional_id', 'data_hora'),
+        # Painel/dashboard: todos os profissionais da loja num período
+        db.Index('ix_agendamento_loja_data', 'barbearia_id', 'data_hora'),
+        # Cancelamento pela IA e lista de clientes: telefone dentro da loja
+        db.Index('ix_agendamento_loja_telefone', 'barbearia_id', 'telefone_cliente'),
+        # Feed incremental do calendário (?since=): alterados da loja desde um instante
+        db.Index('ix_agendamento_loja_atualizado', 'barbearia_id', 'atualizado_em'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     data_hora = db.Column(db.DateTime, nullable=False)
+    # Duração e fim do atendimento/estadia gravados no momento do agendamento (preenchidos
+    # automaticamente). Mudar a duração do serviço depois não altera agendamentos já feitos.
+    duracao_minutos = db.Column(db.Integer, nullable=True)
+    data_hora_fim = db.Column(db.DateTime, nullable=True)
     nome_cliente = db.Column(db.String(100), nullable=False)
     telefone_cliente = db.Column(db.String(20), nullable=False)
     
@@ -172,6 +220,64 @@ class Agendamento(db.Model):
     # --- A "ETIQUETA" ---
     # Adicionamos a ligação à Barbearia.
     barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id'), nullable=False)
+    # Última gravação (feed incremental e ETag do calendário)
+    atualizado_em = db.Column(db.DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
+
+    @property
+    def fim(self):
+        """Fim do agendamento sem consultar o serviço (encaixes antigos sobrepostos não têm data_hora_fim)."""
+        if self.data_hora_fim is not None:
+            return self.data_hora_fim
+        return self.data_hora + timedelta(minutes=self.duracao_minutos or 30)
+
+# A constraint de exclusão com '=' num inteiro precisa da extensão btree_gist
+event.listen(
+    Agendamento.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+
+class ExcecaoHorario(db.Model):
+    """Feriado, folga ou horário especial numa data (loja toda ou só um profissional)."""
+    __tablename__ = 'excecao_horario'
+
+    id = db.Column(db.Integer, primary_key=True)
+    barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id'), nullable=False, index=True)
+    profissional_id = db.Column(db.Integer, db.ForeignKey('profissional.id'), nullable=True)  # None = loja toda
+    data = db.Column(db.Date, nullable=False)
+    fechado = db.Column(db.Boolean, nullable=False, default=True)
+    abertura = db.Column(db.String(5), nullable=True)    # Só quando não está fechado. Ex: "10:00"
+    fechamento = db.Column(db.String(5), nullable=True)  # Ex: "16:00"
+    motivo = db.Column(db.String(100), nullable=True)    # Ex: "Feriado", "Folga"
+
+class AgendamentoRemovido(db.Model):
+    """Lápide de agendamento apagado, para o feed incremental do calendário (?since=)."""
+    __tablename__ = 'agendamento_removido'
+    __table_args__ = (
+        db.Index('ix_agendamento_removido_loja_data', 'barbearia_id', 'removido_em'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id', ondelete='CASCADE'), nullable=False)
+    agendamento_id = db.Column(db.Integer, nullable=False)
+    removido_em = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class InventarioNoite(db.Model):
+    """
+    Quarto × noite ocupados de uma pousada (noite sem linha = livre), mantido na mesma
+    transação da reserva (ver app/services/inventario_quartos.py).
+    """
+    __tablename__ = 'inventario_noite'
+    __table_args__ = (
+        db.UniqueConstraint('profissional_id', 'data', 'agendamento_id', name='uq_inventario_noite_quarto_data_reserva'),
+        db.Index('ix_inventario_noite_loja_data', 'barbearia_id', 'data'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id', ondelete='CASCADE'), nullable=False)
+    profissional_id = db.Column(db.Integer, db.ForeignKey('profissional.id', ondelete='CASCADE'), nullable=False)  # o quarto
+    agendamento_id = db.Column(db.Integer, db.ForeignKey('agendamento.id', ondelete='CASCADE'), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='reservado')  # 'pre_reserva' (IA) ou 'reservado'
 
 # ====================================
 # SISTEMA DE ASSINATURAS (ATUALIZADO)
@@ -259,15 +365,70 @@ class AgendamentoGoogleSync(db.Model):
     # Relacionamento (Opcional, ajuda na consulta)
     agendamento = db.relationship('Agendamento', backref=db.backref('google_syncs', lazy=True))
     
+def _caracteres_da_mensagem(contexto):
+    return len(contexto.get_current_parameters().get('mensagem') or '')
+
+
+def _tokens_da_mensagem(contexto):
+    # A IA cobra por "Token". Média da Indústria: 1 Token ≈ 4 Caracteres (Português/Inglês)
+    return (_caracteres_da_mensagem(contexto) + 3) // 4
+
+
 class ChatLog(db.Model):
+    # No PostgreSQL a tabela é particionada por mês de data_hora (migração 3c8e5a1f7d42:
+    # chave primária (id, data_hora), partições chat_logs_AAAA_MM + chat_logs_padrao). No
+    # SQLite é uma tabela comum. Partições e retenção: app/services/chatlog_particoes.py
     __tablename__ = 'chat_logs'
+    __table_args__ = (
+        # Histórico de um contato e lista de contatos do monitor
+        db.Index('ix_chat_logs_loja_tel_data', 'barbearia_id', 'cliente_telefone', 'data_hora'),
+        # Auditoria de custo do superadmin (mês corrente por tipo)
+        db.Index('ix_chat_logs_data_tipo', 'data_hora', 'tipo'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id'))
     cliente_telefone = db.Column(db.String(30)) # Quem está falando
     mensagem = db.Column(db.Text)               # O que foi dito
     tipo = db.Column(db.String(10))             # 'cliente' ou 'ia'
-    data_hora = db.Column(db.DateTime, default=datetime.now)
+    data_hora = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    # Gravados junto com a linha (inclusive em INSERT em lote) para a contabilidade de custo
+    char_count = db.Column(db.Integer, default=_caracteres_da_mensagem)
+    token_count = db.Column(db.Integer, default=_tokens_da_mensagem)
 
     # Relacionamento opcional se quiser filtrar por loja
     barbearia = db.relationship('Barbearia', backref='chats')
+
+class Cliente(db.Model):
+    """Cliente da loja pelo telefone normalizado (nome vindo dos agendamentos)."""
+    __tablename__ = 'cliente'
+    __table_args__ = (
+        db.UniqueConstraint('barbearia_id', 'telefone', name='uq_cliente_loja_telefone'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id', ondelete='CASCADE'), nullable=False)
+    telefone = db.Column(db.String(20), nullable=False)  # chave normalizada (ver app/services/conversas.py)
+    nome = db.Column(db.String(100), nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class Conversa(db.Model):
+    """
+    Uma linha por contato que conversou com a loja (lista lateral do monitor), atualizada
+    junto com cada lote de ChatLog gravado (ver app/services/conversas.py).
+    """
+    __tablename__ = 'conversa'
+    __table_args__ = (
+        db.UniqueConstraint('barbearia_id', 'telefone', name='uq_conversa_loja_telefone'),
+        # Lista do monitor: conversas da loja da mais recente para a mais antiga
+        db.Index('ix_conversa_loja_ultima', 'barbearia_id', 'ultima_mensagem_em', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    barbearia_id = db.Column(db.Integer, db.ForeignKey('barbearia.id', ondelete='CASCADE'), nullable=False)
+    telefone = db.Column(db.String(20), nullable=False)           # chave normalizada (junta com Cliente)
+    cliente_telefone = db.Column(db.String(30), nullable=False)   # como está no ChatLog (histórico)
+    ultima_mensagem_em = db.Column(db.DateTime, nullable=False)
+    ultima_previa = db.Column(db.String(120), nullable=True)
+    ultimo_tipo = db.Column(db.String(10), nullable=True)         # 'cliente' ou 'ia'
+    nao_lidas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
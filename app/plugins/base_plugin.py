@@ -29,6 +29,18 @@ class BaseBusinessPlugin(ABC):
         """
         pass
 
+    def calcular_disponibilidade_lote(self, dias: List[datetime], recursos: List[Any], **kwargs) -> Dict[Any, List[Any]]:
+        """
+        Disponibilidade de vários recursos em vários dias: {(recurso_id, date): [...]}.
+        Padrão: uma chamada de calcular_disponibilidade por par; plugins podem
+        sobrescrever para buscar tudo de uma vez.
+        """
+        return {
+            (recurso.id, dia.date()): self.calcular_disponibilidade(dia, profissional_id=recurso, **kwargs)
+            for dia in dias
+            for recurso in recursos
+        }
+
     @abstractmethod
     def buscar_recursos(self) -> List[Any]:
         """
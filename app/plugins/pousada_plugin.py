@@ -7,8 +7,9 @@ import pytz
 from flask import url_for
 
 from app.plugins.base_plugin import BaseBusinessPlugin
-from app.models.tables import Profissional, Agendamento, Servico, ChatLog
+from app.models.tables import Profissional, Servico, ChatLog
 from app.extensions import db, cache
+from app.services import reserva_service
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 # Configuração de Log
@@ -107,23 +108,10 @@ LISTA DE QUARTOS (Copie exatamente estes nomes):
         checkin_desejado = data_ref.replace(hour=12, minute=0, second=0)
         checkout_desejado = (checkin_desejado + timedelta(days=dias_estadia)).replace(hour=16, minute=0, second=0)
 
-        # Busca conflitos (reservas existentes que batem com as datas)
-        reservas = Agendamento.query.filter(
-            Agendamento.barbearia_id == self.business.id,
-            Agendamento.profissional_id == quarto_id,
-            Agendamento.data_hora >= datetime.now(tz) - timedelta(days=30)
-        ).all()
-
-        for reserva in reservas:
-            inicio_existente = reserva.data_hora
-            if inicio_existente.tzinfo is None: inicio_existente = tz.localize(inicio_existente)
-            
-            duracao = reserva.servico.duracao if reserva.servico else 1440
-            fim_existente = inicio_existente + timedelta(minutes=duracao)
-            
-            # Se as datas se cruzam
-            if checkin_desejado < fim_existente and checkout_desejado > inicio_existente:
-                return [] # Ocupado
+        # Busca conflitos (reservas existentes que batem com as datas) direto no SQL,
+        # pelo fim gravado em cada reserva
+        if reserva_service.ocupado(quarto_id, checkin_desejado.replace(tzinfo=None), checkout_desejado.replace(tzinfo=None)):
+            return [] # Ocupado
 
         return [checkin_desejado] # Livre
 
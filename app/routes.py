@@ -9,7 +9,7 @@ import urllib.parse
 import pytz
 from werkzeug.utils import secure_filename
 from datetime import datetime, date, time, timedelta
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, abort, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, abort, jsonify, Response, stream_with_context
 from sqlalchemy.orm import joinedload
 from app.models.tables import ChatLog, db # Certifique-se que db está importado também
 from sqlalchemy import func
@@ -67,10 +67,19 @@ except ImportError:
     logging.warning("⚠️ Biblioteca 'mercadopago' não instalada.")
 
 from app.services import ai_service  
+from app.services import fila_service
+from app.services import transporte_http
+from app.services import ocupacao
+from app.services import reserva_service
+from app.services import inventario_quartos
+from app.services import calendario_feed
+from app.services import diretorio_lojas
+from app.services import conversas
+from app.services import monitor_eventos
 from app.services.audio_service import AudioService
 
 # Importação da função unificada de cálculo de horários
-from app.utils import calcular_horarios_disponiveis
+from app.utils import calcular_horarios_disponiveis, calcular_matriz_disponibilidade
 from app.commands import reset_database_logic
 
 # Importações do flask_login
@@ -159,7 +168,7 @@ def enviar_mensagem_whatsapp_meta(destinatario: str, mensagem: str, barbearia: B
         "text": {"body": mensagem}
     }
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = transporte_http.post('meta', url, headers=headers, json=payload)
         response.raise_for_status()
         return True
     except requests.exceptions.RequestException as e:
@@ -196,7 +205,7 @@ def enviar_midia_whatsapp_meta(destinatario: str, url_arquivo: str, barbearia: B
         "image": {"link": url_arquivo}
     }
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = transporte_http.post('meta', url, headers=headers, json=payload)
         if response.status_code == 200:
             logging.info(f"✅ Mídia enviada com sucesso para {destinatario} via Meta")
             return True
@@ -228,7 +237,7 @@ def enviar_midia_whatsapp_meta(destinatario: str, url_arquivo: str, barbearia: B
         "image": {"link": url_arquivo}
     }
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = transporte_http.post('meta', url, headers=headers, json=payload)
         if response.status_code == 200:
             logging.info(f"✅ Mídia enviada com sucesso para {destinatario}")
             return True
@@ -257,7 +266,7 @@ def marcar_como_lido(message_id: str, barbearia: Barbearia):
         "message_id": message_id
     }
     try:
-        requests.post(url, headers=headers, json=payload)
+        transporte_http.post('meta', url, headers=headers, json=payload)
     except Exception:
         pass
 
@@ -283,7 +292,7 @@ def processar_audio_background(audio_id, wa_id, access_token, phone_number_id, b
                     "type": "text",
                     "text": {"body": resposta_texto}
                 }
-                requests.post(url, headers=headers, json=payload)
+                transporte_http.post('meta', url, headers=headers, json=payload)
                 logging.info(f"✅ 🧵 Resposta do áudio enviada com sucesso para {wa_id}")
                 
         except Exception as e:
@@ -347,6 +356,9 @@ def logout():
 
 # --- FUNÇÕES DO PAINEL WEB ---
 
+# Dias (a partir da data escolhida) calculados de uma vez no painel de disponibilidade da agenda
+DIAS_PAINEL_DISPONIBILIDADE = 7
+
 def _range_do_dia(dia_dt: datetime):
     inicio = datetime.combine(dia_dt.date(), time.min)
     fim = inicio + timedelta(days=1)
@@ -386,29 +398,9 @@ def agenda():
                 raise ValueError("Serviço inválido.")
             
             novo_inicio = datetime.strptime(data_hora_str, '%Y-%m-%dT%H:%M').replace(tzinfo=None)
-            novo_fim = novo_inicio + timedelta(minutes=servico.duracao)
-            
-            inicio_dia, fim_dia = _range_do_dia(novo_inicio)
-            ags = (
-                Agendamento.query
-                .options(joinedload(Agendamento.servico))
-                .filter(
-                    Agendamento.barbearia_id == barbearia_id_logada,
-                    Agendamento.profissional_id == profissional.id,
-                    Agendamento.data_hora >= inicio_dia,
-                    Agendamento.data_hora < fim_dia
-                )
-                .all()
-            )
+            conflito = ocupacao.conflita(barbearia_id_logada, profissional.id, novo_inicio, servico.duracao)
             
-            conflito = any(
-                max(novo_inicio, ag.data_hora) < min(novo_fim, ag.data_hora + timedelta(minutes=ag.servico.duracao))
-                for ag in ags
-            )
-            
-            if conflito:
-                flash('Erro: O profissional já está ocupado neste horário.', 'danger')
-            else:
+            if not conflito:
                 novo_agendamento = Agendamento(
                     nome_cliente=nome_cliente,
                     telefone_cliente=telefone_cliente,
@@ -417,11 +409,16 @@ def agenda():
                     servico_id=servico.id,
                     barbearia_id=barbearia_id_logada
                 )
-                db.session.add(novo_agendamento)
-                db.session.commit()
+                try:
+                    reserva_service.salvar(novo_agendamento)
+                except reserva_service.ConflitoHorario:
+                    conflito = True
 
+            if conflito:
+                flash('Erro: O profissional já está ocupado neste horário.', 'danger')
+            else:
                 # 1. Gerar o Link Mágico
-                novo_fim = novo_inicio + timedelta(minutes=servico.duracao)
+                novo_fim = novo_agendamento.data_hora_fim
                 link_agenda = gerar_link_google_calendar(
                     inicio=novo_inicio,
                     fim=novo_fim,
@@ -533,8 +530,15 @@ def agenda():
         profissional_sel = profissionais[0]
         profissional_sel_id = profissional_sel.id
     
+    # Disponibilidade da equipe inteira no dia e nos próximos 6 dias (uma consulta só)
+    dias_semana = [data_sel + timedelta(days=i) for i in range(DIAS_PAINEL_DISPONIBILIDADE)]
+    matriz = calcular_matriz_disponibilidade(current_user.barbearia, profissionais, dias_semana) if profissionais else {}
+    vagas_por_profissional = {p.id: len(matriz.get((p.id, data_sel.date()), [])) for p in profissionais}
+    proximos_dias = []
+
     if profissional_sel:
-        horarios_disponiveis_dt = calcular_horarios_disponiveis(profissional_sel, data_sel)
+        horarios_disponiveis_dt = matriz.get((profissional_sel.id, data_sel.date()), [])
+        proximos_dias = [(d, len(matriz.get((profissional_sel.id, d.date()), []))) for d in dias_semana[1:]]
     
     inicio_query, fim_query = _range_do_dia(data_sel)
     ags_dia = (
@@ -556,8 +560,11 @@ def agenda():
         profissionais=profissionais,
         servicos=servicos,
         horarios_disponiveis=horarios_disponiveis_dt,
+        vagas_por_profissional=vagas_por_profissional,
+        proximos_dias=proximos_dias,
         data_selecionada=data_sel,
-        profissional_selecionado=profissional_sel
+        profissional_selecionado=profissional_sel,
+        calendario_desde=datetime.now().isoformat(timespec='seconds')
     )
 
 @bp.route('/agendamento/excluir/<int:agendamento_id>', methods=['POST'])
@@ -603,12 +610,15 @@ def editar_agendamento(agendamento_id):
             ag.profissional_id = novo_profissional_id
             ag.servico_id = novo_servico_id
             
-            db.session.commit()
+            reserva_service.salvar(ag)
             flash('Agendamento atualizado com sucesso!', 'success')
             return redirect(url_for('main.agenda',
                                     data=ag.data_hora.strftime('%Y-%m-%d'),
                                     profissional_id=ag.profissional_id))
         
+        except reserva_service.ConflitoHorario:
+            flash('Erro: O profissional já está ocupado neste horário.', 'danger')
+            return redirect(url_for('main.editar_agendamento', agendamento_id=agendamento_id))
         except Exception as e:
             db.session.rollback()
             flash(f'Erro ao atualizar agendamento: {str(e)}', 'danger')
@@ -640,7 +650,7 @@ def webhook_twilio():
             return 'OK', 200
         
         barbearia_phone = sanitize_msisdn(to_number_raw)
-        barbearia = Barbearia.query.filter_by(telefone_whatsapp=barbearia_phone).first()
+        barbearia = diretorio_lojas.por_telefone(barbearia_phone)
         
         if not barbearia or barbearia.status_assinatura != 'ativa':
             return 'OK', 200
@@ -700,8 +710,8 @@ def webhook_meta():
                 
                 logging.info(f"📨 DEBUG META: Recebi ID '{phone_number_id}'")
                 
-                # Busca Barbearia com o ID limpo
-                barbearia = Barbearia.query.filter_by(meta_phone_number_id=phone_number_id).first()
+                # Loja pelo diretório em memória (sem consulta ao banco por mensagem)
+                barbearia = diretorio_lojas.por_phone_number_id(phone_number_id)
                 
                 if not barbearia:
                     logging.error(f"❌ ERRO CRÍTICO: ID '{phone_number_id}' não encontrado no banco!")
@@ -710,94 +720,31 @@ def webhook_meta():
                 logging.info(f"✅ Loja Encontrada: {barbearia.nome_fantasia} (ID: {barbearia.id})")
                 # -------------------------------------------------------------
 
-                # 🔥 CORREÇÃO DE ASSINATURA + DEBUG
-                status_str = str(barbearia.status_assinatura).lower()
-                data_validade = barbearia.assinatura_expira_em
-                agora = datetime.now()
-                
                 # Regra: Se está 'Ativa' (manual) OU se tem data futura, libera.
-                # O admin agora corrige a data ao salvar, então isso deve funcionar.
-                assinatura_ok = False
-                
-                if status_str in ['ativa', 'teste']:
-                    assinatura_ok = True
-                elif data_validade and data_validade > agora:
-                    assinatura_ok = True
-                
-                if not assinatura_ok:
-                    logging.warning(f"🚫 BLOQUEIO: Assinatura '{barbearia.nome_fantasia}' expirada. Status: {status_str}, Venceu: {data_validade}")
+                if not barbearia.assinatura_liberada():
+                    logging.warning(f"🚫 BLOQUEIO: Assinatura '{barbearia.nome_fantasia}' expirada. Status: {barbearia.status_assinatura}, Venceu: {barbearia.assinatura_expira_em}")
                     return jsonify({"status": "inactive"}), 200
 
                 remetente = message_data['from']
                 msg_type = message_data.get('type')
-                
-                # Marcar como lido
                 message_id = message_data.get('id')
-                if message_id:
-                    threading.Thread(target=marcar_como_lido, args=(message_id, barbearia)).start()
-                
-                logging.info(f"✅ Mensagem ({msg_type}) autorizada para IA.")
-                
-                # TEXTO
-                if msg_type == 'text':
-                    mensagem_recebida = message_data['text']['body']
-                    # TEXTO
-                if msg_type == 'text':
-                    mensagem_recebida = message_data['text']['body']
-                    
-                    # ✅ NOVO: ESPIÃO DO CLIENTE (SALVA O QUE ELE FALOU)
-                    try:
-                        log_cliente = ChatLog(
-                            barbearia_id=barbearia.id,
-                            cliente_telefone=remetente,
-                            mensagem=mensagem_recebida,
-                            tipo='cliente'
-                        )
-                        db.session.add(log_cliente)
-                        db.session.commit()
-                    except Exception as e:
-                        logging.error(f"Erro ao salvar log cliente: {e}")
-                    # ----------------------------------------------------
-
-                    resposta_ia = ai_service.processar_ia_gemini(
-                        user_message=mensagem_recebida,
-                        barbearia_id=barbearia.id,
-                        cliente_whatsapp=remetente
-                    )
-                    
-                    if resposta_ia:
-                        # ✅ NOVO: ESPIÃO DA IA (SALVA O QUE ELA RESPONDEU)
-                        try:
-                            log_ia = ChatLog(
-                                barbearia_id=barbearia.id,
-                                cliente_telefone=remetente,
-                                mensagem=resposta_ia,
-                                tipo='ia'
-                            )
-                            db.session.add(log_ia)
-                            db.session.commit()
-                        except Exception as e:
-                            logging.error(f"Erro ao salvar log IA: {e}")
-                        # ------------------------------------------------
 
-                        enviar_mensagem_whatsapp_meta(remetente, resposta_ia, barbearia)
-                
-                # ÁUDIO
-                elif msg_type == 'audio':
-                    audio_id = message_data['audio']['id']
-                    # Captura o app real para passar para a thread
-                    app_real = current_app._get_current_object()
-                    threading.Thread(
-                        target=processar_audio_background,
-                        args=(
-                            audio_id, 
-                            remetente, 
-                            barbearia.meta_access_token, 
-                            barbearia.meta_phone_number_id,
-                            barbearia.id,
-                            app_real
-                        )
-                    ).start()
+                if msg_type not in ('text', 'audio'):
+                    return jsonify({"status": "ignored_type"}), 200
+
+                # 📦 ENFILEIRA: IA + resposta rodam no worker (webhook responde em milissegundos)
+                from app.services.processamento_mensagens import chave_conversa
+                fila_service.enfileirar_conversa(
+                    chave_conversa(barbearia.id, remetente),
+                    'meta.mensagem',
+                    barbearia_id=barbearia.id,
+                    remetente=remetente,
+                    msg_type=msg_type,
+                    message_id=message_id,
+                    texto=message_data.get('text', {}).get('body') if msg_type == 'text' else None,
+                    audio_id=message_data.get('audio', {}).get('id') if msg_type == 'audio' else None
+                )
+                logging.info(f"✅ Mensagem ({msg_type}) autorizada e enfileirada para IA.")
 
                 return jsonify({"status": "success"}), 200
             
@@ -852,20 +799,15 @@ def webhook_waha():
     if session_id:
         import re
         match = re.search(r'loja[-_](\d+)', session_id)
-        if match:
-            barbearia_id = int(match.group(1))
+        loja = diretorio_lojas.por_sessao_waha(session_id, int(match.group(1)) if match else None)
+        if loja:
+            barbearia_id = loja.id
 
     # ==============================================================================
     # 🔗 CONEXÃO COM O REDIS
     # ==============================================================================
-    import redis
-    import os
-    redis_url = os.environ.get('REDIS_URL')
-    try:
-        cliente_redis = redis.from_url(redis_url) if redis_url else None
-    except Exception as e:
-        logging.error(f"Erro ao conectar no Redis: {e}")
-        cliente_redis = None
+    from app.extensions import obter_redis
+    cliente_redis = obter_redis()
 
     # Extração de campos essenciais do WAHA
     message_id = payload.get('id')
@@ -961,93 +903,25 @@ def webhook_waha():
         logging.info(f"🚫 Bloqueio Rápido: Ignorando Status/Grupo/Canal vindo de {from_number}")
         return jsonify({"status": "ignored_system_message"}), 200 
 
-    # ==============================================================================
-    # 🛑 4. ESCUDO ANTI-METRALHADORA (EVITA SAUDAÇÕES DUPLICADAS COM WEB_CONCURRENCY=4)
-    # ==============================================================================
-    if cliente_redis and barbearia_id and from_number:
-        import re
-        from_numero_limpo = re.sub(r'\D', '', str(from_number).split('@')[0])
-        lock_key = f"anti_spam_{barbearia_id}_{from_numero_limpo}"
-        try:
-            # Trava a porta por 3 segundos para mensagens simultâneas do mesmo cliente
-            if not cliente_redis.set(lock_key, "1", ex=3, nx=True):
-                logging.warning(f"⏳ Cliente {from_numero_limpo} enviou mensagens muito rápido. Aguardando (Anti-Metralhadora)...")
-                import time
-                time.sleep(3) # Aguarda 3s para o outro processo criar o histórico primeiro
-        except Exception as e:
-            logging.error(f"Erro no Redis Anti-Spam: {e}")
-
-    # ==============================================================================
-    # 🚀 CHAMADA DO PROTETOR ISOLADO (WAHA_UTILS)
-    # ==============================================================================
-    from app.services.waha_utils import extrair_e_filtrar_mensagem_waha
-    sucesso, resultado = extrair_e_filtrar_mensagem_waha(payload, session_id)
-    
-    if not sucesso:
-        return jsonify({"status": "ignorado", "motivo": resultado}), 200
-        
-    body = resultado
-    logging.info(f"📝 DEBUG WAHA: Texto lido com sucesso: '{body}'")
-
     if not barbearia_id:
         logging.error(f"❌ ERRO WAHA: Não foi possível extrair ID da sessão '{session_id}'")
         return jsonify({"status": "no_barbearia_id"}), 200
 
-    barbearia = Barbearia.query.get(barbearia_id)
-    if not barbearia:
-        logging.error(f"❌ ERRO WAHA: A loja ID {barbearia_id} não existe no banco!")
-        return jsonify({"status": "barbearia_not_found"}), 200
-
-    logging.info(f"✅ WAHA: Mensagem de {from_number} conectada à loja {barbearia.nome_fantasia}")
-
     # ==============================================================================
-    # 🤖 PROCESSAMENTO DA IA E LOGS
+    # 📦 4. ENFILEIRA NA CONVERSA: mensagens do mesmo cliente rodam em série e em ordem
+    # (substitui o antigo anti-metralhadora com time.sleep); extração de mídia, IA,
+    # logs e resposta rodam no worker
     # ==============================================================================
-    msg_type = payload.get('type', 'text')
-
-    if msg_type in ['chat', 'text', 'image', 'video', 'document']:
-        try:
-            log_cliente = ChatLog(
-                barbearia_id=barbearia.id,
-                cliente_telefone=from_number,
-                mensagem=body,
-                tipo='cliente'
-            )
-            db.session.add(log_cliente)
-            db.session.commit()
-        except Exception as e:
-            logging.error(f"Erro ao salvar log WAHA cliente: {e}")
-
-        from app.services import ai_service
-        resposta_ia = ai_service.processar_ia_gemini(
-            user_message=body,
-            barbearia_id=barbearia.id,
-            cliente_whatsapp=from_number,
-            waha_session_id=session_id
-        )
-
-        if resposta_ia:
-            try:
-                log_ia = ChatLog(
-                    barbearia_id=barbearia.id,
-                    cliente_telefone=from_number,
-                    mensagem=resposta_ia,
-                    tipo='ia'
-                )
-                db.session.add(log_ia)
-                db.session.commit()
-            except Exception as e:
-                logging.error(f"Erro ao salvar log WAHA IA: {e}")
-
-            from app.services.waha_service import enviar_mensagem_waha
-            enviar_mensagem_waha(session_id, from_number, resposta_ia)
-
-    elif msg_type == 'ptt' or msg_type == 'audio':
-        logging.info("🔊 Áudio recebido via WAHA (Ainda em implementação)")
-        from app.services.waha_service import enviar_mensagem_waha
-        enviar_mensagem_waha(session_id, from_number, "Desculpe, ainda estou aprendendo a ouvir áudios por este novo sistema! Poderia digitar? ✨")
+    from app.services.processamento_mensagens import chave_conversa
+    fila_service.enfileirar_conversa(
+        chave_conversa(barbearia_id, from_number),
+        'waha.mensagem',
+        session_id=session_id,
+        barbearia_id=barbearia_id,
+        payload=payload
+    )
 
-    return jsonify({"status": "success"}), 200
+    return jsonify({"status": "queued"}), 200
 
 # ============================================
 # ⚙️ ROTA DE CONFIGURAÇÕES (INTACTA)
@@ -1265,6 +1139,10 @@ def admin_editar_barbearia(barbearia_id):
 
         barbearia.meta_phone_number_id = request.form.get('meta_phone_number_id')
         barbearia.meta_access_token = request.form.get('meta_access_token')
+
+        # Orçamento de tokens do histórico da IA (vazio = padrão do sistema)
+        limite_tokens = request.form.get('limite_tokens_historico', '').strip()
+        barbearia.limite_tokens_historico = int(limite_tokens) if limite_tokens.isdigit() else None
         
         status_input = request.form.get('status_assinatura')
         if status_input:
@@ -1586,17 +1464,9 @@ def monitor_chat():
     # ⏱️ CONFIGURA O FUSO HORÁRIO
     sao_paulo_tz = pytz.timezone('America/Sao_Paulo')
 
-    # 1. PEGAR LISTA DE CONTATOS (Agrupados) e IGNORAR VAZIOS/FANTASMAS
-    subquery = db.session.query(
-        ChatLog.cliente_telefone,
-        func.max(ChatLog.data_hora).label('ultima_interacao')
-    ).filter(
-        ChatLog.barbearia_id == current_user.barbearia_id,
-        ChatLog.cliente_telefone != None,
-        ChatLog.cliente_telefone != ''
-    ).group_by(ChatLog.cliente_telefone)\
-     .order_by(func.max(ChatLog.data_hora).desc())\
-     .all()
+    # 1. LISTA DE CONTATOS: uma página do índice de conversas (já com o nome do cliente)
+    pagina = request.args.get('pagina', 1, type=int)
+    pagina_conversas, tem_mais = conversas.pagina_de_conversas(current_user.barbearia_id, pagina)
 
     lista_contatos = []
     
@@ -1611,27 +1481,22 @@ def monitor_chat():
             return f"+55 ({t[:2]}) {t[2:7]}-{t[7:]}"
         return f"+{t}" if t else ""
 
-    for item in subquery:
-        phone = item.cliente_telefone
+    # MÁGICA 2: Nome do cliente (Primeiro e o Último nome, capitalizados para ficar elegante)
+    def nome_exibicao(nome, telefone_formatado):
+        nome_parts = (nome or '').strip().split()
+        if not nome_parts:
+            return telefone_formatado
+        display_name = nome_parts[0].capitalize()
+        if len(nome_parts) > 1:
+            display_name += " " + nome_parts[-1].capitalize()
+        return display_name
+
+    for conversa, nome_cliente in pagina_conversas:
+        phone = conversa.cliente_telefone
         telefone_formatado = formatar_tel(phone)
-        display_name = telefone_formatado
-
-        # MÁGICA 2: Busca Inteligente de Nome (Pega só os últimos 8 dígitos para não falhar)
-        base_phone = phone[-8:] if len(phone) >= 8 else phone 
-        cliente_conhecido = Agendamento.query.filter(
-            Agendamento.barbearia_id == current_user.barbearia_id,
-            Agendamento.telefone_cliente.like(f"%{base_phone}%")
-        ).order_by(Agendamento.id.desc()).first()
-
-        if cliente_conhecido and cliente_conhecido.nome_cliente:
-            # Capitaliza o Primeiro e o Último nome para ficar elegante
-            nome_parts = cliente_conhecido.nome_cliente.strip().split()
-            display_name = nome_parts[0].capitalize()
-            if len(nome_parts) > 1:
-                display_name += " " + nome_parts[-1].capitalize()
 
         # Ajuste Fuso Horário da Lista Lateral
-        hora_br = item.ultima_interacao
+        hora_br = conversa.ultima_mensagem_em
         if hora_br:
             hora_utc = hora_br.replace(tzinfo=pytz.utc) if hora_br.tzinfo is None else hora_br
             hora_br = hora_utc.astimezone(sao_paulo_tz)
@@ -1639,47 +1504,97 @@ def monitor_chat():
         lista_contatos.append({
             'telefone': phone,
             'telefone_formatado': telefone_formatado, # Adicionado para o HTML
-            'nome_exibicao': display_name,
-            'hora': hora_br 
+            'nome_exibicao': nome_exibicao(nome_cliente, telefone_formatado),
+            'hora': hora_br,
+            'previa': conversa.ultima_previa,
+            'nao_lidas': conversa.nao_lidas
         })
 
     # 2. CARREGAR CONVERSA SELECIONADA
     telefone_selecionado = request.args.get('telefone')
     mensagens = []
+    tem_historico = False
     nome_selecionado = ""
 
     if telefone_selecionado:
         # Preenche nome e formata o topo do chat
-        for c in lista_contatos:
-            if c['telefone'] == telefone_selecionado:
-                nome_selecionado = c['nome_exibicao']
-                break
-        
-        if not nome_selecionado:
-            nome_selecionado = formatar_tel(telefone_selecionado)
-
-        # Busca APENAS as mensagens daquele telefone exato
-        mensagens_db = ChatLog.query.filter_by(
-            barbearia_id=current_user.barbearia_id,
-            cliente_telefone=telefone_selecionado
-        ).order_by(ChatLog.data_hora.asc()).all()
-
-        for msg in mensagens_db:
-            if msg.data_hora:
-                hora_utc = msg.data_hora.replace(tzinfo=pytz.utc) if msg.data_hora.tzinfo is None else msg.data_hora
-                msg.data_hora = hora_utc.astimezone(sao_paulo_tz)
-            mensagens.append(msg)
-
-    # Motor de Auto-Update Invisível
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return render_template('monitor_partial.html', msgs=mensagens)
+        nome_selecionado = nome_exibicao(
+            conversas.nome_do_cliente(current_user.barbearia_id, telefone_selecionado),
+            formatar_tel(telefone_selecionado)
+        )
+
+        # Abriu a conversa: zera as não lidas
+        conversas.marcar_lida(current_user.barbearia_id, telefone_selecionado)
+
+        # Só as 50 mensagens mais recentes daquele telefone exato (o resto vem por "Carregar anteriores")
+        mensagens, tem_historico = monitor_eventos.historico(current_user.barbearia_id, telefone_selecionado)
 
     return render_template(
         'monitor.html', 
         contatos=lista_contatos, 
         msgs=mensagens, 
         selecionado=telefone_selecionado,
-        nome_selecionado=nome_selecionado
+        nome_selecionado=nome_selecionado,
+        pagina=pagina,
+        tem_mais=tem_mais,
+        tem_historico=tem_historico,
+        # SSE: o fluxo só manda mensagens com id acima deste cursor
+        cursor=max((m['id'] for m in mensagens), default=0)
+    )
+
+
+# ============================================
+# 📡 MONITOR AO VIVO (SSE) E HISTÓRICO
+# ============================================
+@bp.route('/dashboard/monitor/eventos')
+@login_required
+def monitor_eventos_sse():
+    barbearia_id = current_user.barbearia_id
+    if not barbearia_id:
+        abort(403)
+
+    telefone = request.args.get('telefone') or None
+    # Na reconexão o navegador manda o id do último evento recebido
+    cursor = request.headers.get('Last-Event-ID', type=int) or request.args.get('cursor', 0, type=int)
+
+    def renderizar(msgs):
+        return render_template('monitor_partial.html', msgs=msgs)
+
+    resposta = Response(
+        stream_with_context(monitor_eventos.fluxo(barbearia_id, telefone, cursor, renderizar)),
+        mimetype='text/event-stream'
+    )
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'  # Nginx/Render: não segurar o fluxo no buffer
+    return resposta
+
+
+@bp.route('/dashboard/monitor/historico')
+@login_required
+def monitor_historico():
+    """Mensagens anteriores ao cursor (antes_data, antes_id), para rolar a conversa para trás."""
+    if not current_user.barbearia_id:
+        abort(403)
+    telefone = request.args.get('telefone')
+    if not telefone:
+        return jsonify(error="telefone obrigatório"), 400
+
+    antes = None
+    antes_data = request.args.get('antes_data')
+    antes_id = request.args.get('antes_id', type=int)
+    if antes_data and antes_id is not None:
+        try:
+            antes = (datetime.fromisoformat(antes_data), antes_id)
+        except ValueError:
+            return jsonify(error="antes_data inválida"), 400
+
+    mensagens, tem_mais = monitor_eventos.historico(current_user.barbearia_id, telefone, antes)
+    primeira = mensagens[0] if mensagens else None
+    return jsonify(
+        html=render_template('monitor_partial.html', msgs=mensagens),
+        tem_mais=tem_mais,
+        antes_data=primeira['gravada_em'].isoformat() if primeira else None,
+        antes_id=primeira['id'] if primeira else None
     )
 
 # ============================================
@@ -1725,17 +1640,13 @@ def admin_painel_novo():
     # A IA cobra por "Token". 
     # Média da Indústria: 1 Token ≈ 4 Caracteres (Português/Inglês)
     
-    # Soma caracteres que o CLIENTE enviou (Input - Mais barato)
-    chars_input = db.session.query(func.sum(func.length(ChatLog.mensagem)))\
-        .filter(ChatLog.data_hora >= inicio_mes, ChatLog.tipo == 'cliente').scalar() or 0
+    # token_count é gravado em cada linha; no PostgreSQL o filtro do mês só lê a partição do mês
+    tokens_por_tipo = dict(db.session.query(ChatLog.tipo, func.sum(ChatLog.token_count))
+        .filter(ChatLog.data_hora >= inicio_mes).group_by(ChatLog.tipo).all())
     
-    # Soma caracteres que a IA respondeu (Output - Mais caro)
-    chars_output = db.session.query(func.sum(func.length(ChatLog.mensagem)))\
-        .filter(ChatLog.data_hora >= inicio_mes, ChatLog.tipo == 'ia').scalar() or 0
-    
-    # Conversão para Tokens
-    tokens_input = int(chars_input / 4)
-    tokens_output = int(chars_output / 4)
+    # Input (o que o CLIENTE enviou, mais barato) e Output (o que a IA respondeu, mais caro)
+    tokens_input = int(tokens_por_tipo.get('cliente') or 0)
+    tokens_output = int(tokens_por_tipo.get('ia') or 0)
     total_tokens = tokens_input + tokens_output
     
     # 4. Faturamento (MRR)
@@ -1796,6 +1707,21 @@ def admin_painel_novo():
         barbearias=barbearias
     )
 
+# ==============================================================================
+# 📈 MÉTRICAS INTERNAS (FILAS / WORKERS) - SÓ SUPER ADMIN
+# ==============================================================================
+@bp.route('/admin/metricas')
+@login_required
+def admin_metricas():
+    if getattr(current_user, 'role', 'admin') != 'super_admin':
+        abort(403)
+
+    from app.services import metricas
+    dados = metricas.instantaneo()
+    dados['filas'] = fila_service.metricas_filas(current_app)
+    dados['pools_http'] = transporte_http.metricas_pools()
+    return jsonify(dados), 200
+
 @bp.route('/admin/planos', methods=['GET', 'POST'])
 @login_required
 def admin_planos():
@@ -1856,7 +1782,7 @@ def redirect_gcal(agendamento_id):
         # 2. MONTAGEM DO LINK
         fmt = '%Y%m%dT%H%M%S'
         inicio = ag.data_hora
-        fim = inicio + timedelta(minutes=ag.servico.duracao)
+        fim = ag.fim
         datas = f"{inicio.strftime(fmt)}/{fim.strftime(fmt)}"
         
         base_url = "https://www.google.com/calendar/render?action=TEMPLATE"
@@ -1904,43 +1830,74 @@ from flask import jsonify
 @bp.route('/api/reservas_calendario')
 @login_required
 def api_reservas_calendario():
+    """
+    Reservas da janela visível do calendário (start/end do FullCalendar), com ETag e em
+    streaming. Com ?since=<instante ISO> devolve só o que mudou (eventos + ids removidos).
+    """
     if not current_user.barbearia_id:
         return jsonify([])
-    
-    agendamentos = Agendamento.query.filter_by(barbearia_id=current_user.barbearia_id).all()
+    barbearia_id = current_user.barbearia_id
+    agora = datetime.now()
+
+    since = request.args.get('since')
+    if since:
+        try:
+            desde = datetime.fromisoformat(since[:19])
+        except ValueError:
+            return jsonify({'erro': 'since inválido'}), 400
+        if not calendario_feed.delta_valido(desde):
+            return jsonify({'recarregar': True, 'ate': agora.isoformat(timespec='seconds')})
+        versao = calendario_feed.etag(barbearia_id, desde=desde)
+        corpo = lambda: calendario_feed.delta_json(barbearia_id, desde, agora)
+    else:
+        # O FullCalendar manda start/end da tela (ex: 2030-03-01T00:00:00-03:00)
+        try:
+            inicio = datetime.fromisoformat(request.args.get('start', '')[:19])
+            fim = datetime.fromisoformat(request.args.get('end', '')[:19])
+        except ValueError:
+            inicio = datetime.combine(date.today().replace(day=1), time.min)
+            fim = inicio + timedelta(days=42)
+        versao = calendario_feed.etag(barbearia_id, inicio, fim)
+        corpo = lambda: calendario_feed.janela_json(barbearia_id, inicio, fim)
+
+    if request.if_none_match.contains(versao):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(stream_with_context(corpo()), mimetype='application/json')
+    resposta.set_etag(versao)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+@bp.route('/api/ocupacao_quartos')
+@login_required
+def api_ocupacao_quartos():
+    """Ocupação por noite (inventário da pousada) como eventos de fundo do calendário."""
+    if not current_user.barbearia_id:
+        return jsonify([])
+
+    # O FullCalendar manda start/end da tela (ex: 2030-03-01T00:00:00-03:00)
+    try:
+        inicio = date.fromisoformat(request.args.get('start', '')[:10])
+        fim = date.fromisoformat(request.args.get('end', '')[:10])
+    except ValueError:
+        inicio = date.today().replace(day=1)
+        fim = inicio + timedelta(days=42)
+
+    total_quartos = Profissional.query.filter_by(barbearia_id=current_user.barbearia_id, tipo='quarto').count()
+    if not total_quartos:
+        return jsonify([])
+
     eventos = []
-    
-    # Paleta de cores premium para diferenciar os quartos
-    cores = ['#0ea5e9', '#8b5cf6', '#f59e0b', '#10b981', '#f43f5e', '#6366f1', '#14b8a6', '#f97316']
-    
-    for ag in agendamentos:
-        duracao = ag.servico.duracao if ag.servico else 1440
-        fim = ag.data_hora + timedelta(minutes=duracao)
-        
-        # Lógica inteligente: Se for menos de 12h (720 min) ou tiver 'day' no nome, é Day Use.
-        is_day_use = duracao <= 720 or (ag.servico and 'day' in ag.servico.nome.lower())
-        icone = '☀️' if is_day_use else '🛏️'
-        tipo_texto = 'Day Use' if is_day_use else 'Diária'
-        
-        # Cada quarto ganha uma cor fixa baseada no ID dele
-        cor_quarto = cores[ag.profissional_id % len(cores)]
-        
+    for dia, estados in sorted(inventario_quartos.mapa_ocupacao(current_user.barbearia_id, inicio, fim).items()):
+        ocupados = sum(estados.values())
+        lotado = ocupados >= total_quartos
         eventos.append({
-            'id': ag.id,
-            'title': f"{icone} {ag.nome_cliente}",
-            'start': ag.data_hora.strftime('%Y-%m-%dT%H:%M:%S'),
-            'end': fim.strftime('%Y-%m-%dT%H:%M:%S'),
-            'color': cor_quarto, # Envia a cor para o calendário
-            'extendedProps': {
-                'quarto_id': str(ag.profissional_id),
-                'quarto_nome': ag.profissional.nome,
-                'telefone': ag.telefone_cliente,
-                'tipo': tipo_texto,
-                'checkin': ag.data_hora.strftime('%d/%m às %H:%M'),
-                'checkout': fim.strftime('%d/%m às %H:%M')
-            }
+            'start': dia.isoformat(),
+            'allDay': True,
+            'display': 'background',
+            'title': f"{ocupados}/{total_quartos} ocupados" + (f" ({estados['pre_reserva']} pré)" if estados.get('pre_reserva') else ''),
+            'color': '#f43f5e' if lotado else '#0ea5e9'
         })
-        
     return jsonify(eventos)
 
 # ==============================================================================
@@ -2034,7 +1991,7 @@ def conectar_numero():
         
         logging.info(f"🔄 Iniciando a sessão e injetando webhook: {start_endpoint}")
         try:
-            resp_start = requests.post(start_endpoint, json=payload_start, headers=headers, timeout=15)
+            resp_start = transporte_http.post('waha', start_endpoint, json=payload_start, headers=headers, timeout=15)
             logging.info(f"👉 Resposta START: {resp_start.status_code} - {resp_start.text}")
         except requests.exceptions.RequestException as e:
             logging.error(f"⚠️ Erro de Rede ao iniciar: {e}")
@@ -2051,7 +2008,7 @@ def conectar_numero():
         payload = {"phoneNumber": telefone_limpo}
 
         logging.info(f"👉 Pedindo código à Meta. Endpoint: {endpoint}")
-        response = requests.post(endpoint, json=payload, headers=headers, timeout=20)
+        response = transporte_http.post('waha', endpoint, json=payload, headers=headers, timeout=20)
         logging.info(f"👉 Resposta Código: {response.status_code} - {response.text}")
         
         if response.status_code in [200, 201]:
@@ -2084,7 +2041,7 @@ def desconectar_waha():
         endpoint_logout = f"{WAHA_URL}/api/sessions/{session_id}/logout"
         
         logging.info(f"🧹 Solicitando limpeza da sessão: {endpoint_logout}")
-        resposta = requests.post(endpoint_logout, headers=headers, timeout=15)
+        resposta = transporte_http.post('waha', endpoint_logout, headers=headers, timeout=15)
         
         if resposta.status_code in [200, 201]:
             return jsonify({"success": True, "message": "Sessão desconectada e limpa com sucesso!"})
@@ -17,16 +17,22 @@ from app.utils.plugin_loader import carregar_plugin_negocio
 from flask import url_for
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
-from google.api_core.exceptions import NotFound, ResourceExhausted
+from google.api_core.exceptions import NotFound, ResourceExhausted, PermissionDenied
 from google.generativeai.types import generation_types
 from datetime import datetime, timedelta
 from flask import current_app
 from sqlalchemy.orm import joinedload
 from datetime import time as dt_time
 from app.extensions import cache
+from app.services import historico_service
+from app.services import cache_modelos
+from app.services import cache_prefixo
+from app.services import ferramentas
+from app.services import ocupacao
+from app.services import reserva_service
 from google.generativeai.protos import Content
 from google.generativeai import protos
-from google.generativeai.types import FunctionDeclaration, Tool, GenerationConfig
+from google.generativeai.types import GenerationConfig
 import pytz
 
 BR_TZ = pytz.timezone('America/Sao_Paulo')
@@ -167,8 +173,8 @@ SYSTEM_INSTRUCTION_CLIENTE = """
 {header_persona}
 
 OBJETIVO: Agendamentos. Foco 100%.
-ID_CLIENTE: {cliente_whatsapp} | ID_LOJA: {barbearia_id}
-HOJE: {data_de_hoje} | AMANHÃ: {data_de_amanha}
+ID_LOJA: {barbearia_id}
+ID_CLIENTE, HOJE e AMANHÃ: estão na linha [CONTEXTO] no início de cada mensagem do cliente.
 
 🚨 REGRA DO PROFISSIONAL (IMPORTANTE):
 {regra_profissional_dinamica}
@@ -259,7 +265,7 @@ REGRAS GERAIS:
 3.1. IMPORTANTE: Se for listar ou perguntar sobre profissionais, VOCÊ DEVE CHAMAR A FERRAMENTA `listar_profissionais` ANTES de responder. Não deixe a lista vazia.
 4. Pergunte tudo que falta de uma vez
 IMPORTANTE: Ao verificar horários, SE O CLIENTE JÁ FALOU O NOME DO SERVIÇO, envie o parametro 'servico_nome' na ferramenta para garantir a duração correta.
-5. Datas: Hoje={data_de_hoje}, Amanhã={data_de_amanha}. Use AAAA-MM-DD
+5. Datas: Hoje e Amanhã vêm na linha [CONTEXTO]. Use AAAA-MM-DD
 6. NUNCA mencione telefone
 7. Nome do cliente: perguntar antes de criar_agendamento
 8. Confirmação: Use quebras de linha e negrito para destacar os dados. Siga EXATAMENTE este formato visual:
@@ -286,7 +292,7 @@ VOCÊ É A SECRETÁRIA PESSOAL DO(A) DONO(A) DA LOJA.
 Quem está falando com você AGORA é o(a) PROPRIETÁRIO(A) (Boss).
 SEU OBJETIVO: Gerenciar a agenda e bloquear horários.
 
-HOJE: {data_de_hoje}
+HOJE: veja a linha [CONTEXTO] no início de cada mensagem.
 COMO AGIR (REGRA DE AÇÃO IMEDIATA):
 
 1. SE O CHEFE PEDIR "AGENDA", "RESUMO" OU "QUEM VEM HOJE":
@@ -459,6 +465,9 @@ def listar_servicos(barbearia_id: int) -> str:
         current_app.logger.error(f"Erro interno na ferramenta 'listar_servicos': {e}", exc_info=True)
         return f"Erro ao listar serviços: Ocorreu um erro interno."
 
+# Valores de profissional_nome que significam "sem preferência"
+PROFISSIONAL_QUALQUER = {'qualquer', 'qualquer um', 'qualquer uma', 'tanto faz', 'sem preferencia', 'sem preferência', 'todos'}
+
 def calcular_horarios_disponiveis(barbearia_id: int, profissional_nome: str, dia: str, servico_nome: str = None) -> str:
     try:
         with current_app.app_context():
@@ -472,16 +481,25 @@ def calcular_horarios_disponiveis(barbearia_id: int, profissional_nome: str, dia
 
             # 3. Busca Profissionais (Usando o Plugin)
             todos_profs = plugin.buscar_recursos() # Retorna profissionais ou quartos
-            # Extrai os nomes para o Fuzzy Match
-            lista_nomes = [p.nome for p in todos_profs]
-            
-            nome_correto = encontrar_melhor_match(profissional_nome, lista_nomes)
 
-            if not nome_correto:
-                return f"Profissional '{profissional_nome}' não encontrado."
+            # "Qualquer um": consulta a equipe inteira de uma vez
+            if str(profissional_nome or '').strip().lower() in PROFISSIONAL_QUALQUER:
+                profissionais_consulta = todos_profs
+                nome_correto = "qualquer profissional"
+            else:
+                # Extrai os nomes para o Fuzzy Match
+                lista_nomes = [p.nome for p in todos_profs]
 
-            # Pega o objeto profissional correto
-            profissional = next(p for p in todos_profs if p.nome == nome_correto)
+                nome_correto = encontrar_melhor_match(profissional_nome, lista_nomes)
+
+                if not nome_correto:
+                    return f"Profissional '{profissional_nome}' não encontrado."
+
+                # Pega o objeto profissional correto
+                profissionais_consulta = [next(p for p in todos_profs if p.nome == nome_correto)]
+
+            if not profissionais_consulta:
+                return "Nenhum profissional cadastrado para esta loja no momento."
 
             # 4. Tratamento de Data (Mantido)
             agora_br = datetime.now(BR_TZ)
@@ -510,13 +528,13 @@ def calcular_horarios_disponiveis(barbearia_id: int, profissional_nome: str, dia
                 msg_extra = " (Obs: Calculado com base em 60min)."
 
             # =========================================================
-            # 🔥 O GRANDE MOMENTO: CÁLCULO VIA PLUGIN
+            # 🔥 O GRANDE MOMENTO: CÁLCULO VIA PLUGIN (EM LOTE)
             # =========================================================
-            # O plugin sabe se tem que bloquear almoço, se é pousada, etc.
-            horarios = plugin.calcular_disponibilidade(
-                data_ref=dia_dt,
-                profissional_id=profissional.id, # Passamos o ID
-                duracao=duracao_calculo
+            # Dia pedido + 2 dias de sugestão, para todos os profissionais consultados,
+            # com uma única consulta de agendamentos.
+            dias_consulta = [dia_dt + timedelta(days=i) for i in range(3)]
+            matriz = plugin.calcular_disponibilidade_lote(
+                dias_consulta, profissionais_consulta, duracao=duracao_calculo
             )
 
             # =========================================================
@@ -524,56 +542,49 @@ def calcular_horarios_disponiveis(barbearia_id: int, profissional_nome: str, dia
             # =========================================================
             nome_loja = barbearia.nome_fantasia.lower()
             is_lash = any(x in nome_loja for x in ['lash', 'studio', 'cílios', 'sobrancelha', 'estética', 'beauty'])
-            
-            # Só aplica a regra se o cliente estiver pedindo para HOJE
-            if is_lash and dia_dt.date() == agora_br.date():
-                horarios_seguros = []
-                
-                for h in horarios:
-                    # CASO 1: Cliente chamou de MANHÃ (Antes das 12:00)
-                    if agora_br.hour < 12:
-                        # Só libera os horários da TARDE (A partir das 13:00)
-                        if h.hour >= 13:
-                            horarios_seguros.append(h)
-                            
-                    # CASO 2: Cliente chamou de TARDE (12:00 em diante)
+
+            def horarios_do_dia(profissional, dia_ref):
+                horarios = matriz.get((profissional.id, dia_ref.date()), [])
+
+                # Só aplica a regra se o cliente estiver pedindo para HOJE
+                if is_lash and dia_ref.date() == agora_br.date():
+                    # CASO 1: Cliente chamou de MANHÃ (Antes das 12:00): só libera a TARDE (a partir das 13:00)
+                    # CASO 2: Cliente chamou de TARDE (12:00 em diante): bloqueia tudo! A lista fica vazia.
+                    horarios = [h for h in horarios if h.hour >= 13] if agora_br.hour < 12 else []
+                return horarios
+
+            def formatar(horarios_por_prof, limite=None):
+                partes = []
+                for profissional, horarios in horarios_por_prof:
+                    lista_h = [h.strftime('%H:%M') for h in horarios[:limite]]
+                    if len(profissionais_consulta) > 1:
+                        partes.append(f"{profissional.nome}: {', '.join(lista_h)}")
                     else:
-                        # Bloqueia tudo! A lista fica vazia.
-                        pass 
-                
-                # Substitui os horários originais pelos horários blindados
-                horarios = horarios_seguros
-            # =========================================================
+                        partes.append(', '.join(lista_h))
+                return '; '.join(partes)
+
+            livres_dia = [(p, horarios_do_dia(p, dia_dt)) for p in profissionais_consulta]
+            livres_dia = [(p, h) for p, h in livres_dia if h]
 
             # Formatação da Resposta
-            if not horarios:
-                # 👇 IMPLEMENTAÇÃO DA BUSCA PROATIVA DE VAGAS 👇
+            if not livres_dia:
+                # 👇 BUSCA PROATIVA DE VAGAS NOS PRÓXIMOS 2 DIAS (JÁ CALCULADOS NA MATRIZ) 👇
                 sugestoes = []
-                # Procura nos próximos 2 dias
-                for i in range(1, 3):
-                    prox_dia = dia_dt + timedelta(days=i)
-                    
-                    # Chama o plugin novamente para o próximo dia
-                    h_prox = plugin.calcular_disponibilidade(
-                        data_ref=prox_dia,
-                        profissional_id=profissional.id,
-                        duracao=duracao_calculo
-                    )
-                    
-                    if h_prox:
+                for prox_dia in dias_consulta[1:]:
+                    livres_prox = [(p, horarios_do_dia(p, prox_dia)) for p in profissionais_consulta]
+                    livres_prox = [(p, h) for p, h in livres_prox if h]
+                    if livres_prox:
                         # Pega até 4 horários para não poluir
-                        lista_p = [h.strftime('%H:%M') for h in h_prox[:4]] 
-                        sugestoes.append(f"Dia {prox_dia.strftime('%d/%m')}: {', '.join(lista_p)}")
-                
+                        sugestoes.append(f"Dia {prox_dia.strftime('%d/%m')}: {formatar(livres_prox, 4)}")
+
                 msg_retorno = f"❌ Sem horários livres para {nome_correto} em {dia_dt.strftime('%d/%m')}."
                 
                 if sugestoes:
                     msg_retorno += f" Mas encontrei estas vagas próximas: {'; '.join(sugestoes)}."
                 
                 return msg_retorno
-                
-            lista_h = [h.strftime('%H:%M') for h in horarios]
-            return f"Horários livres para {nome_correto} em {dia_dt.strftime('%d/%m')}: {', '.join(lista_h)}{msg_extra}"
+
+            return f"Horários livres para {nome_correto} em {dia_dt.strftime('%d/%m')}: {formatar(livres_dia)}{msg_extra}"
 
     except Exception as e:
         current_app.logger.error(f"Erro Plugin Cálculo: {e}", exc_info=True)
@@ -671,26 +682,22 @@ def criar_agendamento(barbearia_id: int, nome_cliente: str, telefone_cliente: st
             servico = next(s for s in todos_servicos if s.nome == nome_serv_match)
 
             data_hora_dt = datetime.strptime(data_hora, '%Y-%m-%d %H:%M').replace(tzinfo=None)
-            novo_fim = data_hora_dt + timedelta(minutes=servico.duracao)
-            inicio_dia = data_hora_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-            fim_dia = inicio_dia + timedelta(days=1)
-
-            ags = (
-                Agendamento.query
-                .options(joinedload(Agendamento.servico))
-                .filter(
-                    Agendamento.barbearia_id == barbearia_id,
-                    Agendamento.profissional_id == profissional.id,
-                    Agendamento.data_hora >= inicio_dia,
-                    Agendamento.data_hora < fim_dia
+            conflito = ocupacao.conflita(barbearia_id, profissional.id, data_hora_dt, servico.duracao)
+
+            if not conflito:
+                novo_agendamento = Agendamento(
+                    nome_cliente=nome_cliente,
+                    telefone_cliente=telefone_cliente,
+                    data_hora=data_hora_dt,
+                    profissional_id=profissional.id,
+                    servico_id=servico.id,
+                    barbearia_id=barbearia_id
                 )
-                .all()
-            )
-
-            conflito = any(
-                max(data_hora_dt, ag.data_hora) < min(novo_fim, ag.data_hora + timedelta(minutes=ag.servico.duracao))
-                for ag in ags
-            )
+                try:
+                    # A garantia contra agendamento duplo é a gravação (outra conversa pode ter levado o horário)
+                    reserva_service.salvar(novo_agendamento)
+                except reserva_service.ConflitoHorario:
+                    conflito = True
 
             if conflito:
                 try:
@@ -700,18 +707,6 @@ def criar_agendamento(barbearia_id: int, nome_cliente: str, telefone_cliente: st
 
                 return f"❌ Conflito! O horário {data_hora_dt.strftime('%H:%M')} não é suficiente para '{servico.nome}' ({servico.duracao} min) ou já está ocupado. {sugestao}"
 
-            novo_agendamento = Agendamento(
-                nome_cliente=nome_cliente,
-                telefone_cliente=telefone_cliente,
-                data_hora=data_hora_dt,
-                profissional_id=profissional.id,
-                servico_id=servico.id,
-                barbearia_id=barbearia_id
-            )
-
-            db.session.add(novo_agendamento)
-            db.session.commit()
-
           # =================================================================
             # 📢 NOTIFICAÇÃO 1: PARA O CLIENTE (LINK CURTO E DISCRETO 🤫)
             # =================================================================
@@ -888,28 +883,22 @@ def bloquear_agenda_dono(barbearia_id: int, data: str, hora_inicio: str, hora_fi
             bloqueios = 0
             
             while cursor < fim_dt:
-                ocupado = Agendamento.query.filter_by(
-                    barbearia_id=barbearia_id, 
-                    profissional_id=profissional.id, 
-                    data_hora=cursor
-                ).first()
-                
-                if not ocupado:
-                    bloqueio = Agendamento(
-                        nome_cliente=f"⛔ {motivo}",
-                        telefone_cliente="00000000000",
-                        data_hora=cursor,
-                        profissional_id=profissional.id,
-                        servico_id=servico.id,
-                        barbearia_id=barbearia_id
-                    )
-                    db.session.add(bloqueio)
+                bloqueio = Agendamento(
+                    nome_cliente=f"⛔ {motivo}",
+                    telefone_cliente="00000000000",
+                    data_hora=cursor,
+                    profissional_id=profissional.id,
+                    servico_id=servico.id,
+                    barbearia_id=barbearia_id
+                )
+                try:
+                    reserva_service.salvar(bloqueio)
                     bloqueios += 1
-                
+                except reserva_service.ConflitoHorario:
+                    pass  # já tem cliente (ou bloqueio) nesse horário
+
                 cursor += timedelta(minutes=intervalo)
             
-            db.session.commit()
-            
             # Formata resposta para confirmar a data exata usada
             data_formatada = data_dt.strftime('%d/%m/%Y')
             return f"SUCESSO: Agenda bloqueada dia {data_formatada} das {hora_inicio} às {hora_fim}. ({bloqueios} horários fechados)."
@@ -920,39 +909,49 @@ def bloquear_agenda_dono(barbearia_id: int, data: str, hora_inicio: str, hora_fi
         return f"Erro ao bloquear: {str(e)}"
         
 # =====================================================================
-# DEFINIÇÃO DAS TOOLS
+# DEFINIÇÃO DAS TOOLS (registro único: app/services/ferramentas.py)
 # =====================================================================
 
-listar_profissionais_func = FunctionDeclaration(
-    name="listar_profissionais",
-    description="Lista todos os profissionais disponíveis no sistema.",
-    parameters={"type": "object", "properties": {}, "required": []}
+ferramentas.registrar(
+    nome="listar_profissionais",
+    funcao=listar_profissionais,
+    descricao="Lista todos os profissionais disponíveis no sistema.",
+    parametros={"type": "object", "properties": {}, "required": []},
+    somente_leitura=True,
+    memoizar=300
 )
 
-listar_servicos_func = FunctionDeclaration(
-    name="listar_servicos",
-    description="Lista todos os serviços disponíveis, incluindo duração e preço.",
-    parameters={"type": "object", "properties": {}, "required": []}
+ferramentas.registrar(
+    nome="listar_servicos",
+    funcao=listar_servicos,
+    descricao="Lista todos os serviços disponíveis, incluindo duração e preço.",
+    parametros={"type": "object", "properties": {}, "required": []},
+    somente_leitura=True,
+    memoizar=300
 )
 
-calcular_horarios_disponiveis_func = FunctionDeclaration(
-    name="calcular_horarios_disponiveis",
-    description="Consulta horários disponíveis. TENTE SEMPRE INFORMAR O SERVIÇO ('servico_nome') se o cliente já tiver dito, para garantir que o tempo calculado seja suficiente.",
-    parameters={
+ferramentas.registrar(
+    nome="calcular_horarios_disponiveis",
+    funcao=calcular_horarios_disponiveis,
+    descricao="Consulta horários disponíveis. TENTE SEMPRE INFORMAR O SERVIÇO ('servico_nome') se o cliente já tiver dito, para garantir que o tempo calculado seja suficiente.",
+    parametros={
         "type": "object",
         "properties": {
-            "profissional_nome": {"type": "string", "description": "Nome exato do profissional"},
+            "profissional_nome": {"type": "string", "description": "Nome exato do profissional, ou 'qualquer' se o cliente não tiver preferência"},
             "dia": {"type": "string", "description": "Dia no formato YYYY-MM-DD, ou as palavras 'hoje' ou 'amanhã'"},
             "servico_nome": {"type": "string", "description": "Nome do serviço desejado (Opcional, mas RECOMENDADO para evitar conflitos de horário)"}
         },
         "required": ["profissional_nome", "dia"]
-    }
+    },
+    somente_leitura=True,
+    timeout=20
 )
 
-criar_agendamento_func = FunctionDeclaration(
-    name="criar_agendamento",
-    description="Cria um novo agendamento no sistema. O telefone do cliente é obtido automaticamente pelo sistema.",
-    parameters={
+ferramentas.registrar(
+    nome="criar_agendamento",
+    funcao=criar_agendamento,
+    descricao="Cria um novo agendamento no sistema. O telefone do cliente é obtido automaticamente pelo sistema.",
+    parametros={
         "type": "object",
         "properties": {
             "nome_cliente": {"type": "string", "description": "Nome do cliente (obtido na conversa)"},
@@ -961,38 +960,44 @@ criar_agendamento_func = FunctionDeclaration(
             "servico_nome": {"type": "string", "description": "Nome exato do serviço escolhido (confirmado pela ferramenta listar_servicos)"}
         },
         "required": ["nome_cliente", "data_hora", "profissional_nome", "servico_nome"]
-    }
+    },
+    injetar={'telefone_cliente': 'telefone'}
 )
 
-cancelar_agendamento_func = FunctionDeclaration(
-    name="cancelar_agendamento_por_telefone",
-    description="Cancela TODOS os agendamentos de um cliente para um dia específico. O telefone do cliente é obtido automaticamente pelo sistema.",
-    parameters={
+ferramentas.registrar(
+    nome="cancelar_agendamento_por_telefone",
+    funcao=cancelar_agendamento_por_telefone,
+    descricao="Cancela TODOS os agendamentos de um cliente para um dia específico. O telefone do cliente é obtido automaticamente pelo sistema.",
+    parametros={
         "type": "object",
         "properties": {
             "dia": {"type": "string", "description": "O dia dos agendamentos a cancelar, no formato YYYY-MM-DD, ou as palavras 'hoje' ou 'amanhã'."}
         },
         "required": ["dia"]
-    }
+    },
+    injetar={'telefone_cliente': 'telefone'}
 )
 
-consultar_agenda_func = FunctionDeclaration(
-    name="consultar_agenda_dono",
-    description="Exclusivo para o dono. Consulta os agendamentos e previsão financeira. Aceita 'semana'.",
-    parameters={
+ferramentas.registrar(
+    nome="consultar_agenda_dono",
+    funcao=consultar_agenda_dono,
+    descricao="Exclusivo para o dono. Consulta os agendamentos e previsão financeira. Aceita 'semana'.",
+    parametros={
         "type": "object",
         "properties": {
             "data_inicio": {"type": "string", "description": "Data inicial YYYY-MM-DD ou 'hoje'"},
             "data_fim": {"type": "string", "description": "Data final YYYY-MM-DD, 'mesmo_dia' (só hoje) ou 'semana' (7 dias)"}
         },
         "required": ["data_inicio", "data_fim"]
-    }
+    },
+    somente_leitura=True
 )
 
-bloquear_agenda_func = FunctionDeclaration(
-    name="bloquear_agenda_dono",
-    description="Bloqueia um período da agenda (ex: médico, folga). Use APENAS se o dono pedir para fechar/bloquear a agenda.",
-    parameters={
+ferramentas.registrar(
+    nome="bloquear_agenda_dono",
+    funcao=bloquear_agenda_dono,
+    descricao="Bloqueia um período da agenda (ex: médico, folga). Use APENAS se o dono pedir para fechar/bloquear a agenda.",
+    parametros={
         "type": "object",
         "properties": {
             "data": {"type": "string", "description": "YYYY-MM-DD"},
@@ -1007,10 +1012,11 @@ bloquear_agenda_func = FunctionDeclaration(
 # ============================================================
 # ✅ DECLARAÇÃO CORRETA DAS FERRAMENTAS DE HOTELARIA
 # ============================================================
-verificar_disponibilidade_hotel_func = FunctionDeclaration(
-    name="verificar_disponibilidade_hotel",
-    description="Consulta a disponibilidade de quartos livres para a quantidade de dias e pessoas.",
-    parameters={
+ferramentas.registrar(
+    nome="verificar_disponibilidade_hotel",
+    funcao=verificar_disponibilidade_hotel,
+    descricao="Consulta a disponibilidade de quartos livres para a quantidade de dias e pessoas.",
+    parametros={
         "type": "object",
         "properties": {
             "data_entrada_str": {"type": "string", "description": "Data de check-in no formato YYYY-MM-DD"},
@@ -1018,42 +1024,33 @@ verificar_disponibilidade_hotel_func = FunctionDeclaration(
             "qtd_pessoas": {"type": "number", "description": "Quantidade de pessoas na reserva"}
         },
         "required": ["data_entrada_str", "qtd_dias", "qtd_pessoas"]
-    }
+    },
+    somente_leitura=True
 )
 
-realizar_reserva_quarto_func = FunctionDeclaration(
-    name="realizar_reserva_quarto",
-    description="Realiza a pré-reserva de um quarto de hotel/pousada.",
-    parameters={
+ferramentas.registrar(
+    nome="realizar_reserva_quarto",
+    funcao=realizar_reserva_quarto,
+    descricao="Realiza a pré-reserva de um quarto (ou de vários quartos para um grupo) de hotel/pousada.",
+    parametros={
         "type": "object",
         "properties": {
             "nome_cliente": {"type": "string", "description": "Nome completo do cliente"},
-            "quarto_nome": {"type": "string", "description": "Nome exato do quarto, conforme retornado pela disponibilidade"},
+            "quarto_nome": {"type": "string", "description": "Nome exato do quarto (ou dos quartos separados por vírgula, para grupos), conforme retornado pela disponibilidade"},
             "data_entrada_str": {"type": "string", "description": "Data de check-in no formato YYYY-MM-DD"},
             "qtd_dias": {"type": "number", "description": "Quantidade de diárias desejadas (Ex: 1, 1.5, 2)"},
             "qtd_pessoas": {"type": "number", "description": "Quantidade de hóspedes na reserva"} # AQUI ESTÁ A MÁGICA
         },
         # Agora exigimos que a IA envie a qtd_pessoas obrigatoriamente
         "required": ["nome_cliente", "quarto_nome", "data_entrada_str", "qtd_dias", "qtd_pessoas"] 
-    }
+    },
+    injetar={'telefone': 'telefone'}
 )
 
 # ============================================================
-# ✅ LISTA CORRETA DE TOOLS (AGORA COM AS DECLARAÇÕES)
+# ✅ LISTA CORRETA DE TOOLS (GERADA PELO REGISTRO)
 # ============================================================
-tools = Tool(
-    function_declarations=[
-        listar_profissionais_func,
-        listar_servicos_func,
-        calcular_horarios_disponiveis_func,
-        criar_agendamento_func,
-        cancelar_agendamento_func,
-        consultar_agenda_func,
-        bloquear_agenda_func,
-        verificar_disponibilidade_hotel_func,
-        realizar_reserva_quarto_func
-    ]
-)
+tools = ferramentas.tool_gemini()
 
 # --- Inicialização do Modelo Gemini (OTIMIZADO PARA FLASH) ---
 
@@ -1094,75 +1091,67 @@ except NotFound as nf_error:
 except Exception as e:
     logging.error(f"ERRO CRÍTICO GERAL ao inicializar o modelo Gemini: {e}", exc_info=True)
 
-# --- FUNÇÕES HELPER DE SERIALIZAÇÃO ---
-
-def serialize_history(history: list[Content]) -> str:
+def _bloco_regras_loja(barbearia):
     """
-    Serializa o histórico de chat (lista de objetos Content) para uma string JSON.
-    Lida com texto, FunctionCall (protos) e FunctionResponse (protos).
+    Base de conhecimento da loja (regras_negocio do painel; na pousada sem regras, a regra fixa).
+    Fica no system prompt — prefixo fixo e cacheado —, não repetida a cada mensagem.
     """
-    serializable_list = []
+    regras_da_loja = getattr(barbearia, 'regras_negocio', None)
 
-    for content in history:
-        serial_parts = []
+    # 1. Tenta usar as regras que a dona da loja digitou no painel
+    if regras_da_loja and regras_da_loja.strip() != "":
+        return f"""
 
-        for part in content.parts:
-            part_dict = {}
-
-            if part.text:
-                part_dict['text'] = part.text
-
-            elif part.function_call:
-                part_dict['function_call'] = protos.FunctionCall.to_dict(part.function_call)
-
-            elif part.function_response:
-                part_dict['function_response'] = protos.FunctionResponse.to_dict(part.function_response)
-
-            if part_dict:
-                serial_parts.append(part_dict)
-
-        serializable_list.append({
-            'role': content.role,
-            'parts': serial_parts
-        })
-
-    return json.dumps(serializable_list)
-
-def deserialize_history(json_string: str) -> list[Content]:
-    """
-    Deserializa uma string JSON de volta para uma lista de objetos Content.
-    Recria texto, FunctionCall (protos) e FunctionResponse (protos).
-    """
-    history_list = []
-
-    if not json_string:
-        return history_list
-
-    try:
-        serializable_list = json.loads(json_string)
-
-    except json.JSONDecodeError:
-        logging.warning("Dados de cache de histórico inválidos ou corrompidos.")
-        return history_list
+[BASE DE CONHECIMENTO OBRIGATÓRIA DO ESTABELECIMENTO]
+Você é a Assistente Virtual de {barbearia.nome_fantasia}.
+INFRAESTRUTURA E REGRAS DO ESTABELECIMENTO (Responda com base nisto):
+{regras_da_loja}
+- Responda as dúvidas EXATAMENTE com esta Base de Conhecimento. Nunca invente informações. Se não souber, diga educadamente.
+"""
 
-    for item in serializable_list:
-        deserial_parts = []
+    # 2. PLANO B: Se o painel estiver vazio, usa a regra fixa da pousada para não deixar o cliente na mão
+    if barbearia.business_type == 'pousada':
+        return """
+
+[BASE DE CONHECIMENTO OBRIGATÓRIA DA POUSADA]
+Você é a Recepcionista Virtual da Pousada Recanto da Maré.
+INFRAESTRUTURA E REGRAS DA POUSADA:
+- REGRA DE OURO: NUNCA diga o número/nome do quarto para o cliente.
+- 1 Diária: Check-in 12h / Check-out 14h (dia seguinte).
+- 1.5 Diária: Check-in 10h / Check-out 17h (dia seguinte).
+- 2 Diárias: Check-in 12h / Check-out 17h (último dia).
+- Como descrever quartos: "Quarto com 2 beliches (4 pessoas)", "Casal com colchão de solteiro", "Suíte com Ar", "Suíte com Ventilador".
+- Wi-Fi: SIM, gratuito.
+- Voltagem: 220v.
+- Pet Friendly: SIM (Apenas porte médio).
+- Roupas de Cama/Banho: SIM, inclusas.
+- Ventilador e Smart TV: TODOS os quartos possuem.
+- Piscina / Cozinha / Refeições / Frigobar: NÃO TEMOS.
+- Estacionamento: NÃO TEMOS (carros ficam na rua).
+- Responda as dúvidas EXATAMENTE com esta Base de Conhecimento. Não invente.
+"""
 
-        for part_data in item.get('parts', []):
-            if 'text' in part_data:
-                deserial_parts.append(protos.Part(text=part_data['text']))
+    return ""
 
-            elif 'function_call' in part_data:
-                fc = protos.FunctionCall(part_data['function_call'])
-                deserial_parts.append(protos.Part(function_call=fc))
 
-            elif 'function_response' in part_data:
-                fr = protos.FunctionResponse(part_data['function_response'])
-                deserial_parts.append(protos.Part(function_response=fr))
+# 👇 O safety_settings do chat fica alinhado com o current_model
+SAFETY_SETTINGS_CHAT = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
 
-        history_list.append(Content(role=item.get('role'), parts=deserial_parts))
 
-    return history_list
+def _criar_modelo_chat(system_prompt):
+    """Fábrica do GenerativeModel do chat (usada pelo cache_modelos só quando falta no LRU)."""
+    return genai.GenerativeModel(
+        model_name=model_name_to_use,
+        tools=[tools],
+        generation_config=generation_config,
+        safety_settings=SAFETY_SETTINGS_CHAT,
+        system_instruction=system_prompt
+    )
 
 # --- FUNÇÃO PRINCIPAL DE PROCESSAMENTO ---
 
@@ -1187,7 +1176,7 @@ def processar_ia_gemini(user_message: str, barbearia_id: int, cliente_whatsapp:
     comandos_reset = ['reset', 'reiniciar', 'começar de novo', 'limpar', 'resetar']
     if user_message and str(user_message).lower().strip() in comandos_reset:
         try:
-            cache.delete(cache_key)
+            historico_service.apagar(cache_key)
             logging.info(f"🧹 Histórico resetado manualmente para {cliente_whatsapp}")
             return "Conexão reiniciada! 🔄 Como posso ajudar você agora?"
         except Exception as e:
@@ -1203,11 +1192,16 @@ def processar_ia_gemini(user_message: str, barbearia_id: int, cliente_whatsapp:
 
         logging.info(f"Carregando histórico do cache para a chave: {cache_key}")
 
-        serialized_history = cache.get(cache_key)
-        history_to_load = deserialize_history(serialized_history)
+        history_to_load = historico_service.carregar(cache_key)
+        # Conversa longa: janela de turnos recentes + resumo, dentro do orçamento de tokens da loja
+        history_to_load = historico_service.compactar_se_preciso(
+            cache_key, history_to_load, getattr(barbearia, 'limite_tokens_historico', None)
+        )
+        # Quantos turnos já estão gravados: ao salvar, só os turnos novos são anexados
+        qtd_turnos_salvos = len(history_to_load)
 
-        if serialized_history:
-            logging.info(f"✅ Histórico recuperado do Redis. Tamanho: {len(serialized_history)} chars")
+        if history_to_load:
+            logging.info(f"✅ Histórico recuperado do Redis. Turnos: {qtd_turnos_salvos}")
         else:
             logging.warning("⚠️ Redis vazio - nova sessão iniciada")
 
@@ -1224,22 +1218,24 @@ def processar_ia_gemini(user_message: str, barbearia_id: int, cliente_whatsapp:
 
         if eh_o_dono:
             logging.info(f"👑 MODO SECRETÁRIA ATIVADO para {cliente_whatsapp}")
+            modo_prompt = 'secretaria'
 
-            system_prompt = SYSTEM_INSTRUCTION_SECRETARIA.format(
-                data_de_hoje=agora_br.strftime('%d/%m/%Y')
-            )
+            def montar_prompt():
+                return SYSTEM_INSTRUCTION_SECRETARIA
 
         # 👇 [NOVO] VERIFICAÇÃO DE POUSADA (ANTES DE CAIR NO PADRÃO) 👇
         elif barbearia.business_type == 'pousada':
             logging.info(f"🏨 MODO POUSADA ATIVADO para {cliente_whatsapp}")
+            modo_prompt = 'pousada'
+
+            def montar_prompt():
+                # Carrega o Plugin da Pousada
+                plugin = carregar_plugin_negocio(barbearia)
             
-            # Carrega o Plugin da Pousada
-            plugin = carregar_plugin_negocio(barbearia)
-            
-            # Pega o Prompt especializado (Quartos, Check-in, Regras)
-            base_prompt = plugin.gerar_system_prompt()
+                # Pega o Prompt especializado (Quartos, Check-in, Regras)
+                base_prompt = plugin.gerar_system_prompt()
             
-            regras_pousada_dona = """
+                regras_pousada_dona = """
 🚨 REGRAS OBRIGATÓRIAS DE ATENDIMENTO (SIGA À RISCA):
 1. NUNCA INFORME O NÚMERO OU NOME DO QUARTO (ex: "Quarto 1", "Quarto 2") para o cliente. É estritamente PROIBIDO.
 2. Quando houver disponibilidade, diga apenas que "temos disponibilidade" e informe o VALOR TOTAL.
@@ -1254,25 +1250,28 @@ def processar_ia_gemini(user_message: str, barbearia_id: int, cliente_whatsapp:
    - 2 Diárias: Entrada a partir das 12h e Saída às 17h do último dia.
 """
             
-            # Adiciona o contexto temporal que a IA precisa
-            system_prompt = f"{base_prompt}\n\n{regras_pousada_dona}\n\nHOJE: {data_hoje_str} | AMANHÃ: {data_amanha_str}\nID_CLIENTE: {cliente_whatsapp}"
+                # Datas e ID do cliente vão na linha [CONTEXTO] de cada mensagem (prompt fixo por loja)
+                return f"{base_prompt}\n\n{regras_pousada_dona}"
         else:
             # --- LÓGICA MULTI-TENANCY (BARBEARIA VS LASH) - MODO CLIENTE ---
 
-            nome_lower = barbearia.nome_fantasia.lower()
-            eh_lash = any(x in nome_lower for x in ['lash', 'cílios', 'sobrancelha', 'estética', 'beauty', 'studio'])
+            modo_prompt = 'cliente'
+
+            def montar_prompt():
+                nome_lower = barbearia.nome_fantasia.lower()
+                eh_lash = any(x in nome_lower for x in ['lash', 'cílios', 'sobrancelha', 'estética', 'beauty', 'studio'])
 
-            if eh_lash:
-                # 👇 AQUI ESTÁ O AJUSTE DE PERSONA (SEM 'QUERIDA') 👇
-                header_persona = f"""
+                if eh_lash:
+                    # 👇 AQUI ESTÁ O AJUSTE DE PERSONA (SEM 'QUERIDA') 👇
+                    header_persona = f"""
 PERSONA: Assistente Virtual do {barbearia.nome_fantasia} (Studio de Beleza/Lash).
 TOM: Educada, gentil e prática.
 - TRATAMENTO: Chame de "Amiga" ou pelo Nome. 🚫 NUNCA use "Querida" ou "Amor".
 - EMOJIS: Use com moderação (1 ou 2 por mensagem). Ex: ✨ 🦋
 - INÍCIO: Se não souber o nome, pergunte gentilmente logo no início.
 """
-            else:
-                header_persona = f"""
+                else:
+                    header_persona = f"""
 
 PERSONA: Assistente da {barbearia.nome_fantasia} (Barbearia).
 TOM: Brother, prático, gente boa. Use: 'Cara', 'Mano', 'Campeão'.
@@ -1280,14 +1279,14 @@ EMOJIS OBRIGATÓRIOS: ✂️ 💈 👊 🔥
 
 """
 
-            # 4. 🔥 LÓGICA DE PROFISSIONAL ÚNICO 🔥
+                # 4. 🔥 LÓGICA DE PROFISSIONAL ÚNICO 🔥
 
-            profs_db = Profissional.query.filter_by(barbearia_id=barbearia_id).all()
-            qtd_profs = len(profs_db)
+                profs_db = Profissional.query.filter_by(barbearia_id=barbearia_id).all()
+                qtd_profs = len(profs_db)
 
-            if qtd_profs == 1:
-                nome_unico = profs_db[0].nome
-                regra_profissional = f"""
+                if qtd_profs == 1:
+                    nome_unico = profs_db[0].nome
+                    regra_profissional = f"""
 
 ATENÇÃO: Só existe 1 profissional neste estabelecimento: {nome_unico}.
 NÃO pergunte 'com quem prefere fazer'.
@@ -1295,34 +1294,27 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
 
 """
 
-            else:
-                regra_profissional = "Pergunte ao cliente a preferência de profissional caso ele não diga."
+                else:
+                    regra_profissional = "Pergunte ao cliente a preferência de profissional caso ele não diga."
 
-            # 5. Monta o Prompt Final (CLIENTE)
+                # 5. Monta o Prompt Final (CLIENTE)
 
-            system_prompt = SYSTEM_INSTRUCTION_CLIENTE.format(
-                header_persona=header_persona,
-                cliente_whatsapp=cliente_whatsapp,
-                barbearia_id=barbearia_id,
-                data_de_hoje=data_hoje_str,
-                data_de_amanha=data_amanha_str,
-                regra_profissional_dinamica=regra_profissional
-            )
-            
-        # 👇 MUDANÇA AQUI: O safety_settings deve ficar alinhado com o current_model (FORA do else)
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-            
-        current_model = genai.GenerativeModel(
-            model_name=model_name_to_use,
-            tools=[tools],
-            generation_config=generation_config,
-            safety_settings=safety_settings,
-            system_instruction=system_prompt
+                return SYSTEM_INSTRUCTION_CLIENTE.format(
+                    header_persona=header_persona,
+                    barbearia_id=barbearia_id,
+                    regra_profissional_dinamica=regra_profissional
+                )
+
+        # Prompt e modelo ficam em cache por loja/modo; só são refeitos quando a config da loja muda
+        system_prompt = cache_modelos.obter_prompt(
+            barbearia_id, modo_prompt, lambda: montar_prompt() + _bloco_regras_loja(barbearia)
+        )
+        current_model = cache_modelos.obter_modelo(barbearia_id, modo_prompt, system_prompt, _criar_modelo_chat)
+
+        # Prefixo (system prompt + tools) registrado no provedor: cada mensagem só paga o histórico
+        modelo_prefixo = cache_prefixo.modelo_com_prefixo(
+            barbearia_id, modo_prompt, system_prompt, model_name_to_use, [tools],
+            generation_config, SAFETY_SETTINGS_CHAT
         )
 
         is_new_chat = not history_to_load
@@ -1413,9 +1405,8 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
                 Content(role='model', parts=[protos.Part(text=msg_boas_vindas)])
             ]
 
-            new_serialized_history = serialize_history(history_manual)
-            cache.set(cache_key, new_serialized_history)
-            logging.info(f"✅ Histórico inicial criado e salvo manualmente. Loop evitado. Tamanho: {len(new_serialized_history)} chars")
+            bytes_gravados = historico_service.reescrever(cache_key, history_manual)
+            logging.info(f"✅ Histórico inicial criado e salvo manualmente. Loop evitado. Tamanho: {bytes_gravados} bytes")
 
             return ""  # Retorna vazio para a rota principal não enviar nada duplicado
 
@@ -1423,7 +1414,14 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
         # FIM DO INTERCEPTADOR - Se não for new_chat, segue o fluxo normal abaixo
         # ==============================================================================
 
-        chat_session = current_model.start_chat(history=history_to_load)
+        # Com o prefixo cacheado, a cópia do system prompt no início do histórico não é reenviada
+        # (continua gravada no Redis: é devolvida na hora de salvar)
+        if modelo_prefixo is not None:
+            turnos_base, historico_enviado = historico_service.separar_base(history_to_load)
+            chat_session = modelo_prefixo.start_chat(history=historico_enviado)
+        else:
+            turnos_base = []
+            chat_session = current_model.start_chat(history=history_to_load)
 
         # =========================================================================
         # 👇 ATUALIZAÇÃO FINAL: ENVIO DE TABELA FORÇADO NO PRIMEIRO CONTATO 
@@ -1455,8 +1453,8 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
                     
                 history_to_load.append(Content(role='model', parts=[protos.Part(text=msg_texto)]))
                 
-                new_serialized_history = serialize_history(history_to_load)
-                cache.set(cache_key, new_serialized_history)
+                # (pode ter removido o último turno: regrava a conversa curta inteira)
+                historico_service.reescrever(cache_key, history_to_load)
                 logging.info(f"✅ Boas-vindas automáticas (FORÇADO) para: {user_message}")
 
                 # ENVIA A MENSAGEM E A FOTO
@@ -1484,53 +1482,19 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
         # 🩹 CURATIVO DE IDENTIDADE (O SUSSURRO DINÂMICO MULTI-LOJAS)
         # ======================================================================
                 
-        msg_para_enviar = f"[Hoje é {data_hoje_str}]\nCliente diz: {user_message}"
-
-        regras_da_loja = getattr(barbearia, 'regras_negocio', None)
-
-        # 1. Tenta usar as regras que a dona da loja digitou no painel
-        if regras_da_loja and regras_da_loja.strip() != "":
-            msg_para_enviar = f"""
-            [LEMBRETE DE SISTEMA - BASE DE CONHECIMENTO OBRIGATÓRIA]
-            Você é a Assistente Virtual de {barbearia.nome_fantasia}.
-            
-            INFRAESTRUTURA E REGRAS DO ESTABELECIMENTO (Responda com base nisto):
-            {regras_da_loja}
-            
-            [INSTRUÇÃO DE AÇÃO IMEDIATA]
-            - O cliente está falando com você agora. Responda a dúvida dele EXATAMENTE com a Base de Conhecimento acima. 
-            - Nunca invente informações. Se não souber, diga educadamente.
-            - Se ele quiser reservar/agendar, continue o fluxo usando as ferramentas.
-            
-            CLIENTE DIZ: {user_message}
-            """
-            
-        # 2. PLANO B: Se o painel estiver vazio, usa a regra fixa da pousada para não deixar o cliente na mão
-        elif barbearia.business_type == 'pousada':
-            msg_para_enviar = f"""
-            [LEMBRETE DE SISTEMA - BASE DE CONHECIMENTO OBRIGATÓRIA]
-            Você é a Recepcionista Virtual da Pousada Recanto da Maré.
-            
-            INFRAESTRUTURA E REGRAS DA POUSADA:
-            - REGRA DE OURO: NUNCA diga o número/nome do quarto para o cliente.
-            - 1 Diária: Check-in 12h / Check-out 14h (dia seguinte).
-            - 1.5 Diária: Check-in 10h / Check-out 17h (dia seguinte).
-            - 2 Diárias: Check-in 12h / Check-out 17h (último dia).
-            - Como descrever quartos: "Quarto com 2 beliches (4 pessoas)", "Casal com colchão de solteiro", "Suíte com Ar", "Suíte com Ventilador".
-            - Wi-Fi: SIM, gratuito.
-            - Voltagem: 220v.
-            - Pet Friendly: SIM (Apenas porte médio).
-            - Roupas de Cama/Banho: SIM, inclusas.
-            - Ventilador e Smart TV: TODOS os quartos possuem.
-            - Piscina / Cozinha / Refeições / Frigobar: NÃO TEMOS.
-            - Estacionamento: NÃO TEMOS (carros ficam na rua).
-            
-            [INSTRUÇÃO DE AÇÃO IMEDIATA]
-            - Responda a dúvida dele EXATAMENTE com a Base de Conhecimento acima. Não invente.
-            - Se ele quiser reservar, continue o fluxo usando as ferramentas.
-            
-            CLIENTE DIZ: {user_message}
-            """
+        # O que muda a cada mensagem (datas e cliente) vai aqui, não no system prompt (que fica em cache)
+        contexto_msg = f"[CONTEXTO] HOJE: {data_hoje_str} | AMANHÃ: {data_amanha_str} | ID_CLIENTE: {cliente_whatsapp}"
+
+        msg_para_enviar = f"{contexto_msg}\nCliente diz: {user_message}"
+
+        # A base de conhecimento da loja já está no system prompt (_bloco_regras_loja); aqui só o lembrete curto
+        if _bloco_regras_loja(barbearia):
+            msg_para_enviar = (
+                "[LEMBRETE DE SISTEMA] Responda EXATAMENTE com a BASE DE CONHECIMENTO OBRIGATÓRIA das suas instruções. "
+                "Se ele quiser reservar/agendar, continue o fluxo usando as ferramentas.\n"
+                f"{contexto_msg}\n"
+                f"CLIENTE DIZ: {user_message}"
+            )
 
         # --- TENTATIVA DE COMUNICAÇÃO ---
         travou = False
@@ -1538,7 +1502,18 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
         erro_malformed = False
 
         try:
-            response = chat_session.send_message(msg_para_enviar)
+            try:
+                response = chat_session.send_message(msg_para_enviar)
+            except (NotFound, PermissionDenied) as e:
+                if modelo_prefixo is None:
+                    raise
+                # Prefixo expirou/sumiu no provedor: descarta e repete uma vez com o prompt completo
+                logging.warning(f"⚠️ Prefixo cacheado inválido ({e}). Repetindo sem cache de prefixo.")
+                cache_prefixo.descartar(barbearia_id, modo_prompt, system_prompt)
+                modelo_prefixo, turnos_base = None, []
+                chat_session = current_model.start_chat(history=history_to_load)
+                response = chat_session.send_message(msg_para_enviar)
+            cache_prefixo.registrar_uso(response)
             
             # Verifica se a IA respondeu VAZIO (O problema do Output 0 - Bloqueio de Segurança)
             if not response.candidates or not response.candidates[0].content.parts:
@@ -1591,110 +1566,31 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
             # Adiciona a mensagem do usuário e a resposta de resgate ao histórico existente
             history_to_load.append(Content(role='user', parts=[protos.Part(text=user_message)]))
             history_to_load.append(Content(role='model', parts=[protos.Part(text=resposta_resgate)]))
-            new_serialized_history = serialize_history(history_to_load)
-            cache.set(cache_key, new_serialized_history)
+            historico_service.anexar(cache_key, history_to_load, qtd_turnos_salvos)
             logging.info(f"✅ Histórico atualizado com resgate para {cliente_whatsapp}")
 
             return resposta_resgate
 
         # --- SE NÃO TRAVOU, SEGUE O FLUXO NORMAL DA IA ---
 
-        # Lógica de Ferramentas
-        while response.candidates[0].content.parts and response.candidates[0].content.parts[0].function_call:
-
-            function_call = response.candidates[0].content.parts[0].function_call
-            function_name = function_call.name
-            function_args = function_call.args
-            logging.info(f"IA solicitou a ferramenta '{function_name}' com os argumentos: {dict(function_args)}")
-
-            tool_map = {
-
-                "listar_profissionais": listar_profissionais,
-                "listar_servicos": listar_servicos,
-                "calcular_horarios_disponiveis": calcular_horarios_disponiveis,
-                "criar_agendamento": criar_agendamento,
-                "cancelar_agendamento_por_telefone": cancelar_agendamento_por_telefone,
-                "consultar_agenda_dono": consultar_agenda_dono,
-                "bloquear_agenda_dono": bloquear_agenda_dono,
-                "verificar_disponibilidade_hotel": verificar_disponibilidade_hotel,
-                "realizar_reserva_quarto": realizar_reserva_quarto
-
-            }
-
-            if function_name in tool_map:
-
-                function_to_call = tool_map[function_name]
-                kwargs = dict(function_args)
-                kwargs['barbearia_id'] = barbearia_id
-
-                if function_name in ['criar_agendamento', 'cancelar_agendamento_por_telefone']:
-                    kwargs['telefone_cliente'] = cliente_whatsapp
-                elif function_name == 'realizar_reserva_quarto':
-                    kwargs['telefone'] = cliente_whatsapp
-                    # Garante que as variáveis de quantidade cheguem como numéricos para evitar falhas de cast
-                    if 'qtd_pessoas' in kwargs:
-                         kwargs['qtd_pessoas'] = float(kwargs['qtd_pessoas'])
-                    if 'qtd_dias' in kwargs:
-                         kwargs['qtd_dias'] = float(kwargs['qtd_dias'])
-                elif function_name == 'verificar_disponibilidade_hotel':
-                    # Garante conversão segura antes de enviar para a ferramenta
-                    if 'qtd_pessoas' in kwargs:
-                         kwargs['qtd_pessoas'] = float(kwargs['qtd_pessoas'])
-                    if 'qtd_dias' in kwargs:
-                         kwargs['qtd_dias'] = float(kwargs['qtd_dias'])
-                        
-                tool_response = function_to_call(**kwargs)
-
-                # --- PROTEÇÃO NO RETORNO DA TOOL TAMBÉM ---
-
-                try:
-
-                    response = chat_session.send_message(
-
-                        protos.Part(
-
-                            function_response=protos.FunctionResponse(
-
-                                name=function_name,
-
-                                response={"result": tool_response}
-
-                            )
-
-                        )
-
-                    )
-
-                except generation_types.StopCandidateException:
+        # Lógica de Ferramentas (todas as chamadas da resposta de uma vez, um round-trip por rodada)
+        chamadas = ferramentas.chamadas_da_resposta(response)
+        while chamadas:
 
-                    logging.error("Erro Malformed Call no retorno da tool")
-                    return "Tive um probleminha técnico rápido ao confirmar. Tenta me pedir de novo? 🙏"
+            partes_resposta = ferramentas.executar(chamadas, barbearia_id, cliente_whatsapp)
 
-                # -------------------------------------------
-
-            else:
-
-                logging.error(f"Erro: IA tentou chamar uma ferramenta desconhecida: {function_name}")
-
-                response = chat_session.send_message(
-
-                    protos.Part(
-
-                        function_response=protos.FunctionResponse(
-
-                            name=function_name,
-
-                            response={"error": "Ferramenta não encontrada."}
-
-                        )
+            # --- PROTEÇÃO NO RETORNO DA TOOL TAMBÉM ---
+            try:
+                response = chat_session.send_message(partes_resposta)
+            except generation_types.StopCandidateException:
+                logging.error("Erro Malformed Call no retorno da tool")
+                return "Tive um probleminha técnico rápido ao confirmar. Tenta me pedir de novo? 🙏"
 
-                    )
-
-                )
+            chamadas = ferramentas.chamadas_da_resposta(response)
 
         # Salvar histórico no cache
         try:
-            cache.set(cache_key, serialize_history(chat_session.history))
+            historico_service.anexar(cache_key, turnos_base + list(chat_session.history), qtd_turnos_salvos)
         except Exception:
             pass
 
@@ -1752,54 +1648,12 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
                 # 1. Envia a "bronca" invisível para a IA corrigir seu próprio erro
                 response_retry = chat_session.send_message(instrucao_auto_cura)
                 
-                # 2. Se a IA decidir finalmente chamar a ferramenta após a bronca:
-                while response_retry.candidates[0].content.parts and response_retry.candidates[0].content.parts[0].function_call:
-                    function_call = response_retry.candidates[0].content.parts[0].function_call
-                    function_name = function_call.name
-                    function_args = function_call.args
-                    logging.info(f"🔄 AUTO-CURA: IA solicitou a ferramenta '{function_name}'")
-                    
-                    tool_map = {
-                        "listar_profissionais": listar_profissionais,
-                        "listar_servicos": listar_servicos,
-                        "calcular_horarios_disponiveis": calcular_horarios_disponiveis,
-                        "criar_agendamento": criar_agendamento,
-                        "cancelar_agendamento_por_telefone": cancelar_agendamento_por_telefone,
-                        "consultar_agenda_dono": consultar_agenda_dono,
-                        "bloquear_agenda_dono": bloquear_agenda_dono,
-                        "verificar_disponibilidade_hotel": verificar_disponibilidade_hotel,
-                        "realizar_reserva_quarto": realizar_reserva_quarto
-                    }
-
-                    if function_name in tool_map:
-                        function_to_call = tool_map[function_name]
-                        kwargs = dict(function_args)
-                        kwargs['barbearia_id'] = barbearia_id
-
-                        if function_name in ['criar_agendamento', 'cancelar_agendamento_por_telefone']:
-                            kwargs['telefone_cliente'] = cliente_whatsapp
-                        elif function_name == 'realizar_reserva_quarto':
-                            kwargs['telefone'] = cliente_whatsapp
-                            if 'qtd_pessoas' in kwargs: kwargs['qtd_pessoas'] = float(kwargs['qtd_pessoas'])
-                            if 'qtd_dias' in kwargs: kwargs['qtd_dias'] = float(kwargs['qtd_dias'])
-                        elif function_name == 'verificar_disponibilidade_hotel':
-                            if 'qtd_pessoas' in kwargs: kwargs['qtd_pessoas'] = float(kwargs['qtd_pessoas'])
-                            if 'qtd_dias' in kwargs: kwargs['qtd_dias'] = float(kwargs['qtd_dias'])
-
-                        tool_response = function_to_call(**kwargs)
-
-                        response_retry = chat_session.send_message(
-                            protos.Part(
-                                function_response=protos.FunctionResponse(
-                                    name=function_name,
-                                    response={"result": tool_response}
-                                )
-                            )
-                        )
-                    else:
-                        response_retry = chat_session.send_message(
-                            protos.Part(function_response=protos.FunctionResponse(name=function_name, response={"error": "Ferramenta não encontrada."}))
-                        )
+                # 2. Se a IA decidir finalmente chamar a(s) ferramenta(s) após a bronca:
+                chamadas = ferramentas.chamadas_da_resposta(response_retry)
+                while chamadas:
+                    partes_resposta = ferramentas.executar(chamadas, barbearia_id, cliente_whatsapp, origem="🔄 AUTO-CURA: IA")
+                    response_retry = chat_session.send_message(partes_resposta)
+                    chamadas = ferramentas.chamadas_da_resposta(response_retry)
 
                 # 3. Define o novo texto final gerado APÓS a autocura
                 if response_retry.candidates and response_retry.candidates[0].content.parts:
@@ -1846,7 +1700,7 @@ Se o cliente não especificar, ASSUMA IMEDIATAMENTE que é com {nome_unico} e pr
         # 3. 🛡️ SEGURANÇA FINAL: Se explodir tudo, reseta o cache para não travar na próxima
         logging.error(f"Erro GRANDE ao processar com IA: {e}", exc_info=True)
         try:
-            cache.delete(cache_key)
+            historico_service.apagar(cache_key)
         except:
             pass
         return "Tive um problema para processar sua solicitação. Vamos tentar de novo do começo. O que você gostaria?"
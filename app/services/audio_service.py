@@ -2,7 +2,7 @@
 # (CÓDIGO CORRIGIDO: USA A CHAVE 'GEMINI_API_KEY' CORRETA)
 
 import os
-import requests
+from app.services import transporte_http
 import tempfile
 import logging
 import google.generativeai as genai
@@ -14,12 +14,14 @@ import pytz
 
 # --- IMPORTAÇÕES ESSENCIAIS ---
 from app.extensions import cache, db
-from app.models.tables import Agendamento, Profissional, Servico, Barbearia
+from app.services import historico_service
+from app.services import cache_modelos
+from app.services import ferramentas
+from app.services import ai_service  # noqa: F401 (registra as ferramentas no registro único)
+from app.models.tables import Barbearia
 from google.generativeai.protos import Content, Part, FunctionCall, FunctionResponse
 from google.generativeai import protos
-from google.generativeai.types import FunctionDeclaration, Tool, GenerationConfig
-from thefuzz import process 
-from app.utils import calcular_horarios_disponiveis as calcular_horarios_disponiveis_util
+from google.generativeai.types import GenerationConfig
 
 # Configuração de Logger
 logging.basicConfig(level=logging.INFO)
@@ -50,73 +52,21 @@ FLUXO OBRIGATÓRIO:
 CANCELAMENTO: Use cancelar_agendamento_por_telefone(dia="AAAA-MM-DD")
 """
 
-# --- FERRAMENTAS ---
-
-def encontrar_melhor_match(termo, lista, cutoff=60):
-    if not termo or not lista: return None
-    melhor, score = process.extractOne(termo, lista)
-    return melhor if score >= cutoff else None
-
-def listar_profissionais(barbearia_id: int) -> str:
-    profs = Profissional.query.filter_by(barbearia_id=barbearia_id).all()
-    if not profs: return "Nenhum profissional."
-    return f"Profissionais: {', '.join([p.nome for p in profs])}."
-
-def listar_servicos(barbearia_id: int) -> str:
-    servs = Servico.query.filter_by(barbearia_id=barbearia_id).all()
-    if not servs: return "Nenhum serviço."
-    lista = [f"{s.nome} (R$ {s.preco})" for s in servs]
-    return f"Serviços: {'; '.join(lista)}."
-
-def calcular_horarios_disponiveis(barbearia_id: int, profissional_nome: str, dia: str) -> str:
-    profs = Profissional.query.filter_by(barbearia_id=barbearia_id).all()
-    match = encontrar_melhor_match(profissional_nome, [p.nome for p in profs])
-    if not match: return "Profissional não encontrado."
-    profissional = next(p for p in profs if p.nome == match)
-    
-    dia_dt = datetime.now(BR_TZ) if dia == 'hoje' else (datetime.now(BR_TZ) + timedelta(days=1) if dia == 'amanhã' else BR_TZ.localize(datetime.strptime(dia, '%Y-%m-%d')))
-    
-    horarios = calcular_horarios_disponiveis_util(profissional, dia_dt)
-    return f"Vagas para {match} em {dia_dt.strftime('%d/%m')}: {', '.join([h.strftime('%H:%M') for h in horarios])}."
-
-def criar_agendamento(barbearia_id: int, nome_cliente: str, telefone_cliente: str, data_hora: str, profissional_nome: str, servico_nome: str) -> str:
-    # Profissional
-    profs = Profissional.query.filter_by(barbearia_id=barbearia_id).all()
-    prof_match = encontrar_melhor_match(profissional_nome, [p.nome for p in profs])
-    if not prof_match: return "Profissional não encontrado."
-    profissional = next(p for p in profs if p.nome == prof_match)
-    
-    # Serviço
-    servs = Servico.query.filter_by(barbearia_id=barbearia_id).all()
-    serv_match = encontrar_melhor_match(servico_nome, [s.nome for s in servs])
-    if not serv_match: return f"Serviço não encontrado. Opções: {', '.join([s.nome for s in servs])}"
-    servico = next(s for s in servs if s.nome == serv_match)
-    
-    dt_obj = datetime.strptime(data_hora, '%Y-%m-%d %H:%M').replace(tzinfo=None)
-    
-    # Salvar
-    novo = Agendamento(nome_cliente=nome_cliente, telefone_cliente=telefone_cliente, data_hora=dt_obj, profissional_id=profissional.id, servico_id=servico.id, barbearia_id=barbearia_id)
-    db.session.add(novo)
-    db.session.commit()
-    return f"SUCESSO: Agendado {servico.nome} com {profissional.nome} dia {data_hora}."
-
-def cancelar_agendamento_por_telefone(barbearia_id: int, telefone_cliente: str, dia: str) -> str:
-    dt = datetime.strptime(dia, '%Y-%m-%d').date()
-    ags = Agendamento.query.filter(Agendamento.barbearia_id==barbearia_id, Agendamento.telefone_cliente==telefone_cliente, Agendamento.data_hora >= datetime.combine(dt, datetime.min.time())).all()
-    if not ags: return "Nada agendado."
-    for a in ags: db.session.delete(a)
-    db.session.commit()
-    return "Cancelado com sucesso."
-
-# Definição das Tools
-tools_list = Tool(function_declarations=[
-    FunctionDeclaration(name="listar_profissionais", description="Lista equipe", parameters={"type": "object", "properties": {}}),
-    FunctionDeclaration(name="listar_servicos", description="Lista serviços", parameters={"type": "object", "properties": {}}),
-    FunctionDeclaration(name="calcular_horarios_disponiveis", description="Vê vagas", parameters={"type": "object", "properties": {"profissional_nome": {"type": "string"}, "dia": {"type": "string"}}, "required": ["profissional_nome", "dia"]}),
-    FunctionDeclaration(name="criar_agendamento", description="Cria agendamento", parameters={"type": "object", "properties": {"nome_cliente": {"type": "string"}, "data_hora": {"type": "string"}, "profissional_nome": {"type": "string"}, "servico_nome": {"type": "string"}}, "required": ["nome_cliente", "data_hora", "profissional_nome", "servico_nome"]}),
-    FunctionDeclaration(name="cancelar_agendamento_por_telefone", description="Cancela", parameters={"type": "object", "properties": {"dia": {"type": "string"}}, "required": ["dia"]})
+# --- FERRAMENTAS (mesmo registro do chat de texto) ---
+tools_list = ferramentas.tool_gemini([
+    "listar_profissionais", "listar_servicos", "calcular_horarios_disponiveis",
+    "criar_agendamento", "cancelar_agendamento_por_telefone"
 ])
 
+
+def _criar_modelo_audio(_prompt):
+    # Modelo do áudio não tem system prompt: um único por processo (via cache_modelos)
+    return genai.GenerativeModel(
+        "gemini-2.5-flash",
+        tools=[tools_list],
+        generation_config=GenerationConfig(temperature=0.0)
+    )
+
 class AudioService:
     def __init__(self):
         # 🔥 CORREÇÃO AQUI: Usar 'GEMINI_API_KEY' que é a que existe no Render
@@ -153,7 +103,11 @@ class AudioService:
 
                 # 2. Recuperar Memória
                 barbearia = Barbearia.query.get(barbearia_id)
-                history = self._deserialize_history(cache.get(cache_key))
+                history = historico_service.carregar(cache_key)
+                history = historico_service.compactar_se_preciso(
+                    cache_key, history, getattr(barbearia, 'limite_tokens_historico', None)
+                )
+                qtd_turnos_salvos = len(history)
                 agora = datetime.now(BR_TZ)
                 
                 if not history:
@@ -164,11 +118,7 @@ class AudioService:
                     history = [Content(role='user', parts=[protos.Part(text=prompt)]), Content(role='model', parts=[protos.Part(text="Olá!")])]
 
                 # 3. Inicializar Modelo
-                model = genai.GenerativeModel(
-                    "gemini-2.5-flash", 
-                    tools=[tools_list], 
-                    generation_config=GenerationConfig(temperature=0.0)
-                )
+                model = cache_modelos.obter_modelo(None, 'audio', '', _criar_modelo_audio)
                 chat = model.start_chat(history=history)
                 
                 # 4. Enviar Áudio
@@ -177,31 +127,15 @@ class AudioService:
                     arquivo_remoto
                 ])
                 
-                # 5. Loop de Ferramentas
-                while response.candidates and response.candidates[0].content.parts and response.candidates[0].content.parts[0].function_call:
-                    fc = response.candidates[0].content.parts[0].function_call
-                    fname = fc.name
-                    fargs = dict(fc.args)
-                    logger.info(f"🎤 Áudio Tool Call: {fname} {fargs}")
-                    
-                    tool_map = {
-                        "listar_profissionais": listar_profissionais, "listar_servicos": listar_servicos,
-                        "calcular_horarios_disponiveis": calcular_horarios_disponiveis, "criar_agendamento": criar_agendamento,
-                        "cancelar_agendamento_por_telefone": cancelar_agendamento_por_telefone
-                    }
-                    
-                    if fname in tool_map:
-                        fargs['barbearia_id'] = barbearia_id
-                        if 'telefone_cliente' in fargs or fname in ['criar_agendamento', 'cancelar_agendamento_por_telefone']:
-                            fargs['telefone_cliente'] = wa_id
-                        
-                        res = tool_map[fname](**fargs)
-                        response = chat.send_message(protos.Part(function_response=protos.FunctionResponse(name=fname, response={"result": res})))
-                    else:
-                        response = chat.send_message(protos.Part(function_response=protos.FunctionResponse(name=fname, response={"error": "Tool not found"})))
-
+                # 5. Loop de Ferramentas (todas as chamadas da resposta de uma vez)
+                chamadas = ferramentas.chamadas_da_resposta(response)
+                while chamadas:
+                    partes_resposta = ferramentas.executar(chamadas, barbearia_id, wa_id, origem="🎤 Áudio")
+                    response = chat.send_message(partes_resposta)
+                    chamadas = ferramentas.chamadas_da_resposta(response)
+                
                 # 6. Salvar
-                cache.set(cache_key, self._serialize_history(chat.history))
+                historico_service.anexar(cache_key, chat.history, qtd_turnos_salvos)
                 
                 if response.candidates and response.candidates[0].content.parts:
                     return response.candidates[0].content.parts[0].text
@@ -217,34 +151,9 @@ class AudioService:
                     except: pass
 
     def _get_url(self, mid, token):
-        r = requests.get(f"https://graph.facebook.com/v19.0/{mid}", headers={"Authorization": f"Bearer {token}"})
+        r = transporte_http.get('meta', f"https://graph.facebook.com/v19.0/{mid}", headers={"Authorization": f"Bearer {token}"})
         r.raise_for_status(); return r.json()['url']
     
     def _get_binary(self, url, token):
-        r = requests.get(url, headers={"Authorization": f"Bearer {token}"})
+        r = transporte_http.get('midia', url, headers={"Authorization": f"Bearer {token}"})
         r.raise_for_status(); return r.content
-
-    def _serialize_history(self, hist):
-        res = []
-        for c in hist:
-            parts = []
-            for p in c.parts:
-                if p.text: parts.append({'text': p.text})
-                elif p.function_call: parts.append({'function_call': protos.FunctionCall.to_dict(p.function_call)})
-                elif p.function_response: parts.append({'function_response': protos.FunctionResponse.to_dict(p.function_response)})
-            res.append({'role': c.role, 'parts': parts})
-        return json.dumps(res)
-
-    def _deserialize_history(self, j):
-        if not j: return []
-        try:
-            h = []
-            for i in json.loads(j):
-                parts = []
-                for p in i.get('parts', []):
-                    if 'text' in p: parts.append(protos.Part(text=p['text']))
-                    elif 'function_call' in p: parts.append(protos.Part(function_call=protos.FunctionCall(p['function_call'])))
-                    elif 'function_response' in p: parts.append(protos.Part(function_response=protos.FunctionResponse(p['function_response'])))
-                h.append(Content(role=i['role'], parts=parts))
-            return h
-        except: return []
@@ -0,0 +1,194 @@
+# app/services/auditoria_consultas.py
+# Auditoria dos planos de execução das consultas quentes do app (`flask auditar-consultas`).
+# - Catálogo com as mesmas consultas que agenda, IA, webhooks, monitor e superadmin fazem
+# - Opcionalmente semeia uma massa sintética DENTRO de uma transação que é desfeita no fim
+#   (nada fica no banco)
+# - PostgreSQL: EXPLAIN (ANALYZE, FORMAT JSON) e conta as linhas lidas por cada Seq Scan
+# - SQLite: EXPLAIN QUERY PLAN; "SCAN tabela" sem índice conta a tabela inteira
+# Reprova qualquer consulta com varredura sequencial acima do limite de linhas.
+import random
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, insert, text
+
+from app.extensions import db
+from app.models.tables import Agendamento, Barbearia, ChatLog, Profissional, Servico
+from app.services import reserva_service
+
+LIMITE_LINHAS_PADRAO = 1000
+
+
+# ==============================================================================
+# 🌱 MASSA SINTÉTICA
+# ==============================================================================
+def semear(lojas=3, profissionais=4, agendamentos=4000, mensagens=20000, seed=42):
+    """Insere lojas, profissionais, serviços, agendamentos (sem sobreposição) e chats sintéticos."""
+    rng = random.Random(seed)
+    marca = datetime.now().strftime('%H%M%S')
+    ids = {'lojas': [], 'profissionais': [], 'telefones': []}
+    inicio = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0) - timedelta(days=180)
+
+    for n in range(lojas):
+        loja = Barbearia(
+            nome_fantasia=f'Auditoria {n}', telefone_whatsapp=f'aud{marca}{n}',
+            meta_phone_number_id=f'aud{marca}{n}' if n % 2 == 0 else None
+        )
+        db.session.add(loja)
+        db.session.flush()
+        servicos = [Servico(nome=f'Serviço {i}', duracao=30, preco=10, barbearia_id=loja.id) for i in range(8)]
+        profs = [Profissional(nome=f'Prof {i}', barbearia_id=loja.id) for i in range(profissionais)]
+        db.session.add_all(servicos + profs)
+        db.session.flush()
+        ids['lojas'].append(loja.id)
+        ids['profissionais'] += [(loja.id, p.id) for p in profs]
+
+        telefones = [f'55119{rng.randrange(10**7, 10**8)}' for _ in range(200)]
+        ids['telefones'] += [(loja.id, t) for t in telefones]
+
+        linhas = []
+        for p in profs:
+            for i in range(agendamentos // profissionais):
+                # Um horário de 30 min por slot, 16 slots por dia: nunca se sobrepõem
+                data_hora = inicio + timedelta(days=i // 16, minutes=30 * (i % 16))
+                linhas.append(dict(
+                    data_hora=data_hora, data_hora_fim=data_hora + timedelta(minutes=30), duracao_minutos=30,
+                    nome_cliente='Cliente', telefone_cliente=rng.choice(telefones),
+                    profissional_id=p.id, servico_id=rng.choice(servicos).id, barbearia_id=loja.id
+                ))
+        db.session.execute(insert(Agendamento), linhas)
+
+        db.session.execute(insert(ChatLog), [
+            dict(barbearia_id=loja.id, cliente_telefone=rng.choice(telefones), mensagem='oi',
+                 tipo=rng.choice(['cliente', 'ia']), data_hora=inicio + timedelta(minutes=rng.randrange(0, 365 * 24 * 60)))
+            for _ in range(mensagens)
+        ])
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('ANALYZE'))
+    return ids
+
+
+# ==============================================================================
+# 📚 CATÁLOGO (mesmo formato das consultas do app)
+# ==============================================================================
+def catalogo(ids=None):
+    """[(nome, statement)] com parâmetros reais tirados do banco (ou da massa semeada)."""
+    if ids and ids['profissionais']:
+        loja_id, prof_id = ids['profissionais'][0]
+        telefone = next(t for l, t in ids['telefones'] if l == loja_id)
+    else:
+        ag = Agendamento.query.order_by(Agendamento.id.desc()).first()
+        loja_id = ag.barbearia_id if ag else 1
+        prof_id = ag.profissional_id if ag else 1
+        telefone = ag.telefone_cliente if ag else '5511999999999'
+
+    hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    amanha = hoje + timedelta(days=1)
+    semana = hoje + timedelta(days=7)
+    inicio_mes = hoje.replace(day=1)
+
+    return [
+        ('agenda do dia (painel)', select(Agendamento).where(
+            Agendamento.barbearia_id == loja_id, Agendamento.profissional_id == prof_id,
+            Agendamento.data_hora >= hoje, Agendamento.data_hora < amanha
+        ).order_by(Agendamento.data_hora)),
+        ('ocupação do período (disponibilidade)', select(Agendamento).where(
+            Agendamento.barbearia_id == loja_id, Agendamento.profissional_id.in_([prof_id]),
+            Agendamento.data_hora >= hoje, Agendamento.data_hora < semana
+        )),
+        ('sobreposição na gravação', select(Agendamento.id).where(
+            Agendamento.profissional_id == prof_id,
+            Agendamento.data_hora < amanha,
+            reserva_service.fim_efetivo() > hoje
+        ).limit(1)),
+        ('agendamentos da loja no dia (dashboard)', select(func.count(Agendamento.id)).where(
+            Agendamento.barbearia_id == loja_id, Agendamento.data_hora >= hoje, Agendamento.data_hora < amanha
+        )),
+        ('cancelamento por telefone (IA)', select(Agendamento).where(
+            Agendamento.barbearia_id == loja_id, Agendamento.telefone_cliente == telefone,
+            Agendamento.data_hora >= hoje, Agendamento.data_hora < amanha
+        )),
+        ('histórico do contato (monitor)', select(ChatLog.id, ChatLog.tipo, ChatLog.mensagem, ChatLog.data_hora).where(
+            ChatLog.barbearia_id == loja_id, ChatLog.cliente_telefone == telefone
+        ).order_by(ChatLog.data_hora.desc(), ChatLog.id.desc()).limit(51)),
+        ('mensagens novas do contato (monitor ao vivo)', select(ChatLog.id, ChatLog.tipo, ChatLog.mensagem, ChatLog.data_hora).where(
+            ChatLog.barbearia_id == loja_id, ChatLog.cliente_telefone == telefone,
+            ChatLog.data_hora >= hoje, ChatLog.id > 0
+        ).order_by(ChatLog.id)),
+        ('lista de contatos (monitor)', select(
+            ChatLog.cliente_telefone, func.max(ChatLog.data_hora)
+        ).where(
+            ChatLog.barbearia_id == loja_id, ChatLog.cliente_telefone.isnot(None), ChatLog.cliente_telefone != ''
+        ).group_by(ChatLog.cliente_telefone)),
+        ('custo do mês por tipo (superadmin)', select(ChatLog.tipo, func.sum(ChatLog.token_count)).where(
+            ChatLog.data_hora >= inicio_mes
+        ).group_by(ChatLog.tipo)),
+        ('loja pelo phone_number_id (webhook Meta)', select(Barbearia).where(
+            Barbearia.meta_phone_number_id == 'inexistente'
+        )),
+        ('loja pelo telefone (webhook Twilio)', select(Barbearia).where(
+            Barbearia.telefone_whatsapp == 'inexistente'
+        )),
+        ('serviço por nome (IA)', select(Servico).where(
+            Servico.barbearia_id == loja_id, Servico.nome == 'Serviço 1'
+        )),
+        ('profissionais da loja', select(Profissional).where(
+            Profissional.barbearia_id == loja_id
+        ).order_by(Profissional.nome)),
+    ]
+
+
+# ==============================================================================
+# 🔬 PLANOS
+# ==============================================================================
+def _sql_e_parametros(statement, dialeto):
+    compilado = statement.compile(dialect=dialeto, compile_kwargs={'render_postcompile': True})
+    if compilado.positional:
+        return str(compilado), tuple(compilado.params[nome] for nome in compilado.positiontup)
+    return str(compilado), compilado.params
+
+
+def _seq_scans_postgres(no, achados):
+    if no.get('Node Type') == 'Seq Scan':
+        lidas = (no.get('Actual Rows', 0) + no.get('Rows Removed by Filter', 0)) * no.get('Actual Loops', 1)
+        achados.append((no.get('Relation Name'), int(lidas)))
+    for filho in no.get('Plans', []):
+        _seq_scans_postgres(filho, achados)
+    return achados
+
+
+def _seq_scans_sqlite(conexao, linhas_plano, tamanhos):
+    achados = []
+    for linha in linhas_plano:
+        detalhe = linha[-1]
+        partes = detalhe.split()
+        if partes[:1] == ['SCAN'] and 'INDEX' not in detalhe:
+            tabela = partes[1]
+            if tabela not in tamanhos:
+                tamanhos[tabela] = conexao.exec_driver_sql(f'SELECT COUNT(*) FROM "{tabela}"').scalar()
+            achados.append((tabela, tamanhos[tabela]))
+    return achados
+
+
+def auditar(limite_linhas=LIMITE_LINHAS_PADRAO, ids=None):
+    """Roda o plano de cada consulta do catálogo. Retorna [(nome, [(tabela, linhas)], reprovada)]."""
+    conexao = db.session.connection()
+    dialeto = conexao.dialect
+    tamanhos = {}
+    resultado = []
+
+    for nome, statement in catalogo(ids):
+        sql, parametros = _sql_e_parametros(statement, dialeto)
+        if dialeto.name == 'postgresql':
+            plano = conexao.exec_driver_sql(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', parametros).scalar()
+            varreduras = _seq_scans_postgres(plano[0]['Plan'], [])
+        elif dialeto.name == 'sqlite':
+            linhas = conexao.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parametros).all()
+            varreduras = _seq_scans_sqlite(conexao, linhas, tamanhos)
+        else:
+            logging.warning(f"Auditoria de planos não suportada para {dialeto.name}.")
+            return []
+        reprovada = any(linhas > limite_linhas for _, linhas in varreduras)
+        resultado.append((nome, varreduras, reprovada))
+    return resultado
@@ -0,0 +1,110 @@
+# app/services/cache_modelos.py
+# Cache (LRU, por processo) dos system prompts renderizados e dos GenerativeModel prontos.
+# - Prompt: chave (barbearia_id, modo, versão da config da loja)
+# - Modelo: chave (barbearia_id, modo, hash do prompt)
+# A versão da config é um token no cache compartilhado (Redis), trocado por listeners do
+# SQLAlchemy sempre que Barbearia, Profissional, Servico ou ExcecaoHorario da loja mudam — assim
+# todos os processos/workers deixam de usar o prompt (e o calendário compilado) antigo.
+import uuid
+import hashlib
+import logging
+import threading
+
+from cachetools import LRUCache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import cache
+from app.models.tables import Barbearia, Profissional, Servico, ExcecaoHorario
+from app.services import metricas
+
+MAX_PROMPTS = 256
+MAX_MODELOS = 128
+
+_lock = threading.Lock()
+_prompts = LRUCache(maxsize=MAX_PROMPTS)
+_modelos = LRUCache(maxsize=MAX_MODELOS)
+
+
+def _chave_versao(barbearia_id):
+    return f"cfg_versao_loja:{barbearia_id}"
+
+
+def versao_config(barbearia_id):
+    """Token da versão atual da configuração da loja ('0' se nunca mudou)."""
+    try:
+        return cache.get(_chave_versao(barbearia_id)) or '0'
+    except Exception as e:
+        logging.warning(f"Falha ao ler versão da config da loja {barbearia_id}: {e}")
+        return '0'
+
+
+def invalidar_config(barbearia_id):
+    """Troca a versão da loja: prompts e modelos antigos deixam de ser usados em todos os processos."""
+    try:
+        cache.set(_chave_versao(barbearia_id), uuid.uuid4().hex, timeout=0)
+        logging.info(f"♻️ Config da loja {barbearia_id} alterada: prompt/modelo da IA serão recriados.")
+    except Exception as e:
+        logging.warning(f"Falha ao invalidar config da loja {barbearia_id}: {e}")
+
+
+def hash_prompt(texto):
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:16]
+
+
+def obter_prompt(barbearia_id, modo, fabrica):
+    """Retorna o system prompt da loja/modo, renderizando com `fabrica()` só quando a config mudou."""
+    chave = (barbearia_id, modo, versao_config(barbearia_id))
+    with _lock:
+        prompt = _prompts.get(chave)
+    if prompt is not None:
+        metricas.incrementar('ia_prompt_cache', resultado='hit')
+        return prompt
+    metricas.incrementar('ia_prompt_cache', resultado='miss')
+    prompt = fabrica()
+    with _lock:
+        _prompts[chave] = prompt
+    return prompt
+
+
+def obter_modelo(barbearia_id, modo, system_prompt, fabrica):
+    """Retorna o GenerativeModel pronto para (loja, modo, prompt); cria com `fabrica(prompt)` se faltar."""
+    chave = (barbearia_id, modo, hash_prompt(system_prompt))
+    with _lock:
+        modelo = _modelos.get(chave)
+    if modelo is not None:
+        metricas.incrementar('ia_modelo_cache', resultado='hit')
+        return modelo
+    metricas.incrementar('ia_modelo_cache', resultado='miss')
+    modelo = fabrica(system_prompt)
+    with _lock:
+        _modelos[chave] = modelo
+    return modelo
+
+
+# ==============================================================================
+# 👂 LISTENERS: QUALQUER MUDANÇA NA LOJA, PROFISSIONAIS, SERVIÇOS OU EXCEÇÕES INVALIDA O CACHE
+# ==============================================================================
+def _marcar_loja_alterada(mapper, connection, target):
+    barbearia_id = target.id if isinstance(target, Barbearia) else getattr(target, 'barbearia_id', None)
+    sessao = Session.object_session(target)
+    if barbearia_id and sessao is not None:
+        sessao.info.setdefault('lojas_config_alterada', set()).add(barbearia_id)
+
+
+def _apos_commit(sessao):
+    alteradas = sessao.info.pop('lojas_config_alterada', None)
+    for barbearia_id in alteradas or ():
+        invalidar_config(barbearia_id)
+
+
+def _apos_rollback(sessao):
+    sessao.info.pop('lojas_config_alterada', None)
+
+
+for _modelo in (Barbearia, Profissional, Servico, ExcecaoHorario):
+    for _evento in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_modelo, _evento, _marcar_loja_alterada)
+
+event.listen(Session, 'after_commit', _apos_commit)
+event.listen(Session, 'after_rollback', _apos_rollback)
@@ -0,0 +1,200 @@
+# app/services/cache_prefixo.py
+# Cache do prefixo fixo do prompt (system prompt + tools) no provedor de IA.
+# O prefixo de cada loja/modo é registrado UMA vez (Gemini "cached content") e as
+# mensagens seguintes só mandam o histórico + a mensagem nova: menos tokens cobrados
+# e resposta mais rápida. Quando a config da loja muda, o hash do prompt muda e um
+# prefixo novo é registrado (o antigo expira sozinho pelo TTL).
+#
+# IA_CACHE_PREFIXO: 'gemini' (padrão), 'local' (fake em memória, p/ testes) ou 'desligado'.
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+import google.generativeai as genai
+from cachetools import LRUCache
+from flask import current_app, has_app_context
+
+from app.extensions import cache
+from app.services import metricas
+from app.services.cache_modelos import hash_prompt
+
+TTL_PADRAO = 3600
+# Abaixo disso o provedor recusa/ não compensa cachear (Gemini 2.5 Flash: 1024 tokens)
+MIN_TOKENS_PADRAO = 1024
+# Renova antes de expirar no provedor, para nunca usar um prefixo vencido
+MARGEM_RENOVACAO = 300
+
+
+# ==============================================================================
+# 🔌 PROVEDORES
+# ==============================================================================
+class ProvedorPrefixo(ABC):
+    """Interface: registra o prefixo e devolve modelos que o reutilizam."""
+
+    @abstractmethod
+    def criar(self, modelo, system_instruction, tools, ttl):
+        """Registra o prefixo e retorna o nome (id) dele no provedor."""
+        pass
+
+    @abstractmethod
+    def modelo(self, nome, generation_config, safety_settings):
+        """GenerativeModel (ou equivalente) que usa o prefixo `nome`."""
+        pass
+
+    @abstractmethod
+    def apagar(self, nome):
+        pass
+
+
+class ProvedorGemini(ProvedorPrefixo):
+    def criar(self, modelo, system_instruction, tools, ttl):
+        conteudo = genai.caching.CachedContent.create(
+            model=modelo,
+            display_name=f"prefixo-{hash_prompt(system_instruction)}",
+            system_instruction=system_instruction,
+            tools=tools,
+            ttl=ttl,
+        )
+        return conteudo.name
+
+    def modelo(self, nome, generation_config, safety_settings):
+        return genai.GenerativeModel.from_cached_content(
+            cached_content=nome,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+        )
+
+    def apagar(self, nome):
+        genai.caching.CachedContent.get(name=nome).delete()
+
+
+class ProvedorLocal(ProvedorPrefixo):
+    """Fake em memória (testes/dev): mesmo contrato, sem chamar a API de cache."""
+
+    def __init__(self):
+        self.registrados = {}
+
+    def criar(self, modelo, system_instruction, tools, ttl):
+        nome = f"local/{hash_prompt(system_instruction)}"
+        self.registrados[nome] = {'modelo': modelo, 'system_instruction': system_instruction, 'tools': tools}
+        return nome
+
+    def modelo(self, nome, generation_config, safety_settings):
+        dados = self.registrados[nome]
+        return genai.GenerativeModel(
+            model_name=dados['modelo'],
+            tools=dados['tools'],
+            system_instruction=dados['system_instruction'],
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+        )
+
+    def apagar(self, nome):
+        self.registrados.pop(nome, None)
+
+
+_PROVEDORES = {'gemini': ProvedorGemini, 'local': ProvedorLocal}
+_provedor = None
+_lock = threading.Lock()
+# (loja, modo, hash do prompt) -> (modelo, expira_em)
+_modelos = LRUCache(maxsize=128)
+
+
+def _config(chave, padrao):
+    if has_app_context():
+        return current_app.config.get(chave, padrao)
+    return padrao
+
+
+def obter_provedor():
+    """Provedor configurado em IA_CACHE_PREFIXO, ou None se desligado."""
+    global _provedor
+    tipo = str(_config('IA_CACHE_PREFIXO', 'gemini')).lower()
+    classe = _PROVEDORES.get(tipo)
+    if classe is None:
+        return None
+    with _lock:
+        if not isinstance(_provedor, classe):
+            _provedor = classe()
+        return _provedor
+
+
+def _chave_compartilhada(barbearia_id, modo, hash_):
+    return f"ia_prefixo:{barbearia_id}:{modo}:{hash_}"
+
+
+# ==============================================================================
+# 🚀 API
+# ==============================================================================
+def modelo_com_prefixo(barbearia_id, modo, system_prompt, modelo, tools, generation_config, safety_settings):
+    """
+    Retorna um modelo que reaproveita o prefixo (system prompt + tools) já registrado
+    no provedor, registrando-o se preciso. Retorna None quando o cache está desligado,
+    o prompt é pequeno demais ou o provedor falhou (quem chama usa o modelo normal).
+    O nome do prefixo fica no cache compartilhado: todos os workers usam o mesmo.
+    """
+    provedor = obter_provedor()
+    if provedor is None:
+        return None
+
+    min_tokens = int(_config('IA_CACHE_PREFIXO_MIN_TOKENS', MIN_TOKENS_PADRAO))
+    if len(system_prompt) // 4 < min_tokens:
+        metricas.incrementar('ia_prefixo_cache', resultado='pequeno')
+        return None
+
+    ttl = int(_config('IA_CACHE_PREFIXO_TTL', TTL_PADRAO))
+    hash_ = hash_prompt(system_prompt)
+    chave_local = (barbearia_id, modo, hash_)
+    agora = time.time()
+
+    with _lock:
+        item = _modelos.get(chave_local)
+    if item and item[1] > agora:
+        metricas.incrementar('ia_prefixo_cache', resultado='hit')
+        return item[0]
+
+    chave = _chave_compartilhada(barbearia_id, modo, hash_)
+    validade = max(ttl - MARGEM_RENOVACAO, 60)
+    try:
+        nome = cache.get(chave)
+        if nome:
+            metricas.incrementar('ia_prefixo_cache', resultado='compartilhado')
+        else:
+            with metricas.cronometro('ia_prefixo_criacao_ms'):
+                nome = provedor.criar(modelo, system_prompt, tools, ttl)
+            cache.set(chave, nome, timeout=validade)
+            metricas.incrementar('ia_prefixo_cache', resultado='criado')
+            logging.info(f"🧊 Prefixo do prompt registrado no provedor (loja {barbearia_id}, modo {modo}): {nome}")
+        modelo_prefixo = provedor.modelo(nome, generation_config, safety_settings)
+    except Exception as e:
+        metricas.incrementar('ia_prefixo_cache', resultado='erro')
+        logging.warning(f"⚠️ Cache de prefixo indisponível (loja {barbearia_id}, modo {modo}): {e}. Usando prompt completo.")
+        return None
+
+    # Validade local conservadora: o nome pode ter sido criado por outro worker há um tempo
+    with _lock:
+        _modelos[chave_local] = (modelo_prefixo, agora + min(validade, MARGEM_RENOVACAO))
+    return modelo_prefixo
+
+
+def descartar(barbearia_id, modo, system_prompt):
+    """Esquece o prefixo (ex.: o provedor disse que ele expirou); o próximo uso registra outro."""
+    hash_ = hash_prompt(system_prompt)
+    with _lock:
+        _modelos.pop((barbearia_id, modo, hash_), None)
+    try:
+        cache.delete(_chave_compartilhada(barbearia_id, modo, hash_))
+    except Exception as e:
+        logging.warning(f"Falha ao descartar prefixo da loja {barbearia_id}: {e}")
+
+
+def registrar_uso(response):
+    """Métricas de tokens de entrada cobrados vs. servidos do cache (usage_metadata do Gemini)."""
+    try:
+        uso = response.usage_metadata
+        metricas.incrementar('ia_tokens_entrada', uso.prompt_token_count or 0)
+        metricas.incrementar('ia_tokens_entrada_cache', getattr(uso, 'cached_content_token_count', 0) or 0)
+        metricas.incrementar('ia_tokens_saida', uso.candidates_token_count or 0)
+    except Exception:
+        pass
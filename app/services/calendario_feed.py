@@ -0,0 +1,151 @@
+# app/services/calendario_feed.py
+# Feed JSON do calendário de reservas (FullCalendar) sem reconstruir o histórico inteiro:
+# - Janela: só os agendamentos que cruzam [start, end) da tela, com servico/profissional
+#   carregados na mesma consulta e o JSON gerado em streaming (yield_per)
+# - ETag: versão barata (contagem + última gravação + última remoção + versão da config da
+#   loja); If-None-Match igual -> 304 sem montar nenhum evento
+# - Delta (?since=): alterados desde o instante + lápides dos apagados (AgendamentoRemovido,
+#   gravadas por listener na mesma transação do DELETE)
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func, insert, delete, select
+from sqlalchemy.orm import joinedload
+
+from app.extensions import db
+from app.models.tables import Agendamento, AgendamentoRemovido
+from app.services import reserva_service
+from app.services.cache_modelos import versao_config
+
+# Paleta de cores premium para diferenciar os quartos
+CORES = ['#0ea5e9', '#8b5cf6', '#f59e0b', '#10b981', '#f43f5e', '#6366f1', '#14b8a6', '#f97316']
+# Gravações em andamento quando o delta foi gerado ainda podem commitar com atualizado_em
+# um pouco anterior ao corte: o próximo delta relê essa margem (o cliente troca pelo id)
+MARGEM_DELTA = timedelta(seconds=30)
+LOTE_STREAMING = 500
+
+
+# ==============================================================================
+# 🪦 LÁPIDES (agendamentos apagados)
+# ==============================================================================
+def _antes_de_apagar(mapper, connection, target):
+    agora = datetime.now()
+    retencao = timedelta(days=current_app.config.get('CALENDARIO_DELTA_MAX_DIAS', 7))
+    connection.execute(insert(AgendamentoRemovido).values(
+        barbearia_id=target.barbearia_id, agendamento_id=target.id, removido_em=agora
+    ))
+    # Lápides mais velhas que a retenção não servem mais (o cliente recarrega tudo)
+    connection.execute(delete(AgendamentoRemovido).where(
+        AgendamentoRemovido.barbearia_id == target.barbearia_id,
+        AgendamentoRemovido.removido_em < agora - retencao
+    ))
+
+
+event.listen(Agendamento, 'before_delete', _antes_de_apagar)
+
+
+# ==============================================================================
+# 🔎 CONSULTAS
+# ==============================================================================
+def _na_janela(barbearia_id, inicio, fim):
+    return (
+        Agendamento.barbearia_id == barbearia_id,
+        Agendamento.data_hora < fim,
+        reserva_service.fim_efetivo() >= inicio
+    )
+
+
+def _alterados_desde(barbearia_id, desde):
+    return (
+        Agendamento.barbearia_id == barbearia_id,
+        Agendamento.atualizado_em >= desde - MARGEM_DELTA
+    )
+
+
+def delta_valido(desde):
+    """O delta só é possível enquanto as lápides do período ainda existem."""
+    return datetime.now() - desde <= timedelta(days=current_app.config.get('CALENDARIO_DELTA_MAX_DIAS', 7))
+
+
+def removidos_desde(barbearia_id, desde):
+    return db.session.execute(
+        select(AgendamentoRemovido.agendamento_id).where(
+            AgendamentoRemovido.barbearia_id == barbearia_id,
+            AgendamentoRemovido.removido_em >= desde - MARGEM_DELTA
+        )
+    ).scalars().all()
+
+
+def etag(barbearia_id, inicio=None, fim=None, desde=None):
+    """Versão do feed: muda quando algo na janela (ou desde o instante) muda."""
+    filtros = _na_janela(barbearia_id, inicio, fim) if desde is None else _alterados_desde(barbearia_id, desde)
+    quantidade, ultima_gravacao, maior_id = db.session.execute(
+        select(func.count(Agendamento.id), func.max(Agendamento.atualizado_em), func.max(Agendamento.id)).where(*filtros)
+    ).one()
+    ultima_remocao = db.session.execute(
+        select(func.max(AgendamentoRemovido.removido_em)).where(AgendamentoRemovido.barbearia_id == barbearia_id)
+    ).scalar()
+    chave = f"{barbearia_id}|{inicio}|{fim}|{desde}|{quantidade}|{ultima_gravacao}|{maior_id}|{ultima_remocao}|{versao_config(barbearia_id)}"
+    return hashlib.sha1(chave.encode()).hexdigest()
+
+
+def _agendamentos(*filtros):
+    return (
+        Agendamento.query
+        .options(joinedload(Agendamento.servico), joinedload(Agendamento.profissional))
+        .filter(*filtros)
+        .order_by(Agendamento.data_hora)
+        .yield_per(LOTE_STREAMING)
+    )
+
+
+# ==============================================================================
+# 🧾 JSON (streaming)
+# ==============================================================================
+def evento(ag):
+    """Agendamento no formato de evento do FullCalendar."""
+    fim = ag.fim
+    duracao = int((fim - ag.data_hora).total_seconds() // 60)
+
+    # Lógica inteligente: Se for menos de 12h (720 min) ou tiver 'day' no nome, é Day Use.
+    is_day_use = duracao <= 720 or (ag.servico and 'day' in ag.servico.nome.lower())
+    icone = '☀️' if is_day_use else '🛏️'
+    tipo_texto = 'Day Use' if is_day_use else 'Diária'
+
+    return {
+        'id': ag.id,
+        'title': f"{icone} {ag.nome_cliente}",
+        'start': ag.data_hora.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end': fim.strftime('%Y-%m-%dT%H:%M:%S'),
+        'color': CORES[ag.profissional_id % len(CORES)],  # Cada quarto ganha uma cor fixa baseada no ID dele
+        'extendedProps': {
+            'quarto_id': str(ag.profissional_id),
+            'quarto_nome': ag.profissional.nome,
+            'telefone': ag.telefone_cliente,
+            'tipo': tipo_texto,
+            'checkin': ag.data_hora.strftime('%d/%m às %H:%M'),
+            'checkout': fim.strftime('%d/%m às %H:%M')
+        }
+    }
+
+
+def _lista_json(agendamentos):
+    yield '['
+    for n, ag in enumerate(agendamentos):
+        yield (',' if n else '') + json.dumps(evento(ag), ensure_ascii=False)
+    yield ']'
+
+
+def janela_json(barbearia_id, inicio, fim):
+    """Gera o JSON (lista de eventos) da janela em pedaços."""
+    return _lista_json(_agendamentos(*_na_janela(barbearia_id, inicio, fim)))
+
+
+def delta_json(barbearia_id, desde, ate):
+    """Gera {"ate", "removidos", "eventos"} com o que mudou desde `desde`."""
+    yield json.dumps({'ate': ate.isoformat(timespec='seconds'), 'removidos': removidos_desde(barbearia_id, desde)})[:-1]
+    yield ', "eventos": '
+    yield from _lista_json(_agendamentos(*_alterados_desde(barbearia_id, desde)))
+    yield '}'
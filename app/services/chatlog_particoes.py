@@ -0,0 +1,198 @@
+# app/services/chatlog_particoes.py
+# Armazenamento do histórico (ChatLog) por mês e com prazo de guarda:
+# - PostgreSQL: chat_logs é particionada por RANGE(data_hora), uma partição por mês
+#   (chat_logs_AAAA_MM) + chat_logs_padrao para o que cair fora delas. Consultas do mês
+#   corrente (custo do superadmin) só tocam a partição do mês
+# - SQLite / tabela não particionada: mesma API, tudo vira DELETE por linhas
+# - Retenção por plano (CHATLOG_RETENCAO_POR_PLANO, padrão CHATLOG_RETENCAO_DIAS): o que
+#   passou do prazo é exportado para JSONL comprimido (gzip) e só então apagado. Partição
+#   inteira mais velha que o maior prazo é exportada e removida com DROP (sem DELETE)
+import os
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, delete, func, text
+
+from app.extensions import db
+from app.models.tables import ChatLog, Barbearia, Assinatura, Plano
+
+TABELA = 'chat_logs'
+PARTICAO_PADRAO = 'chat_logs_padrao'
+LOTE_EXPORTACAO = 1000
+COLUNAS = ('id', 'barbearia_id', 'cliente_telefone', 'mensagem', 'tipo', 'data_hora', 'char_count', 'token_count')
+
+
+# ==============================================================================
+# 🗂️ PARTIÇÕES MENSAIS (PostgreSQL)
+# ==============================================================================
+def _inicio_do_mes(data, meses=0):
+    indice = data.year * 12 + data.month - 1 + meses
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(inicio_mes):
+    return f"{TABELA}_{inicio_mes.year:04d}_{inicio_mes.month:02d}"
+
+
+def particionada():
+    """True se chat_logs é uma tabela particionada (PostgreSQL após a migração)."""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :tabela"
+    ), {'tabela': TABELA}).first() is not None
+
+
+def particoes():
+    """[(nome, início, fim)] das partições mensais existentes, da mais antiga para a mais nova."""
+    nomes = db.session.execute(text(
+        "SELECT filha.relname FROM pg_inherits h "
+        "JOIN pg_class mae ON mae.oid = h.inhparent JOIN pg_class filha ON filha.oid = h.inhrelid "
+        "WHERE mae.relname = :tabela"
+    ), {'tabela': TABELA}).scalars().all()
+    resultado = []
+    for nome in nomes:
+        try:
+            inicio = datetime.strptime(nome[len(TABELA) + 1:], '%Y_%m')
+        except ValueError:
+            continue  # chat_logs_padrao
+        resultado.append((nome, inicio, _inicio_do_mes(inicio, 1)))
+    return sorted(resultado, key=lambda p: p[1])
+
+
+def garantir_particoes(meses_a_frente=2, agora=None):
+    """
+    Cria as partições do mês corrente até `meses_a_frente` meses adiante. Linhas que já
+    caíram na partição padrão nesse intervalo são movidas para a partição nova.
+    Retorna os nomes criados.
+    """
+    if not particionada():
+        return []
+    existentes = {nome for nome, _, _ in particoes()}
+    mes_atual = _inicio_do_mes(agora or datetime.now())
+    criadas = []
+    for n in range(meses_a_frente + 1):
+        inicio, fim = _inicio_do_mes(mes_atual, n), _inicio_do_mes(mes_atual, n + 1)
+        nome = nome_particao(inicio)
+        if nome in existentes:
+            continue
+        limites = {'inicio': inicio, 'fim': fim}
+        db.session.execute(text(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        db.session.execute(text(
+            f"WITH movidas AS (DELETE FROM {PARTICAO_PADRAO} WHERE data_hora >= :inicio AND data_hora < :fim RETURNING *) "
+            f"INSERT INTO {nome} SELECT * FROM movidas"
+        ), limites)
+        db.session.execute(text(
+            f"ALTER TABLE {TABELA} ATTACH PARTITION {nome} FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')"
+        ))
+        db.session.commit()
+        criadas.append(nome)
+        logging.info(f"🗂️ Partição {nome} criada.")
+    return criadas
+
+
+# ==============================================================================
+# ⏳ RETENÇÃO POR PLANO
+# ==============================================================================
+def retencao_por_loja():
+    """{barbearia_id: dias de guarda} pelo plano da assinatura mais recente de cada loja."""
+    config = current_app.config
+    padrao = int(config.get('CHATLOG_RETENCAO_DIAS', 365))
+    por_plano = {nome.lower(): int(dias) for nome, dias in (config.get('CHATLOG_RETENCAO_POR_PLANO') or {}).items()}
+
+    ultima_assinatura = (
+        select(Assinatura.barbearia_id, func.max(Assinatura.id).label('assinatura_id'))
+        .group_by(Assinatura.barbearia_id)
+        .subquery()
+    )
+    planos = dict(db.session.execute(
+        select(ultima_assinatura.c.barbearia_id, Plano.nome)
+        .join(Assinatura, Assinatura.id == ultima_assinatura.c.assinatura_id)
+        .join(Plano, Plano.id == Assinatura.plano_id)
+    ).all())
+    return {
+        barbearia_id: por_plano.get((planos.get(barbearia_id) or '').lower(), padrao)
+        for barbearia_id in db.session.execute(select(Barbearia.id)).scalars()
+    }
+
+
+# ==============================================================================
+# 📦 ARQUIVAMENTO (JSONL.gz) + LIMPEZA
+# ==============================================================================
+def _exportar(caminho, *filtros):
+    """Grava as linhas do filtro em JSONL comprimido. Retorna quantas foram escritas."""
+    consulta = (
+        select(*(getattr(ChatLog, coluna) for coluna in COLUNAS))
+        .where(*filtros)
+        .order_by(ChatLog.data_hora, ChatLog.id)
+        .execution_options(yield_per=LOTE_EXPORTACAO)
+    )
+    quantidade = 0
+    temporario = caminho + '.parcial'
+    with gzip.open(temporario, 'wt', encoding='utf-8') as arquivo:
+        for linha in db.session.execute(consulta):
+            registro = linha._asdict()
+            registro['data_hora'] = registro['data_hora'].isoformat() if registro['data_hora'] else None
+            arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            quantidade += 1
+    if quantidade:
+        os.replace(temporario, caminho)
+    else:
+        os.remove(temporario)
+    return quantidade
+
+
+def arquivar(pasta, agora=None, simular=False):
+    """
+    Exporta e apaga o histórico fora do prazo de guarda. Retorna [(descrição, linhas, arquivo)].
+    Com `simular`, só conta o que seria arquivado.
+    """
+    agora = agora or datetime.now()
+    os.makedirs(pasta, exist_ok=True)
+    carimbo = agora.strftime('%Y%m%d%H%M%S')
+    retencao = retencao_por_loja()
+    maior_prazo = max(list(retencao.values()) + [int(current_app.config.get('CHATLOG_RETENCAO_DIAS', 365))])
+    corte_global = agora - timedelta(days=maior_prazo)
+    resultado = []
+
+    # 1. Partições inteiras mais velhas que o maior prazo: exporta e remove com DROP
+    if particionada():
+        for nome, inicio, fim in particoes():
+            if fim > corte_global:
+                break
+            filtros = (ChatLog.data_hora >= inicio, ChatLog.data_hora < fim)
+            if simular:
+                quantidade = db.session.execute(select(func.count(ChatLog.id)).where(*filtros)).scalar()
+                resultado.append((f"partição {nome}", quantidade, None))
+                continue
+            caminho = os.path.join(pasta, f"{nome}_{carimbo}.jsonl.gz")
+            quantidade = _exportar(caminho, *filtros)
+            db.session.execute(text(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}"))
+            db.session.execute(text(f"DROP TABLE {nome}"))
+            db.session.commit()
+            resultado.append((f"partição {nome}", quantidade, caminho if quantidade else None))
+
+    # 2. Lojas com prazo menor: linhas da loja anteriores ao corte dela
+    antigas = dict(db.session.execute(
+        select(ChatLog.barbearia_id, func.min(ChatLog.data_hora)).group_by(ChatLog.barbearia_id)
+    ).all())
+    for barbearia_id, mais_antiga in sorted(antigas.items(), key=lambda item: item[0] or 0):
+        corte = agora - timedelta(days=retencao.get(barbearia_id, maior_prazo))
+        if mais_antiga is None or mais_antiga >= corte:
+            continue
+        filtros = (ChatLog.barbearia_id.is_(None) if barbearia_id is None else ChatLog.barbearia_id == barbearia_id,
+                   ChatLog.data_hora < corte)
+        descricao = f"loja {barbearia_id} até {corte:%d/%m/%Y}"
+        if simular:
+            quantidade = db.session.execute(select(func.count(ChatLog.id)).where(*filtros)).scalar()
+            resultado.append((descricao, quantidade, None))
+            continue
+        caminho = os.path.join(pasta, f"{TABELA}_loja{barbearia_id}_ate_{corte:%Y%m%d}_{carimbo}.jsonl.gz")
+        quantidade = _exportar(caminho, *filtros)
+        db.session.execute(delete(ChatLog).where(*filtros))
+        db.session.commit()
+        resultado.append((descricao, quantidade, caminho if quantidade else None))
+    return resultado
@@ -0,0 +1,211 @@
+# app/services/chatlog_sink.py
+# Gravação do histórico (ChatLog) fora do turno da conversa: os workers só registram a linha
+# em memória e uma thread por processo grava em lote (um INSERT multi-linha por lote) a cada
+# CHATLOG_FLUSH_MS ou quando juntar CHATLOG_LOTE linhas.
+# - Contrapressão: com o buffer cheio (CHATLOG_BUFFER_MAX) a linha vai direto para o
+#   arquivo de despejo, sem travar a conversa e sem perder o log
+# - Banco fora do ar: o lote que falhou também vai para o despejo (JSONL em
+#   CHATLOG_DESPEJO_DIR) e é reenviado pelos próximos flushes, de qualquer processo
+# - Encerramento normal: atexit grava o que sobrou. Queda brusca perde no máximo o que
+#   estava no buffer (até CHATLOG_FLUSH_MS de mensagens)
+# - CHATLOG_FLUSH_MS = 0 grava na hora (scripts, testes)
+# - Cada lote atualiza também o índice de conversas do monitor (app/services/conversas.py)
+#   e, depois do commit, acorda os monitores abertos (app/services/monitor_eventos.py)
+import os
+import json
+import glob
+import time
+import atexit
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models.tables import ChatLog
+from app.services import metricas
+from app.services import conversas
+from app.services import monitor_eventos
+
+# Arquivo de despejo sendo escrito há menos que isso pode ter uma linha pela metade
+IDADE_MINIMA_DESPEJO = 2
+# Reenvio interrompido (processo caiu no meio): volta para a fila depois disso
+IDADE_REENVIO_ABANDONADO = 300
+
+_lock = threading.Lock()
+_tem_dados = threading.Condition(_lock)
+_buffer = []
+_gravador = {'thread': None, 'app': None}
+
+
+# ==============================================================================
+# 📝 API (workers)
+# ==============================================================================
+def registrar(barbearia_id, telefone, mensagem, tipo):
+    """Enfileira uma linha do histórico; o horário é o da mensagem, não o da gravação."""
+    linha = dict(barbearia_id=barbearia_id, cliente_telefone=telefone, mensagem=mensagem, tipo=tipo, data_hora=datetime.now())
+    config = current_app.config
+    if config.get('CHATLOG_FLUSH_MS', 500) <= 0:
+        _gravar_ou_despejar([linha], config)
+        return
+
+    _garantir_gravador()
+    with _lock:
+        cheio = len(_buffer) >= config.get('CHATLOG_BUFFER_MAX', 5000)
+        if not cheio:
+            _buffer.append(linha)
+            if len(_buffer) >= config.get('CHATLOG_LOTE', 200):
+                _tem_dados.notify()
+    if cheio:
+        metricas.incrementar('chatlog_despejo', motivo='buffer_cheio')
+        _despejar([linha], config)
+
+
+def descarregar():
+    """Grava agora o que está no buffer e reenvia despejos pendentes. Retorna linhas gravadas."""
+    app = _gravador['app'] or current_app._get_current_object()
+    with app.app_context():
+        return _ciclo(app.config)
+
+
+# ==============================================================================
+# 💾 GRAVAÇÃO EM LOTE
+# ==============================================================================
+def _gravar(linhas):
+    inicio = time.perf_counter()
+    try:
+        db.session.execute(insert(ChatLog), linhas)
+        conversas.registrar_mensagens(db.session.connection(), linhas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    monitor_eventos.publicar(linha['barbearia_id'] for linha in linhas)
+    metricas.observar('chatlog_lote_ms', (time.perf_counter() - inicio) * 1000)
+    metricas.incrementar('chatlog_gravadas', len(linhas))
+
+
+def _gravar_ou_despejar(linhas, config):
+    try:
+        _gravar(linhas)
+        return len(linhas)
+    except Exception as e:
+        logging.error(f"Erro ao gravar {len(linhas)} log(s) de conversa; indo para o despejo: {e}")
+        metricas.incrementar('chatlog_despejo', motivo='erro_banco')
+        _despejar(linhas, config)
+        return 0
+
+
+def _ciclo(config):
+    with _lock:
+        linhas = _buffer[:]
+        del _buffer[:]
+    gravadas = _gravar_ou_despejar(linhas, config) if linhas else 0
+    # Só reenvia despejos com o banco respondendo (senão o lote acabou de voltar para lá)
+    if gravadas or not linhas:
+        gravadas += _reenviar_despejos(config)
+    return gravadas
+
+
+def _loop(app):
+    with app.app_context():
+        intervalo = app.config.get('CHATLOG_FLUSH_MS', 500) / 1000
+        while True:
+            with _lock:
+                if len(_buffer) < app.config.get('CHATLOG_LOTE', 200):
+                    _tem_dados.wait(intervalo)
+            try:
+                _ciclo(app.config)
+            except Exception as e:
+                logging.error(f"Erro no gravador de logs de conversa: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+
+def _garantir_gravador():
+    if _gravador['thread'] is not None:
+        return
+    with _lock:
+        if _gravador['thread'] is not None:
+            return
+        _gravador['app'] = current_app._get_current_object()
+        _gravador['thread'] = threading.Thread(target=_loop, args=(_gravador['app'],), name='chatlog-gravador', daemon=True)
+        _gravador['thread'].start()
+    atexit.register(_ao_encerrar)
+
+
+def _ao_encerrar():
+    try:
+        descarregar()
+    except Exception as e:
+        logging.error(f"Logs de conversa não gravados no encerramento: {e}")
+        with _lock:
+            linhas = _buffer[:]
+            del _buffer[:]
+        if linhas:
+            _despejar(linhas, _gravador['app'].config)
+
+
+# ==============================================================================
+# 🛟 DESPEJO EM ARQUIVO (JSONL)
+# ==============================================================================
+def _pasta_despejo(config):
+    pasta = config.get('CHATLOG_DESPEJO_DIR') or os.path.join(tempfile.gettempdir(), 'chatlog_despejo')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def _despejar(linhas, config):
+    """Anexa as linhas ao despejo deste processo (um arquivo por PID: sem linhas intercaladas)."""
+    caminho = os.path.join(_pasta_despejo(config), f"chatlog-{os.getpid()}.jsonl")
+    with open(caminho, 'a', encoding='utf-8') as arquivo:
+        for linha in linhas:
+            arquivo.write(json.dumps(dict(linha, data_hora=linha['data_hora'].isoformat()), ensure_ascii=False) + '\n')
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+
+
+def _reenviar_despejos(config):
+    pasta = _pasta_despejo(config)
+    agora = time.time()
+    candidatos = [
+        (caminho, IDADE_MINIMA_DESPEJO) for caminho in glob.glob(os.path.join(pasta, 'chatlog-*.jsonl'))
+    ] + [
+        (caminho, IDADE_REENVIO_ABANDONADO) for caminho in glob.glob(os.path.join(pasta, 'chatlog-*.enviando'))
+    ]
+    gravadas = 0
+    for caminho, idade_minima in candidatos:
+        try:
+            if agora - os.path.getmtime(caminho) < idade_minima:
+                continue
+            # Renomear é atômico: só um processo fica com cada arquivo
+            reivindicado = os.path.join(pasta, f"chatlog-reenvio-{os.getpid()}-{time.time_ns()}.enviando")
+            os.rename(caminho, reivindicado)
+            os.utime(reivindicado)
+        except OSError:
+            continue
+
+        linhas = []
+        with open(reivindicado, encoding='utf-8') as arquivo:
+            for texto in arquivo:
+                try:
+                    linha = json.loads(texto)
+                    linha['data_hora'] = datetime.fromisoformat(linha['data_hora'])
+                    linhas.append(linha)
+                except ValueError:
+                    # Última linha cortada por uma queda no meio da escrita
+                    logging.warning(f"Linha inválida ignorada no despejo de logs de conversa: {texto[:200]!r}")
+        try:
+            if linhas:
+                _gravar(linhas)
+        except Exception as e:
+            logging.error(f"Reenvio do despejo {os.path.basename(caminho)} falhou; tenta de novo depois: {e}")
+            os.rename(reivindicado, os.path.join(pasta, f"chatlog-reenvio-{os.getpid()}-{time.time_ns()}.jsonl"))
+            break
+        os.remove(reivindicado)
+        gravadas += len(linhas)
+        logging.info(f"🛟 {len(linhas)} log(s) de conversa reenviados do despejo.")
+    return gravadas
@@ -0,0 +1,178 @@
+# app/services/conversas.py
+# Índice de conversas para o monitor (lista lateral) sem agrupar o ChatLog inteiro:
+# - Conversa: uma linha por (loja, telefone normalizado) com última mensagem, prévia e
+#   não lidas; atualizada por upsert na MESMA transação de cada lote de ChatLog
+#   (chatlog_sink), agregando o lote por contato
+# - Cliente: nome do cliente por (loja, telefone normalizado), mantido pelos agendamentos;
+#   o monitor junta pela chave em vez do LIKE '%últimos 8 dígitos%' por contato
+# - chave_telefone: o mesmo número chega como '5511988887777@c.us' (WAHA), '5511988887777'
+#   (Meta) ou '11988887777' (IA/painel), com ou sem o nono dígito
+import re
+from datetime import datetime
+
+from sqlalchemy import event, select, delete, func, case, and_, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models.tables import Agendamento, ChatLog, Cliente, Conversa
+
+TAMANHO_PREVIA = 120
+POR_PAGINA = 50
+
+
+def chave_telefone(telefone):
+    """Só dígitos, com DDI 55 e sem o nono dígito (celulares BR antigos e novos batem)."""
+    digitos = re.sub(r'\D', '', str(telefone or '').split('@')[0])
+    if len(digitos) in (10, 11):
+        digitos = '55' + digitos
+    if len(digitos) == 13 and digitos.startswith('55'):
+        digitos = digitos[:4] + digitos[5:]
+    return digitos
+
+
+def _insert(connection, tabela):
+    """INSERT com ON CONFLICT do dialeto (PostgreSQL ou SQLite)."""
+    return (postgresql if connection.dialect.name == 'postgresql' else sqlite).insert(tabela)
+
+
+# ==============================================================================
+# 💬 CONVERSAS (junto com o ChatLog)
+# ==============================================================================
+def _resumo_do_lote(linhas, contar_nao_lidas):
+    resumo = {}
+    for linha in sorted(linhas, key=lambda l: l['data_hora']):
+        chave = chave_telefone(linha['cliente_telefone'])
+        if not linha.get('barbearia_id') or not chave:
+            continue
+        item = resumo.setdefault((linha['barbearia_id'], chave), {'nao_lidas': 0})
+        item.update(
+            barbearia_id=linha['barbearia_id'], telefone=chave, cliente_telefone=linha['cliente_telefone'],
+            ultima_mensagem_em=linha['data_hora'], ultimo_tipo=linha['tipo'],
+            ultima_previa=(linha['mensagem'] or '')[:TAMANHO_PREVIA]
+        )
+        if contar_nao_lidas and linha['tipo'] == 'cliente':
+            item['nao_lidas'] += 1
+    return list(resumo.values())
+
+
+def registrar_mensagens(connection, linhas, contar_nao_lidas=True):
+    """Upsert das conversas de um lote de ChatLog (chamar na transação do INSERT do lote)."""
+    conversas = _resumo_do_lote(linhas, contar_nao_lidas)
+    if not conversas:
+        return
+    comando = _insert(connection, Conversa)
+    mais_nova = comando.excluded.ultima_mensagem_em >= Conversa.ultima_mensagem_em
+    # Lote reenviado do despejo pode ser mais antigo que o estado atual: só soma não lidas
+    comando = comando.on_conflict_do_update(
+        index_elements=['barbearia_id', 'telefone'],
+        set_={
+            'nao_lidas': Conversa.nao_lidas + comando.excluded.nao_lidas,
+            'ultima_mensagem_em': case((mais_nova, comando.excluded.ultima_mensagem_em), else_=Conversa.ultima_mensagem_em),
+            'ultima_previa': case((mais_nova, comando.excluded.ultima_previa), else_=Conversa.ultima_previa),
+            'ultimo_tipo': case((mais_nova, comando.excluded.ultimo_tipo), else_=Conversa.ultimo_tipo),
+            'cliente_telefone': case((mais_nova, comando.excluded.cliente_telefone), else_=Conversa.cliente_telefone),
+        }
+    )
+    connection.execute(comando, conversas)
+
+
+def marcar_lida(barbearia_id, cliente_telefone):
+    db.session.execute(
+        Conversa.__table__.update()
+        .where(Conversa.barbearia_id == barbearia_id, Conversa.telefone == chave_telefone(cliente_telefone), Conversa.nao_lidas > 0)
+        .values(nao_lidas=0)
+    )
+    db.session.commit()
+
+
+def pagina_de_conversas(barbearia_id, pagina=1, por_pagina=POR_PAGINA):
+    """([(Conversa, nome do cliente)], tem_mais) — uma consulta pelo índice (loja, última mensagem)."""
+    linhas = db.session.execute(
+        select(Conversa, Cliente.nome)
+        .outerjoin(Cliente, and_(Cliente.barbearia_id == Conversa.barbearia_id, Cliente.telefone == Conversa.telefone))
+        .where(Conversa.barbearia_id == barbearia_id)
+        .order_by(Conversa.ultima_mensagem_em.desc(), Conversa.id.desc())
+        .limit(por_pagina + 1)
+        .offset((max(pagina, 1) - 1) * por_pagina)
+    ).all()
+    return [tuple(linha) for linha in linhas[:por_pagina]], len(linhas) > por_pagina
+
+
+def nome_do_cliente(barbearia_id, cliente_telefone):
+    return db.session.execute(
+        select(Cliente.nome).where(Cliente.barbearia_id == barbearia_id, Cliente.telefone == chave_telefone(cliente_telefone))
+    ).scalar()
+
+
+# ==============================================================================
+# 👤 CLIENTES (pelos agendamentos)
+# ==============================================================================
+def _cliente_real(chave, nome):
+    """Bloqueios da agenda pelo dono (telefone '00000000000', nome '⛔ motivo') não são clientes."""
+    numero = chave[2:] if chave.startswith('55') else chave
+    return bool(numero.strip('0')) and not nome.strip().startswith('⛔')
+
+
+def _gravar_cliente(connection, barbearia_id, telefone, nome):
+    chave = chave_telefone(telefone)
+    if not barbearia_id or not chave or not (nome or '').strip() or not _cliente_real(chave, nome):
+        return
+    comando = _insert(connection, Cliente).values(
+        barbearia_id=barbearia_id, telefone=chave, nome=nome.strip()[:100], atualizado_em=datetime.now()
+    )
+    connection.execute(comando.on_conflict_do_update(
+        index_elements=['barbearia_id', 'telefone'],
+        set_={'nome': comando.excluded.nome, 'atualizado_em': comando.excluded.atualizado_em}
+    ))
+
+
+def _apos_gravar_agendamento(mapper, connection, target):
+    estado = inspect(target)
+    if estado.attrs.nome_cliente.history.has_changes() or estado.attrs.telefone_cliente.history.has_changes():
+        _gravar_cliente(connection, target.barbearia_id, target.telefone_cliente, target.nome_cliente)
+
+
+event.listen(Agendamento, 'after_insert', _apos_gravar_agendamento)
+event.listen(Agendamento, 'after_update', _apos_gravar_agendamento)
+
+
+# ==============================================================================
+# 🔁 RECONSTRUÇÃO (carga inicial)
+# ==============================================================================
+def reconstruir(barbearia_id):
+    """Refaz clientes e conversas da loja a partir de agendamentos e ChatLog. Retorna (clientes, conversas)."""
+    connection = db.session.connection()
+    db.session.execute(delete(Cliente).where(Cliente.barbearia_id == barbearia_id))
+    db.session.execute(delete(Conversa).where(Conversa.barbearia_id == barbearia_id))
+
+    # Nome mais recente de cada telefone
+    nomes = {}
+    for telefone, nome in db.session.execute(
+        select(Agendamento.telefone_cliente, Agendamento.nome_cliente)
+        .where(Agendamento.barbearia_id == barbearia_id)
+        .order_by(Agendamento.id)
+    ):
+        chave = chave_telefone(telefone)
+        if chave and (nome or '').strip() and _cliente_real(chave, nome):
+            nomes[chave] = (telefone, nome)
+    for telefone, nome in nomes.values():
+        _gravar_cliente(connection, barbearia_id, telefone, nome)
+
+    # Última mensagem de cada telefone, como veio no ChatLog (o histórico antigo conta como lido)
+    ultimas = (
+        select(ChatLog.cliente_telefone, func.max(ChatLog.data_hora).label('data_hora'))
+        .where(ChatLog.barbearia_id == barbearia_id, ChatLog.cliente_telefone.isnot(None), ChatLog.cliente_telefone != '')
+        .group_by(ChatLog.cliente_telefone)
+        .subquery()
+    )
+    linhas = [
+        dict(barbearia_id=barbearia_id, cliente_telefone=telefone, data_hora=data_hora, tipo=tipo, mensagem=mensagem)
+        for telefone, data_hora, tipo, mensagem in db.session.execute(
+            select(ChatLog.cliente_telefone, ChatLog.data_hora, ChatLog.tipo, ChatLog.mensagem)
+            .join(ultimas, and_(ChatLog.cliente_telefone == ultimas.c.cliente_telefone, ChatLog.data_hora == ultimas.c.data_hora))
+            .where(ChatLog.barbearia_id == barbearia_id)
+        )
+    ]
+    registrar_mensagens(connection, linhas, contar_nao_lidas=False)
+    db.session.commit()
+    return len(nomes), db.session.execute(select(func.count(Conversa.id)).where(Conversa.barbearia_id == barbearia_id)).scalar()
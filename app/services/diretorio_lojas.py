@@ -0,0 +1,220 @@
+# app/services/diretorio_lojas.py
+# Diretório de lojas em memória para os webhooks: qual loja é dona do phone_number_id (Meta),
+# do número do WhatsApp (Twilio) ou da sessão do WAHA, e se a assinatura libera a IA —
+# consulta O(1) num snapshot por processo, sem ir ao banco a cada mensagem.
+# - Snapshot compacto (só campos de roteamento/assinatura/provedor) de todas as lojas,
+#   carregado numa consulta e recarregado por inteiro a cada DIRETORIO_LOJAS_TTL
+# - Edição de Barbearia (qualquer caminho do ORM): depois do commit as lojas alteradas são
+#   recarregadas neste processo e avisadas aos outros pelo pub/sub do Redis
+# - Chave desconhecida: uma ida ao banco e o "não existe" fica lembrado por um minuto
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db, obter_redis
+from app.models.tables import Barbearia
+from app.services import metricas
+
+CANAL = 'diretorio_lojas'
+TTL_AUSENTE = 60
+CAMPOS = (
+    'id', 'nome_fantasia', 'business_type', 'telefone_whatsapp', 'meta_phone_number_id',
+    'waha_session_id', 'provedor_mensageria', 'status_assinatura', 'assinatura_expira_em'
+)
+
+_lock = threading.Lock()
+_estado = {'lojas': {}, 'indices': None, 'carregado_em': 0.0}
+_pendentes = set()
+_ausentes = {}
+_assinante = {'thread': None}
+
+
+class Loja:
+    """Retrato de uma loja no diretório (somente leitura)."""
+    __slots__ = CAMPOS
+
+    def __init__(self, **campos):
+        for campo in CAMPOS:
+            setattr(self, campo, campos.get(campo))
+
+    def assinatura_liberada(self, agora=None):
+        """Status 'ativa'/'teste' (manual) OU data de validade futura libera a IA."""
+        if str(self.status_assinatura).lower() in ('ativa', 'teste'):
+            return True
+        return bool(self.assinatura_expira_em and self.assinatura_expira_em > (agora or datetime.now()))
+
+    def __repr__(self):
+        return f"<Loja {self.id} {self.nome_fantasia!r}>"
+
+
+# ==============================================================================
+# 📸 SNAPSHOT
+# ==============================================================================
+def _consultar(ids=None):
+    consulta = select(*(getattr(Barbearia, campo) for campo in CAMPOS))
+    if ids is not None:
+        consulta = consulta.where(Barbearia.id.in_(list(ids)))
+    return {linha.id: Loja(**linha._asdict()) for linha in db.session.execute(consulta)}
+
+
+def _indexar(lojas):
+    indices = {'meta': {}, 'telefone': {}, 'waha': {}}
+    for loja in lojas.values():
+        if loja.meta_phone_number_id:
+            indices['meta'][loja.meta_phone_number_id] = loja
+        if loja.telefone_whatsapp:
+            indices['telefone'][loja.telefone_whatsapp] = loja
+        if loja.waha_session_id:
+            indices['waha'][loja.waha_session_id] = loja
+    return indices
+
+
+def _snapshot():
+    """Índices atuais, recarregando o que estiver vencido ou avisado como alterado."""
+    _garantir_assinante()
+    ttl = current_app.config.get('DIRETORIO_LOJAS_TTL', 300)
+    with _lock:
+        vencido = _estado['indices'] is None or time.monotonic() - _estado['carregado_em'] > ttl
+        pendentes = set(_pendentes)
+        _pendentes.clear()
+        if not (vencido or pendentes):
+            return _estado['indices'], _estado['lojas']
+
+    if vencido:
+        lojas = _consultar()
+        metricas.incrementar('diretorio_lojas_recarga', tipo='completa')
+    else:
+        lojas = dict(_estado['lojas'])
+        for barbearia_id in pendentes:
+            lojas.pop(barbearia_id, None)
+        lojas.update(_consultar(pendentes))
+        metricas.incrementar('diretorio_lojas_recarga', tipo='parcial')
+    indices = _indexar(lojas)
+
+    with _lock:
+        _estado['lojas'], _estado['indices'] = lojas, indices
+        if vencido:
+            _estado['carregado_em'] = time.monotonic()
+        _ausentes.clear()
+    return indices, lojas
+
+
+def _buscar(indice, chave, filtro):
+    if not chave:
+        return None
+    indices, _ = _snapshot()
+    loja = indices[indice].get(chave)
+    if loja is not None:
+        metricas.incrementar('diretorio_lojas', resultado='hit')
+        return loja
+
+    # Fora do snapshot: loja recém-criada em outro processo (sem Redis) ou chave inválida
+    with _lock:
+        if _ausentes.get((indice, chave), 0) > time.monotonic():
+            metricas.incrementar('diretorio_lojas', resultado='ausente')
+            return None
+    metricas.incrementar('diretorio_lojas', resultado='banco')
+    barbearia_id = db.session.execute(select(Barbearia.id).where(filtro == chave)).scalar()
+    if barbearia_id is None:
+        with _lock:
+            _ausentes[(indice, chave)] = time.monotonic() + TTL_AUSENTE
+        return None
+    avisar_alteracao(barbearia_id, publicar=False)
+    return _snapshot()[1].get(barbearia_id)
+
+
+# ==============================================================================
+# 🔎 CONSULTAS DOS WEBHOOKS
+# ==============================================================================
+def por_id(barbearia_id):
+    return _snapshot()[1].get(barbearia_id)
+
+
+def por_phone_number_id(phone_number_id):
+    """Loja do webhook da Meta."""
+    return _buscar('meta', phone_number_id, Barbearia.meta_phone_number_id)
+
+
+def por_telefone(telefone_whatsapp):
+    """Loja do webhook do Twilio (número do robô)."""
+    return _buscar('telefone', telefone_whatsapp, Barbearia.telefone_whatsapp)
+
+
+def por_sessao_waha(session_id, barbearia_id_da_sessao=None):
+    """Loja do webhook do WAHA: waha_session_id exato; senão o id embutido no nome (loja-<id>)."""
+    loja = _buscar('waha', session_id, Barbearia.waha_session_id)
+    if loja is None and barbearia_id_da_sessao:
+        loja = por_id(barbearia_id_da_sessao)
+    return loja
+
+
+# ==============================================================================
+# 📣 INVALIDAÇÃO (este processo + pub/sub do Redis para os demais)
+# ==============================================================================
+def avisar_alteracao(*barbearia_ids, publicar=True):
+    with _lock:
+        _pendentes.update(barbearia_ids)
+    if not publicar:
+        return
+    redis_client = obter_redis()
+    if redis_client is not None:
+        try:
+            redis_client.publish(CANAL, json.dumps(list(barbearia_ids)))
+        except Exception as e:
+            logging.warning(f"Falha ao publicar alteração do diretório de lojas: {e}")
+
+
+def _ouvir(redis_client):
+    while True:
+        try:
+            assinatura = redis_client.pubsub(ignore_subscribe_messages=True)
+            assinatura.subscribe(CANAL)
+            for mensagem in assinatura.listen():
+                ids = json.loads(mensagem['data'])
+                with _lock:
+                    _pendentes.update(ids)
+        except Exception as e:
+            logging.warning(f"Pub/sub do diretório de lojas caiu ({e}); recarga completa e nova assinatura em 5s.")
+            with _lock:
+                _estado['carregado_em'] = 0.0
+            time.sleep(5)
+
+
+def _garantir_assinante():
+    if _assinante['thread'] is not None:
+        return
+    redis_client = obter_redis()
+    with _lock:
+        if _assinante['thread'] is not None or redis_client is None:
+            return
+        _assinante['thread'] = threading.Thread(target=_ouvir, args=(redis_client,), name='diretorio-lojas', daemon=True)
+        _assinante['thread'].start()
+
+
+def _marcar_loja_alterada(mapper, connection, target):
+    sessao = Session.object_session(target)
+    if sessao is not None and target.id:
+        sessao.info.setdefault('diretorio_lojas_alteradas', set()).add(target.id)
+
+
+def _apos_commit(sessao):
+    alteradas = sessao.info.pop('diretorio_lojas_alteradas', None)
+    if alteradas:
+        avisar_alteracao(*alteradas)
+
+
+def _apos_rollback(sessao):
+    sessao.info.pop('diretorio_lojas_alteradas', None)
+
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Barbearia, _evento, _marcar_loja_alterada)
+
+event.listen(Session, 'after_commit', _apos_commit)
+event.listen(Session, 'after_rollback', _apos_rollback)
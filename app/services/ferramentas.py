@@ -0,0 +1,228 @@
+# app/services/ferramentas.py
+# Registro único das ferramentas (function calling) da IA.
+# Cada ferramenta é declarada uma vez (schema + função + opções) e todos os caminhos
+# (texto, auto-cura, áudio) despacham por aqui:
+# - schema -> FunctionDeclaration do Gemini
+# - coerção/validação dos argumentos pelo schema (a IA manda "2" em vez de 2...)
+# - argumentos injetados pelo sistema (barbearia_id, telefone do cliente)
+# - leituras em paralelo no pool (com timeout), escritas em série
+# - histograma de latência e contador de erros por ferramenta
+# - memoização opcional do resultado (invalidada quando a config da loja muda)
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TimeoutFuturo
+
+from flask import current_app
+from google.generativeai import protos
+from google.generativeai.types import FunctionDeclaration, Tool
+
+from app.extensions import cache
+from app.services import metricas
+from app.services.cache_modelos import versao_config
+
+TIMEOUT_LEITURA_PADRAO = 15
+
+# Argumentos que sempre vêm do sistema (nunca da IA)
+INJECAO_PADRAO = {'barbearia_id': 'barbearia_id'}
+
+
+class ErroArgumentos(ValueError):
+    """Argumentos da IA inválidos para o schema da ferramenta (vira resposta de erro para a IA)."""
+
+
+class Ferramenta:
+    def __init__(self, nome, funcao, descricao, parametros=None, somente_leitura=False,
+                 injetar=None, timeout=None, memoizar=0):
+        self.nome = nome
+        self.funcao = funcao
+        self.descricao = descricao
+        self.parametros = parametros or {"type": "object", "properties": {}, "required": []}
+        self.somente_leitura = somente_leitura
+        # {argumento_da_funcao: chave_do_contexto}
+        self.injetar = {**INJECAO_PADRAO, **(injetar or {})}
+        # Escritas não são interrompidas (um agendamento pela metade é pior que a espera)
+        self.timeout = (timeout or TIMEOUT_LEITURA_PADRAO) if somente_leitura else None
+        # Segundos de memoização do resultado (0 = desligado); só faz sentido para leituras
+        self.memoizar = memoizar if somente_leitura else 0
+
+    def declaracao(self):
+        return FunctionDeclaration(name=self.nome, description=self.descricao, parameters=self.parametros)
+
+    def preparar(self, args, contexto):
+        """Coage os argumentos da IA pelo schema, descarta os desconhecidos e injeta os do sistema."""
+        propriedades = self.parametros.get('properties', {})
+        kwargs = {}
+        for nome, valor in dict(args or {}).items():
+            if nome not in propriedades or nome in self.injetar:
+                continue
+            kwargs[nome] = _coagir(nome, valor, propriedades[nome].get('type'))
+
+        faltando = [n for n in self.parametros.get('required', []) if n not in kwargs and n not in self.injetar]
+        if faltando:
+            raise ErroArgumentos(f"Argumento(s) obrigatório(s) ausente(s): {', '.join(faltando)}")
+
+        for argumento, chave in self.injetar.items():
+            kwargs[argumento] = contexto[chave]
+        return kwargs
+
+
+def _coagir(nome, valor, tipo):
+    try:
+        if valor is None:
+            return None
+        if tipo == 'number':
+            return float(str(valor).replace(',', '.'))
+        if tipo == 'integer':
+            return int(float(str(valor).replace(',', '.')))
+        if tipo == 'boolean':
+            return valor if isinstance(valor, bool) else str(valor).strip().lower() in ('true', '1', 'sim')
+        if tipo == 'string':
+            return str(valor).strip()
+        return valor
+    except (TypeError, ValueError):
+        raise ErroArgumentos(f"Argumento '{nome}' inválido: esperado {tipo}, recebido {valor!r}")
+
+
+_REGISTRO = {}
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ferramenta-ia')
+
+
+def registrar(nome, funcao, descricao, parametros=None, **opcoes):
+    ferramenta = Ferramenta(nome, funcao, descricao, parametros, **opcoes)
+    _REGISTRO[nome] = ferramenta
+    return ferramenta
+
+
+def obter(nome):
+    return _REGISTRO.get(nome)
+
+
+def tool_gemini(nomes=None):
+    """Tool do Gemini com as declarações das ferramentas pedidas (todas, se `nomes` for None)."""
+    selecionadas = [_REGISTRO[n] for n in nomes] if nomes else list(_REGISTRO.values())
+    return Tool(function_declarations=[f.declaracao() for f in selecionadas])
+
+
+def chamadas_da_resposta(response):
+    """Todas as function_call da resposta (o Gemini pode pedir várias de uma vez)."""
+    if not response.candidates or not response.candidates[0].content.parts:
+        return []
+    return [part.function_call for part in response.candidates[0].content.parts if part.function_call]
+
+
+# ==============================================================================
+# 🧠 MEMOIZAÇÃO
+# ==============================================================================
+def _chave_memo(ferramenta, kwargs):
+    barbearia_id = kwargs.get('barbearia_id')
+    args = json.dumps(kwargs, sort_keys=True, default=str)
+    resumo = hashlib.sha1(args.encode('utf-8')).hexdigest()[:16]
+    return f"ferramenta:{ferramenta.nome}:{barbearia_id}:{versao_config(barbearia_id)}:{resumo}"
+
+
+def _ler_memo(ferramenta, kwargs):
+    if not ferramenta.memoizar:
+        return None
+    try:
+        return cache.get(_chave_memo(ferramenta, kwargs))
+    except Exception:
+        return None
+
+
+def _gravar_memo(ferramenta, kwargs, resultado):
+    if not ferramenta.memoizar:
+        return
+    try:
+        cache.set(_chave_memo(ferramenta, kwargs), resultado, timeout=ferramenta.memoizar)
+    except Exception as e:
+        logging.warning(f"Falha ao memoizar '{ferramenta.nome}': {e}")
+
+
+# ==============================================================================
+# 🚀 EXECUÇÃO
+# ==============================================================================
+def _chamar(ferramenta, kwargs):
+    inicio = time.perf_counter()
+    try:
+        return ferramenta.funcao(**kwargs)
+    finally:
+        metricas.observar('ferramenta_latencia_ms', (time.perf_counter() - inicio) * 1000, ferramenta=ferramenta.nome)
+
+
+def _chamar_em_contexto(app, ferramenta, kwargs):
+    # Cada thread do pool abre o próprio app context (e, com ele, a própria sessão do banco)
+    with app.app_context():
+        return _chamar(ferramenta, kwargs)
+
+
+def _resultado(ferramenta, obter_resultado, kwargs):
+    """Converte o retorno/erro da ferramenta na resposta que volta para a IA."""
+    try:
+        resultado = obter_resultado()
+    except TimeoutFuturo:
+        metricas.incrementar('ferramenta_chamadas', ferramenta=ferramenta.nome, resultado='timeout')
+        logging.error(f"⏱️ Ferramenta '{ferramenta.nome}' passou de {ferramenta.timeout}s.")
+        return {"error": "A consulta demorou demais. Tente novamente em instantes."}
+    except Exception as e:
+        metricas.incrementar('ferramenta_chamadas', ferramenta=ferramenta.nome, resultado='erro')
+        logging.error(f"Erro interno na ferramenta '{ferramenta.nome}': {e}", exc_info=True)
+        return {"error": "Erro interno ao executar a ferramenta."}
+    metricas.incrementar('ferramenta_chamadas', ferramenta=ferramenta.nome, resultado='ok')
+    _gravar_memo(ferramenta, kwargs, resultado)
+    return {"result": resultado}
+
+
+def executar(chamadas, barbearia_id, telefone, origem="IA"):
+    """
+    Executa as function_call de UMA resposta e devolve as function_response na mesma ordem,
+    para irem todas numa única mensagem (um round-trip só).
+    Leituras rodam em paralelo no pool (com timeout); escritas (agendar, cancelar,
+    bloquear, reservar) rodam depois, em série e na ordem pedida.
+    """
+    contexto = {'barbearia_id': barbearia_id, 'telefone': telefone}
+    respostas = [None] * len(chamadas)
+    leituras = []
+    escritas = []
+
+    for i, function_call in enumerate(chamadas):
+        nome = function_call.name
+        logging.info(f"{origem} solicitou a ferramenta '{nome}' com os argumentos: {dict(function_call.args)}")
+        ferramenta = _REGISTRO.get(nome)
+        if ferramenta is None:
+            logging.error(f"Erro: IA tentou chamar uma ferramenta desconhecida: {nome}")
+            metricas.incrementar('ferramenta_chamadas', ferramenta=nome, resultado='desconhecida')
+            respostas[i] = {"error": "Ferramenta não encontrada."}
+            continue
+        try:
+            kwargs = ferramenta.preparar(function_call.args, contexto)
+        except ErroArgumentos as e:
+            logging.warning(f"Ferramenta '{nome}': {e}")
+            metricas.incrementar('ferramenta_chamadas', ferramenta=nome, resultado='argumentos')
+            respostas[i] = {"error": str(e)}
+            continue
+
+        memo = _ler_memo(ferramenta, kwargs)
+        if memo is not None:
+            metricas.incrementar('ferramenta_chamadas', ferramenta=nome, resultado='memo')
+            respostas[i] = {"result": memo}
+        elif ferramenta.somente_leitura:
+            leituras.append((i, ferramenta, kwargs))
+        else:
+            escritas.append((i, ferramenta, kwargs))
+
+    if leituras:
+        app = current_app._get_current_object()
+        futuros = [(i, ferramenta, kwargs, _pool.submit(_chamar_em_contexto, app, ferramenta, kwargs))
+                   for i, ferramenta, kwargs in leituras]
+        for i, ferramenta, kwargs, futuro in futuros:
+            respostas[i] = _resultado(ferramenta, lambda: futuro.result(timeout=ferramenta.timeout), kwargs)
+
+    for i, ferramenta, kwargs in escritas:
+        respostas[i] = _resultado(ferramenta, lambda: _chamar(ferramenta, kwargs), kwargs)
+
+    return [
+        protos.Part(function_response=protos.FunctionResponse(name=function_call.name, response=resposta))
+        for function_call, resposta in zip(chamadas, respostas)
+    ]
@@ -0,0 +1,693 @@
+# app/services/fila_service.py
+# Fila durável de tarefas: os webhooks só validam e enfileiram; um pool de workers
+# (threads no próprio processo ou `flask worker` dedicado) executa a IA e envia a resposta.
+import os
+import json
+import uuid
+import time
+import heapq
+import itertools
+import socket
+import logging
+import threading
+from collections import defaultdict, deque
+
+from app.extensions import obter_redis
+from app.services import metricas
+
+FILA_PADRAO = 'mensagens'
+# Fila das entregas agendadas (digitação -> envio), separada para não esperar turnos da IA
+FILA_ENVIOS = 'envios'
+
+# Registro global: nome da tarefa -> função
+_TAREFAS = {}
+# Tarefas de conversa: recebem uma LISTA (lote) de dados, em ordem de chegada
+_TAREFAS_CONVERSA = {}
+
+
+def tarefa(nome):
+    """Decorator que registra uma função como tarefa executável pelos workers."""
+    def decorador(func):
+        _TAREFAS[nome] = func
+        return func
+    return decorador
+
+
+def tarefa_conversa(nome):
+    """
+    Decorator para tarefas executadas em série por conversa (ver enfileirar_conversa).
+    A função recebe `lote`: lista com os dados das mensagens agrupadas na janela.
+    """
+    def decorador(func):
+        _TAREFAS_CONVERSA[nome] = func
+        return func
+    return decorador
+
+
+# ==============================================================================
+# 🧠 BACKEND LOCAL (EM MEMÓRIA) - DEV / TESTES / SEM REDIS
+# ==============================================================================
+class FilaLocal:
+    """Fila em memória com a mesma interface da FilaRedis (não sobrevive a restart)."""
+
+    def __init__(self):
+        self._filas = defaultdict(deque)
+        self._ativas = set()
+        self._agendadas = defaultdict(list)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def enfileirar(self, fila, item):
+        with self._cond:
+            self._filas[fila].appendleft(item)
+            self._cond.notify()
+
+    def consumir(self, fila, timeout=5):
+        fim = time.monotonic() + timeout
+        with self._cond:
+            while not self._filas[fila]:
+                restante = fim - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._cond.wait(restante)
+            return self._filas[fila].pop()
+
+    def confirmar(self, fila, item):
+        pass
+
+    def mover_para_mortas(self, fila, item):
+        self._filas[f"{fila}:mortas"].appendleft(item)
+
+    def profundidade(self, fila):
+        return len(self._filas[fila])
+
+    def batimento(self):
+        pass
+
+    def recuperar_orfas(self, fila):
+        return 0
+
+    # --- Tarefas agendadas (heap por fila) ---
+    def agendar(self, fila, item, executar_em):
+        with self._cond:
+            heapq.heappush(self._agendadas[fila], (executar_em, next(self._seq), item))
+
+    def promover_vencidas(self, fila, agora):
+        promovidas = 0
+        with self._cond:
+            heap = self._agendadas[fila]
+            while heap and heap[0][0] <= agora:
+                self._filas[fila].appendleft(heapq.heappop(heap)[2])
+                promovidas += 1
+            if promovidas:
+                self._cond.notify_all()
+        return promovidas
+
+    # --- Caixa de mensagens por conversa ---
+    def caixa_adicionar(self, chave, item, ttl):
+        with self._cond:
+            self._filas[f"conversa:{chave}:msgs"].append(item)
+            if chave in self._ativas:
+                return False
+            self._ativas.add(chave)
+            return True
+
+    def caixa_ultimo(self, chave):
+        with self._cond:
+            msgs = self._filas[f"conversa:{chave}:msgs"]
+            return msgs[-1] if msgs else None
+
+    def caixa_drenar(self, chave):
+        with self._cond:
+            processando = self._filas[f"conversa:{chave}:processando"]
+            processando.extend(self._filas.pop(f"conversa:{chave}:msgs", deque()))
+            return list(processando)
+
+    def caixa_confirmar(self, chave, quantidade):
+        with self._cond:
+            processando = self._filas[f"conversa:{chave}:processando"]
+            for _ in range(min(quantidade, len(processando))):
+                processando.popleft()
+
+    def caixa_devolver(self, chave, itens):
+        with self._cond:
+            self._filas.pop(f"conversa:{chave}:processando", None)
+            self._filas[f"conversa:{chave}:msgs"].extendleft(reversed(itens))
+
+    def caixa_recuperar_orfas(self, ttl):
+        return []
+
+    def caixa_renovar(self, chave, ttl):
+        pass
+
+    def caixa_liberar(self, chave, ttl):
+        with self._cond:
+            if self._filas[f"conversa:{chave}:msgs"]:
+                return True
+            self._ativas.discard(chave)
+            return False
+
+
+# ==============================================================================
+# 🔴 BACKEND REDIS (CONFIÁVEL) - PRODUÇÃO
+# ==============================================================================
+class FilaRedis:
+    """
+    Fila confiável: LPUSH na pendente, BLMOVE atômico para a lista de processamento
+    do worker e LREM ao confirmar. Se o worker morrer, as tarefas em processamento
+    voltam para a fila quando o batimento dele expirar.
+    """
+    TTL_BATIMENTO = 30
+
+    # Move atomicamente as tarefas vencidas do ZSET de agendadas para a fila pendente
+    LUA_PROMOVER = """
+    local itens = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+    for _, item in ipairs(itens) do
+        redis.call('ZREM', KEYS[1], item)
+        redis.call('LPUSH', KEYS[2], item)
+    end
+    return #itens
+    """
+
+    # Move a caixa da conversa para a lista de processamento do worker (ordem preservada)
+    LUA_DRENAR = """
+    local n = redis.call('LLEN', KEYS[1])
+    for i = 1, n do
+        redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+    end
+    redis.call('EXPIRE', KEYS[2], 86400)
+    return redis.call('LRANGE', KEYS[2], 0, -1)
+    """
+
+    # Devolve a lista de processamento para a FRENTE da caixa (ordem preservada)
+    LUA_DEVOLVER = """
+    local n = 0
+    while redis.call('RPOPLPUSH', KEYS[1], KEYS[2]) do
+        n = n + 1
+    end
+    if n > 0 then
+        redis.call('EXPIRE', KEYS[2], 86400)
+    end
+    return n
+    """
+
+    def __init__(self, cliente):
+        self.r = cliente
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._promover = cliente.register_script(self.LUA_PROMOVER)
+        self._drenar = cliente.register_script(self.LUA_DRENAR)
+        self._devolver = cliente.register_script(self.LUA_DEVOLVER)
+
+    def _pendente(self, fila):
+        return f"fila:{fila}"
+
+    def _processando(self, fila, worker_id=None):
+        return f"fila:{fila}:processando:{worker_id or self.worker_id}"
+
+    def enfileirar(self, fila, item):
+        self.r.lpush(self._pendente(fila), item)
+
+    def consumir(self, fila, timeout=5):
+        try:
+            item = self.r.blmove(self._pendente(fila), self._processando(fila), timeout, 'RIGHT', 'LEFT')
+        except AttributeError:
+            item = self.r.brpoplpush(self._pendente(fila), self._processando(fila), timeout)
+        if item is None:
+            return None
+        return item.decode('utf-8') if isinstance(item, bytes) else item
+
+    def confirmar(self, fila, item):
+        self.r.lrem(self._processando(fila), 1, item)
+
+    def mover_para_mortas(self, fila, item):
+        self.r.lpush(f"fila:{fila}:mortas", item)
+
+    def profundidade(self, fila):
+        return self.r.llen(self._pendente(fila))
+
+    def batimento(self):
+        self.r.set(f"fila:worker:{self.worker_id}", "1", ex=self.TTL_BATIMENTO)
+
+    def recuperar_orfas(self, fila):
+        """Devolve para a fila as tarefas presas em workers sem batimento (mortos)."""
+        recuperadas = 0
+        prefixo = f"fila:{fila}:processando:"
+        for chave in self.r.scan_iter(match=f"{prefixo}*"):
+            chave = chave.decode('utf-8') if isinstance(chave, bytes) else chave
+            dono = chave[len(prefixo):]
+            if dono != self.worker_id and self.r.exists(f"fila:worker:{dono}"):
+                continue
+            while self.r.rpoplpush(chave, self._pendente(fila)) is not None:
+                recuperadas += 1
+        if recuperadas:
+            logging.warning(f"♻️ FILA '{fila}': {recuperadas} tarefa(s) órfã(s) devolvidas para a fila.")
+        return recuperadas
+
+    # --- Tarefas agendadas (ZSET com score = horário de execução) ---
+    def agendar(self, fila, item, executar_em):
+        self.r.zadd(f"fila:{fila}:agendadas", {item: executar_em})
+
+    def promover_vencidas(self, fila, agora):
+        return int(self._promover(keys=[f"fila:{fila}:agendadas", self._pendente(fila)], args=[agora]) or 0)
+
+    # --- Caixa de mensagens por conversa ---
+    # conversa:{chave}:msgs                   -> lista (ordem de chegada)
+    # conversa:{chave}:ativa                  -> flag: existe um worker dono desta conversa
+    # conversa:{chave}:processando:{worker}   -> mensagens drenadas ainda não confirmadas
+    def _caixa_processando(self, chave, worker_id=None):
+        return f"conversa:{chave}:processando:{worker_id or self.worker_id}"
+
+    def caixa_adicionar(self, chave, item, ttl):
+        pipe = self.r.pipeline()
+        pipe.rpush(f"conversa:{chave}:msgs", item)
+        pipe.expire(f"conversa:{chave}:msgs", 86400)
+        pipe.set(f"conversa:{chave}:ativa", self.worker_id, ex=ttl, nx=True)
+        return bool(pipe.execute()[2])
+
+    def caixa_ultimo(self, chave):
+        item = self.r.lindex(f"conversa:{chave}:msgs", -1)
+        return item.decode('utf-8') if isinstance(item, bytes) else item
+
+    def caixa_drenar(self, chave):
+        """Passa a caixa para a lista de processamento deste worker; só sai de lá em caixa_confirmar."""
+        itens = self._drenar(keys=[f"conversa:{chave}:msgs", self._caixa_processando(chave)]) or []
+        return [i.decode('utf-8') if isinstance(i, bytes) else i for i in itens]
+
+    def caixa_confirmar(self, chave, quantidade):
+        """Remove as `quantidade` primeiras mensagens em processamento (lote concluído)."""
+        self.r.ltrim(self._caixa_processando(chave), quantidade, -1)
+
+    def caixa_devolver(self, chave, itens):
+        """Troca o que está em processamento por `itens`, de volta na frente da caixa (MULTI)."""
+        pipe = self.r.pipeline()
+        if itens:
+            pipe.lpush(f"conversa:{chave}:msgs", *reversed(itens))
+            pipe.expire(f"conversa:{chave}:msgs", 86400)
+        pipe.delete(self._caixa_processando(chave))
+        pipe.execute()
+
+    def caixa_recuperar_orfas(self, ttl):
+        """
+        Devolve para a caixa as mensagens em processamento de workers sem batimento (mortos).
+        Retorna as conversas que ficaram sem dono e que este worker assumiu (precisam de drenagem).
+        """
+        retomar = []
+        for chave_processando in self.r.scan_iter(match="conversa:*:processando:*"):
+            if isinstance(chave_processando, bytes):
+                chave_processando = chave_processando.decode('utf-8')
+            chave, dono = chave_processando[len("conversa:"):].rsplit(":processando:", 1)
+            if dono != self.worker_id and self.r.exists(f"fila:worker:{dono}"):
+                continue
+            if not self._devolver(keys=[chave_processando, f"conversa:{chave}:msgs"]):
+                continue
+            dono_ativa = self.r.get(f"conversa:{chave}:ativa")
+            if isinstance(dono_ativa, bytes):
+                dono_ativa = dono_ativa.decode('utf-8')
+            if dono_ativa and dono_ativa != self.worker_id and self.r.exists(f"fila:worker:{dono_ativa}"):
+                continue  # um worker vivo já cuida desta conversa e vai drenar o que voltou
+            self.r.set(f"conversa:{chave}:ativa", self.worker_id, ex=ttl)
+            retomar.append(chave)
+        if retomar:
+            logging.warning(f"♻️ CONVERSAS: {len(retomar)} conversa(s) órfã(s) devolvidas para a caixa.")
+        return retomar
+
+    def caixa_renovar(self, chave, ttl):
+        self.r.expire(f"conversa:{chave}:ativa", ttl)
+
+    def caixa_liberar(self, chave, ttl):
+        """Solta a conversa. Se chegou mensagem no meio tempo, retoma a posse (True)."""
+        self.r.delete(f"conversa:{chave}:ativa")
+        if self.r.llen(f"conversa:{chave}:msgs") == 0:
+            return False
+        return bool(self.r.set(f"conversa:{chave}:ativa", self.worker_id, ex=ttl, nx=True))
+
+
+# ==============================================================================
+# ⚙️ SELEÇÃO DO BACKEND
+# ==============================================================================
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obter_backend(app=None):
+    """FILA_BACKEND = 'redis' | 'local' | 'auto' (redis se houver REDIS_URL, senão local)."""
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            config = app.config if app is not None else {}
+            escolha = str(config.get('FILA_BACKEND', 'auto')).lower()
+            cliente = obter_redis() if escolha in ('redis', 'auto') else None
+            if cliente is not None:
+                _backend = FilaRedis(cliente)
+                logging.info("📦 FILA: backend Redis ativo.")
+            else:
+                if escolha == 'redis':
+                    logging.error("❌ FILA: FILA_BACKEND=redis mas REDIS_URL não está configurada. Usando fila local.")
+                _backend = FilaLocal()
+                logging.info("📦 FILA: backend local (memória) ativo.")
+    return _backend
+
+
+def enfileirar(nome_tarefa, fila=FILA_PADRAO, **dados):
+    """
+    Enfileira uma tarefa e retorna o ID. Os dados precisam ser serializáveis em JSON
+    (passe IDs, não objetos do banco). Deve ser chamado dentro de um app context.
+    """
+    from flask import current_app
+    app = current_app._get_current_object()
+
+    item = json.dumps({
+        'id': uuid.uuid4().hex,
+        'tarefa': nome_tarefa,
+        'dados': dados,
+        'enfileirada_em': time.time(),
+        'tentativas': 0,
+    }, ensure_ascii=False)
+
+    backend = obter_backend(app)
+    backend.enfileirar(fila, item)
+    metricas.incrementar('fila_enfileiradas', fila=fila, tarefa=nome_tarefa)
+
+    if app.config.get('FILA_WORKERS_EMBUTIDOS', True):
+        iniciar_workers(app, filas=[fila])
+    return item
+
+
+def agendar_em(nome_tarefa, executar_em, fila=FILA_PADRAO, **dados):
+    """
+    Agenda a tarefa para rodar no horário `executar_em` (epoch, segundos) sem prender
+    nenhuma thread até lá: um promotor move as vencidas para a fila pendente.
+    """
+    from flask import current_app
+    app = current_app._get_current_object()
+
+    item = json.dumps({
+        'id': uuid.uuid4().hex,
+        'tarefa': nome_tarefa,
+        'dados': dados,
+        'enfileirada_em': executar_em,
+        'tentativas': 0,
+    }, ensure_ascii=False)
+
+    obter_backend(app).agendar(fila, item, executar_em)
+    metricas.incrementar('fila_agendadas', fila=fila, tarefa=nome_tarefa)
+
+    if app.config.get('FILA_WORKERS_EMBUTIDOS', True):
+        iniciar_workers(app, filas=[fila])
+    return item
+
+
+def agendar(nome_tarefa, atraso, fila=FILA_PADRAO, **dados):
+    """Atalho: agenda a tarefa para daqui a `atraso` segundos."""
+    return agendar_em(nome_tarefa, time.time() + max(0, atraso), fila=fila, **dados)
+
+
+# ==============================================================================
+# 💬 EXECUÇÃO EM SÉRIE POR CONVERSA (substitui o time.sleep do anti-metralhadora)
+# ==============================================================================
+TTL_CONVERSA_ATIVA = 300
+
+
+def enfileirar_conversa(chave, nome_tarefa, fila=FILA_PADRAO, **dados):
+    """
+    Coloca a mensagem na caixa da conversa `chave` (ex: "8:5511999999999").
+    Mensagens de uma mesma conversa são processadas estritamente em ordem, por um
+    único worker por vez; conversas diferentes rodam em paralelo.
+    """
+    from flask import current_app
+    app = current_app._get_current_object()
+
+    item = json.dumps({
+        'tarefa': nome_tarefa,
+        'dados': dados,
+        'enfileirada_em': time.time(),
+        'tentativas': 0,
+    }, ensure_ascii=False)
+
+    backend = obter_backend(app)
+    if backend.caixa_adicionar(chave, item, TTL_CONVERSA_ATIVA):
+        # Ninguém cuidando desta conversa: agenda um worker para drená-la
+        enfileirar('conversa.drenar', fila=fila, chave=chave, fila_conversa=fila)
+    else:
+        metricas.incrementar('conversa_mensagens_em_espera', fila=fila)
+
+
+def _espera_da_janela(backend, chave, janela, janela_max, desde, agora):
+    """Segundos até a última mensagem ter `janela` de silêncio (limitado a `janela_max` desde `desde`)."""
+    if janela <= 0:
+        return 0
+    ultimo = backend.caixa_ultimo(chave)
+    if not ultimo:
+        return 0
+    try:
+        chegada = json.loads(ultimo).get('enfileirada_em', agora)
+    except ValueError:
+        return 0
+    return min(chegada + janela, desde + janela_max) - agora
+
+
+def _agrupar_lotes(chave, itens):
+    """[(tarefa, [(bruto, item)])]: mensagens consecutivas do mesmo tipo viram um único lote."""
+    lotes = []
+    for bruto in itens:
+        try:
+            item = json.loads(bruto)
+        except ValueError:
+            logging.error(f"❌ CONVERSA {chave}: item inválido descartado.")
+            lotes.append((None, [(bruto, None)]))
+            continue
+        if lotes and lotes[-1][0] == item['tarefa']:
+            lotes[-1][1].append((bruto, item))
+        else:
+            lotes.append((item['tarefa'], [(bruto, item)]))
+    return lotes
+
+
+@tarefa('conversa.drenar')
+def _drenar_conversa(chave, fila_conversa=FILA_PADRAO, aguardando_desde=None):
+    """
+    Drena a caixa da conversa. As mensagens ficam na lista de processamento do worker até
+    o lote terminar (worker morto -> recuperar_orfas as devolve); lote com erro volta para
+    a frente da caixa e é tentado de novo até FILA_MAX_TENTATIVAS, depois vai para as mortas.
+    """
+    from flask import current_app
+    config = current_app.config
+    janela = float(config.get('CONVERSA_JANELA_AGRUPAMENTO', 1.5))
+    janela_max = float(config.get('CONVERSA_JANELA_MAXIMA', 6))
+    max_tentativas = int(config.get('FILA_MAX_TENTATIVAS', 3))
+    backend = obter_backend(current_app)
+    agora = time.time()
+    pendentes = []
+
+    try:
+        # Janela de agrupamento: em vez de prender o worker dormindo, reagenda a drenagem
+        desde = aguardando_desde or agora
+        espera = _espera_da_janela(backend, chave, janela, janela_max, desde, agora)
+        if espera > 0:
+            backend.caixa_renovar(chave, TTL_CONVERSA_ATIVA)
+            agendar_em('conversa.drenar', agora + espera, fila=fila_conversa,
+                       chave=chave, fila_conversa=fila_conversa, aguardando_desde=desde)
+            return
+
+        pendentes = backend.caixa_drenar(chave)
+        lotes = _agrupar_lotes(chave, pendentes)
+
+        for indice, (nome, itens) in enumerate(lotes):
+            func = _TAREFAS_CONVERSA.get(nome)
+            if nome is not None and func is None:
+                logging.error(f"❌ CONVERSA {chave}: tarefa '{nome}' não registrada. Movida para mortas.")
+                for _, item in itens:
+                    backend.mover_para_mortas(fila_conversa, json.dumps(dict(item, chave=chave), ensure_ascii=False))
+            elif func is not None:
+                lote = [item['dados'] for _, item in itens]
+                metricas.observar('conversa_lote_tamanho', len(lote), tarefa=nome)
+                if len(lote) > 1:
+                    metricas.incrementar('conversa_mensagens_agrupadas', len(lote) - 1, tarefa=nome)
+                try:
+                    with metricas.cronometro('conversa_lote_ms', tarefa=nome):
+                        func(lote=lote)
+                except Exception as e:
+                    metricas.incrementar('conversa_erros', tarefa=nome)
+                    tentativas = max(item.get('tentativas', 0) for _, item in itens) + 1
+                    falhas = [json.dumps(dict(item, tentativas=tentativas), ensure_ascii=False) for _, item in itens]
+                    if tentativas < max_tentativas:
+                        logging.error(f"❌ CONVERSA {chave}: erro no lote '{nome}' (tentativa {tentativas}): {e}", exc_info=True)
+                        # O lote e os seguintes voltam para a frente da caixa: a ordem da conversa se mantém
+                        backend.caixa_devolver(chave, falhas + [bruto for _, resto in lotes[indice + 1:] for bruto, _ in resto])
+                        pendentes = []
+                        enfileirar('conversa.drenar', fila=fila_conversa, chave=chave, fila_conversa=fila_conversa)
+                        return
+                    logging.error(f"💀 CONVERSA {chave}: lote '{nome}' descartado após {tentativas} tentativas: {e}", exc_info=True)
+                    for _, item in itens:
+                        morta = dict(item, tentativas=tentativas, chave=chave)
+                        backend.mover_para_mortas(fila_conversa, json.dumps(morta, ensure_ascii=False))
+            backend.caixa_confirmar(chave, len(itens))
+            pendentes = pendentes[len(itens):]
+            backend.caixa_renovar(chave, TTL_CONVERSA_ATIVA)
+
+        # Chegou mensagem durante o processamento: outra rodada (com nova janela), sem segurar o worker
+        if backend.caixa_liberar(chave, TTL_CONVERSA_ATIVA):
+            enfileirar('conversa.drenar', fila=fila_conversa, chave=chave, fila_conversa=fila_conversa)
+    except Exception as e:
+        # Não perde nem trava a conversa: devolve o que não terminou e solta a posse
+        # (ou reagenda se ainda há mensagens). Se o backend também falhar aqui, a exceção
+        # sobe e a retentativa da fila refaz a drenagem.
+        if pendentes:
+            backend.caixa_devolver(chave, pendentes)
+        if backend.caixa_liberar(chave, TTL_CONVERSA_ATIVA):
+            enfileirar('conversa.drenar', fila=fila_conversa, chave=chave, fila_conversa=fila_conversa)
+        # Conversa já entregue: não sobe a exceção, senão a fila reenfileiraria uma SEGUNDA
+        # drenagem da mesma conversa (duas em paralelo quebram a ordem e duplicam a IA)
+        metricas.incrementar('conversa_erros', tarefa='conversa.drenar')
+        logging.error(f"❌ CONVERSA {chave}: drenagem interrompida ({e}); mensagens devolvidas para a caixa.", exc_info=True)
+
+
+# ==============================================================================
+# 👷 POOL DE WORKERS
+# ==============================================================================
+class PoolWorkers:
+    def __init__(self, app, filas, qtd):
+        self.app = app
+        self.filas = filas
+        self.qtd = qtd
+        self.max_tentativas = int(app.config.get('FILA_MAX_TENTATIVAS', 3))
+        self._parar = threading.Event()
+        self._threads = []
+
+    def iniciar(self):
+        backend = obter_backend(self.app)
+        for fila in self.filas:
+            try:
+                backend.batimento()
+                backend.recuperar_orfas(fila)
+                if fila == FILA_PADRAO:
+                    # Conversas cujo worker morreu no meio de um lote: mensagens voltam para a caixa
+                    with self.app.app_context():
+                        for chave in backend.caixa_recuperar_orfas(TTL_CONVERSA_ATIVA):
+                            enfileirar('conversa.drenar', fila=fila, chave=chave, fila_conversa=fila)
+            except Exception as e:
+                logging.error(f"Erro ao recuperar tarefas órfãs da fila '{fila}': {e}")
+            for i in range(self.qtd):
+                t = threading.Thread(target=self._loop, args=(fila,), name=f"worker-{fila}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._loop_promotor, args=(fila,), name=f"promotor-{fila}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logging.info(f"👷 WORKERS: {self.qtd} thread(s) por fila iniciadas em {self.filas}.")
+
+    def parar(self):
+        self._parar.set()
+
+    def aguardar(self):
+        for t in self._threads:
+            t.join()
+
+    def _loop(self, fila):
+        backend = obter_backend(self.app)
+        while not self._parar.is_set():
+            try:
+                backend.batimento()
+                metricas.definir('fila_profundidade', backend.profundidade(fila), fila=fila)
+                item = backend.consumir(fila, timeout=5)
+            except Exception as e:
+                logging.error(f"Erro ao consumir fila '{fila}': {e}")
+                time.sleep(2)
+                continue
+            if item is None:
+                continue
+            try:
+                self._executar(backend, fila, item)
+            except Exception as e:
+                # Falha do backend (ex.: Redis caiu no reenfileiramento/confirmação): a tarefa fica
+                # na lista de processamento (recuperar_orfas a devolve) e a thread segue viva
+                logging.error(f"Erro ao finalizar tarefa da fila '{fila}': {e}", exc_info=True)
+                time.sleep(2)
+
+    def _loop_promotor(self, fila):
+        """Libera as tarefas agendadas cujo horário já chegou (resolução de ~100ms)."""
+        backend = obter_backend(self.app)
+        while not self._parar.is_set():
+            try:
+                if not backend.promover_vencidas(fila, time.time()):
+                    self._parar.wait(0.1)
+            except Exception as e:
+                logging.error(f"Erro ao promover tarefas agendadas da fila '{fila}': {e}")
+                self._parar.wait(2)
+
+    def _executar(self, backend, fila, item):
+        try:
+            tarefa_json = json.loads(item)
+        except ValueError:
+            logging.error(f"❌ FILA '{fila}': item inválido descartado: {item[:200]}")
+            backend.confirmar(fila, item)
+            return
+
+        nome = tarefa_json.get('tarefa')
+        metricas.observar('fila_espera_ms', (time.time() - tarefa_json.get('enfileirada_em', time.time())) * 1000, fila=fila)
+
+        func = _TAREFAS.get(nome)
+        if func is None:
+            logging.error(f"❌ FILA '{fila}': tarefa '{nome}' não registrada. Movida para mortas.")
+            backend.mover_para_mortas(fila, item)
+            backend.confirmar(fila, item)
+            return
+
+        inicio = time.perf_counter()
+        try:
+            with self.app.app_context():
+                func(**tarefa_json.get('dados', {}))
+            metricas.incrementar('fila_processadas', fila=fila, tarefa=nome)
+        except Exception as e:
+            metricas.incrementar('fila_erros', fila=fila, tarefa=nome)
+            tarefa_json['tentativas'] = tarefa_json.get('tentativas', 0) + 1
+            if tarefa_json['tentativas'] < self.max_tentativas:
+                logging.error(f"❌ Tarefa '{nome}' falhou (tentativa {tarefa_json['tentativas']}): {e}", exc_info=True)
+                backend.enfileirar(fila, json.dumps(tarefa_json, ensure_ascii=False))
+            else:
+                logging.error(f"💀 Tarefa '{nome}' descartada após {tarefa_json['tentativas']} tentativas: {e}", exc_info=True)
+                backend.mover_para_mortas(fila, json.dumps(tarefa_json, ensure_ascii=False))
+        finally:
+            metricas.observar('fila_execucao_ms', (time.perf_counter() - inicio) * 1000, fila=fila, tarefa=nome)
+            backend.confirmar(fila, item)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def iniciar_workers(app, filas=None, qtd=None):
+    """Inicia (uma única vez por processo e por fila) o pool de threads consumidoras."""
+    filas = [f for f in (filas or [FILA_PADRAO]) if f not in _pools]
+    if not filas:
+        return None
+    with _pools_lock:
+        filas = [f for f in filas if f not in _pools]
+        if not filas:
+            return None
+        _registrar_tarefas()
+        pool = PoolWorkers(app, filas, qtd or int(app.config.get('FILA_WORKERS', 4)))
+        for f in filas:
+            _pools[f] = pool
+        pool.iniciar()
+        return pool
+
+
+def _registrar_tarefas():
+    # Importa os módulos que registram tarefas via @tarefa
+    from app.services import processamento_mensagens  # noqa: F401
+    from app.services import waha_service  # noqa: F401
+
+
+def metricas_filas(app=None, filas=None):
+    """Profundidade atual de cada fila conhecida (para o painel de métricas)."""
+    backend = obter_backend(app)
+    resultado = {}
+    for fila in (filas or [FILA_PADRAO, FILA_ENVIOS]):
+        try:
+            resultado[fila] = backend.profundidade(fila)
+        except Exception as e:
+            resultado[fila] = f"erro: {e}"
+    return resultado
@@ -0,0 +1,398 @@
+# app/services/historico_service.py
+# Armazenamento do histórico de conversa do Gemini.
+# - Uma lista Redis por conversa, um item por turno: cada turno novo é só anexado (RPUSH),
+#   sem reescrever a conversa inteira.
+# - Turnos codificados em msgpack (ou JSON, se msgpack não estiver instalado) + zlib.
+# - Textos grandes e repetidos (ex: o system prompt no primeiro turno) são gravados uma
+#   única vez, endereçados pelo hash, e o turno guarda só a referência.
+# - Conversas longas são compactadas (janela de turnos recentes + resumo corrido).
+import json
+import zlib
+import hashlib
+import logging
+
+from cachetools import LRUCache
+from flask import current_app
+from google.generativeai.protos import Content
+from google.generativeai import protos
+
+from app.extensions import cache, obter_redis
+from app.services import metricas
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# No turno 0 (base de conhecimento / system prompt), textos acima deste tamanho viram referência
+LIMITE_REFERENCIA = 1024
+# Blobs vivem bem mais que o histórico (que expira por inatividade)
+TTL_BLOB = 7 * 24 * 3600
+# Só comprime quando compensa
+LIMITE_COMPRESSAO = 256
+
+_blobs_locais = LRUCache(maxsize=256)
+
+
+# ==============================================================================
+# 🔄 CONVERSÃO Content <-> dict
+# ==============================================================================
+def content_para_dict(content):
+    """Converte um Content (texto, FunctionCall, FunctionResponse) em dict serializável."""
+    partes = []
+    for part in content.parts:
+        if part.text:
+            partes.append({'text': part.text})
+        elif part.function_call:
+            partes.append({'function_call': protos.FunctionCall.to_dict(part.function_call)})
+        elif part.function_response:
+            partes.append({'function_response': protos.FunctionResponse.to_dict(part.function_response)})
+    return {'role': content.role, 'parts': partes}
+
+
+def dict_para_content(item):
+    partes = []
+    for part_data in item.get('parts', []):
+        if 'text' in part_data:
+            partes.append(protos.Part(text=part_data['text']))
+        elif 'function_call' in part_data:
+            partes.append(protos.Part(function_call=protos.FunctionCall(part_data['function_call'])))
+        elif 'function_response' in part_data:
+            partes.append(protos.Part(function_response=protos.FunctionResponse(part_data['function_response'])))
+    return Content(role=item.get('role'), parts=partes)
+
+
+# ==============================================================================
+# 📦 CODIFICAÇÃO COMPACTA
+# ==============================================================================
+def _codificar(obj):
+    if msgpack is not None:
+        bruto = b'M' + msgpack.packb(obj, use_bin_type=True)
+    else:
+        bruto = b'J' + json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(bruto) > LIMITE_COMPRESSAO:
+        return b'Z' + zlib.compress(bruto, 6)
+    return bruto
+
+
+def _decodificar(dados):
+    if dados[:1] == b'Z':
+        dados = zlib.decompress(dados[1:])
+    if dados[:1] == b'M':
+        if msgpack is None:
+            raise ValueError("Histórico gravado em msgpack, mas o pacote não está instalado.")
+        return msgpack.unpackb(dados[1:], raw=False)
+    return json.loads(dados[1:].decode('utf-8'))
+
+
+# ==============================================================================
+# 🗄️ ARMAZÉNS (REDIS NATIVO OU FLASK-CACHING COMO FALLBACK)
+# ==============================================================================
+class _ArmazemRedis:
+    def __init__(self, cliente):
+        self.r = cliente
+
+    def ler(self, chave):
+        return self.r.lrange(chave, 0, -1) or []
+
+    def anexar(self, chave, itens, ttl):
+        pipe = self.r.pipeline()
+        pipe.rpush(chave, *itens)
+        pipe.expire(chave, ttl)
+        pipe.execute()
+
+    def reescrever(self, chave, itens, ttl):
+        pipe = self.r.pipeline()
+        pipe.delete(chave)
+        if itens:
+            pipe.rpush(chave, *itens)
+            pipe.expire(chave, ttl)
+        pipe.execute()
+
+    def apagar(self, chave):
+        self.r.delete(chave)
+
+    def ler_blob(self, chave):
+        pipe = self.r.pipeline()
+        pipe.get(chave)
+        pipe.expire(chave, TTL_BLOB)
+        return pipe.execute()[0]
+
+    def gravar_blob(self, chave, dados):
+        self.r.set(chave, dados, ex=TTL_BLOB, nx=True)
+
+
+class _ArmazemCache:
+    """Sem Redis direto: usa o Flask-Caching (reescreve a lista, mas mantém a codificação compacta)."""
+
+    def ler(self, chave):
+        return cache.get(chave) or []
+
+    def anexar(self, chave, itens, ttl):
+        cache.set(chave, self.ler(chave) + list(itens), timeout=ttl)
+
+    def reescrever(self, chave, itens, ttl):
+        cache.set(chave, list(itens), timeout=ttl)
+
+    def apagar(self, chave):
+        cache.delete(chave)
+
+    def ler_blob(self, chave):
+        return cache.get(chave)
+
+    def gravar_blob(self, chave, dados):
+        cache.set(chave, dados, timeout=TTL_BLOB)
+
+
+def _armazem():
+    cliente = obter_redis()
+    return _ArmazemRedis(cliente) if cliente is not None else _ArmazemCache()
+
+
+def _ttl():
+    return int(current_app.config.get('CACHE_DEFAULT_TIMEOUT', 3600))
+
+
+def _chave_lista(chave):
+    return f"hist:{chave}"
+
+
+# ==============================================================================
+# 🔗 DEDUPLICAÇÃO DE TEXTOS GRANDES
+# ==============================================================================
+def _turno_para_bytes(armazem, content, referenciar=False):
+    """`referenciar`: troca textos grandes pelo hash (só para o turno do system prompt,
+    que é igual em todas as conversas da loja; os demais turnos são únicos)."""
+    item = content_para_dict(content)
+    for part in item['parts']:
+        texto = part.get('text')
+        if referenciar and texto and len(texto) > LIMITE_REFERENCIA:
+            h = hashlib.sha1(texto.encode('utf-8')).hexdigest()
+            armazem.gravar_blob(f"hist:blob:{h}", zlib.compress(texto.encode('utf-8'), 6))
+            _blobs_locais[h] = texto
+            del part['text']
+            part['ref'] = h
+    return _codificar(item)
+
+
+def _bytes_para_turno(armazem, dados):
+    item = _decodificar(dados)
+    for part in item.get('parts', []):
+        h = part.pop('ref', None)
+        if h is None:
+            continue
+        texto = _blobs_locais.get(h)
+        if texto is None:
+            blob = armazem.ler_blob(f"hist:blob:{h}")
+            if blob is None:
+                raise KeyError(f"Blob de histórico {h} expirou.")
+            texto = zlib.decompress(blob).decode('utf-8')
+            _blobs_locais[h] = texto
+        part['text'] = texto
+    return dict_para_content(item)
+
+
+# ==============================================================================
+# 🧩 API PÚBLICA
+# ==============================================================================
+def carregar(chave):
+    """
+    Retorna a lista de Content da conversa `chave` (ex: "chat_history_{cliente}:{loja}").
+    Migra automaticamente o formato antigo (JSON inteiro em `cache.set`).
+    """
+    armazem = _armazem()
+    try:
+        itens = armazem.ler(_chave_lista(chave))
+        if itens:
+            return [_bytes_para_turno(armazem, i) for i in itens]
+    except Exception as e:
+        logging.warning(f"⚠️ Histórico '{chave}' ilegível ({e}). Iniciando nova sessão.")
+        armazem.apagar(_chave_lista(chave))
+        return []
+
+    # Formato legado: string JSON com a conversa inteira
+    legado = cache.get(chave)
+    if not legado:
+        return []
+    try:
+        historico = [dict_para_content(i) for i in json.loads(legado)]
+    except (ValueError, TypeError):
+        logging.warning("Dados de cache de histórico inválidos ou corrompidos.")
+        return []
+    reescrever(chave, historico)
+    cache.delete(chave)
+    logging.info(f"♻️ Histórico '{chave}' migrado para o formato incremental ({len(historico)} turnos).")
+    return historico
+
+
+def anexar(chave, historico, ja_salvos):
+    """
+    Persiste só os turnos novos (historico[ja_salvos:]). `ja_salvos` é o tamanho do
+    histórico retornado por `carregar`. Se o histórico encolheu, reescreve tudo.
+    """
+    if len(historico) < ja_salvos:
+        return reescrever(chave, historico)
+    novos = historico[ja_salvos:]
+    if not novos:
+        return 0
+    armazem = _armazem()
+    itens = [_turno_para_bytes(armazem, c, referenciar=(ja_salvos + i == 0)) for i, c in enumerate(novos)]
+    armazem.anexar(_chave_lista(chave), itens, _ttl())
+    gravados = sum(len(i) for i in itens)
+    metricas.incrementar('historico_bytes_gravados', gravados, modo='anexar')
+    return gravados
+
+
+def reescrever(chave, historico):
+    """Regrava a conversa inteira (usar quando turnos antigos foram alterados/removidos)."""
+    armazem = _armazem()
+    itens = [_turno_para_bytes(armazem, c, referenciar=(i == 0)) for i, c in enumerate(historico)]
+    armazem.reescrever(_chave_lista(chave), itens, _ttl())
+    gravados = sum(len(i) for i in itens)
+    metricas.incrementar('historico_bytes_gravados', gravados, modo='reescrever')
+    return gravados
+
+
+def apagar(chave):
+    """Apaga a conversa (comando reset / auto-recuperação). Inclui a chave legada."""
+    _armazem().apagar(_chave_lista(chave))
+    cache.delete(chave)
+
+
+# ==============================================================================
+# ✂️ COMPACTAÇÃO (JANELA DE TURNOS + RESUMO CORRIDO + ORÇAMENTO DE TOKENS)
+# ==============================================================================
+MARCADOR_BASE = "[BASE DE CONHECIMENTO"
+MARCADOR_RESUMO = "[RESUMO DA CONVERSA ANTERIOR]"
+CONFIRMACAO_RESUMO = "Ok! Vou considerar este resumo para continuar o atendimento."
+# Tamanho máximo do resumo corrido (as linhas mais antigas saem primeiro)
+MAX_CHARS_RESUMO = 2400
+
+
+def _texto_do_turno(content):
+    return "".join(p.text for p in content.parts if p.text)
+
+
+def estimar_tokens(content):
+    """Estimativa barata (1 token ≈ 4 caracteres), a mesma usada no painel financeiro."""
+    total = 0
+    for part in content.parts:
+        if part.text:
+            total += len(part.text)
+        elif part.function_call:
+            total += len(str(protos.FunctionCall.to_dict(part.function_call)))
+        elif part.function_response:
+            total += len(str(protos.FunctionResponse.to_dict(part.function_response)))
+    return total // 4
+
+
+def _inicio_de_turno_do_cliente(content):
+    """Ponto seguro de corte: mensagem de texto do cliente (nunca no meio de call/response)."""
+    if content.role != 'user':
+        return False
+    return any(p.text for p in content.parts) and not any(p.function_response for p in content.parts)
+
+
+def _encurtar(texto, limite):
+    texto = " ".join(str(texto).split())
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+
+def _linhas_resumo(content):
+    linhas = []
+    for part in content.parts:
+        if part.text:
+            quem = "Cliente" if content.role == 'user' else "Assistente"
+            linhas.append(f"{quem}: {_encurtar(part.text, 160)}")
+        elif part.function_call:
+            args = protos.FunctionCall.to_dict(part.function_call).get('args', {})
+            linhas.append(f"[Ferramenta {part.function_call.name}({_encurtar(args, 100)})]")
+        elif part.function_response:
+            resp = protos.FunctionResponse.to_dict(part.function_response).get('response', {})
+            linhas.append(f"[Resultado {part.function_response.name}: {_encurtar(resp, 120)}]")
+    return linhas
+
+
+def separar_base(historico):
+    """Separa os turnos fixos da base de conhecimento (cópia do system prompt) do resto da conversa."""
+    if historico and historico[0].role == 'user' and _texto_do_turno(historico[0]).startswith(MARCADOR_BASE):
+        return historico[:2], historico[2:]
+    return [], historico
+
+
+def compactar(historico, limite_tokens, turnos_recentes):
+    """
+    Mantém os turnos fixos (base de conhecimento), os últimos `turnos_recentes` turnos
+    na íntegra e dobra os mais antigos num resumo corrido determinístico (sem chamar a IA).
+    Só compacta quando a conversa passa do dobro da janela ou do orçamento de tokens
+    (histerese: evita regravar a lista a cada mensagem).
+
+    Retorna (historico, tokens_antes, tokens_depois) — tokens da parte variável da conversa.
+    """
+    fixos, _ = separar_base(historico)
+    i = len(fixos)
+
+    resumo_anterior = ""
+    if len(historico) > i and _texto_do_turno(historico[i]).startswith(MARCADOR_RESUMO):
+        resumo_anterior = _texto_do_turno(historico[i])[len(MARCADOR_RESUMO):].strip()
+        i += 2
+    turnos_resumo = historico[len(fixos):i]
+    conversa = historico[i:]
+
+    tokens_conversa = [estimar_tokens(c) for c in conversa]
+    tokens_antes = sum(estimar_tokens(c) for c in turnos_resumo) + sum(tokens_conversa)
+
+    if len(conversa) <= 2 * turnos_recentes and tokens_antes <= limite_tokens:
+        return historico, tokens_antes, tokens_antes
+
+    # Pontos de corte possíveis (nunca corta o último turno do cliente)
+    cortes = [j for j, c in enumerate(conversa) if j > 0 and _inicio_de_turno_do_cliente(c)]
+    if not cortes:
+        return historico, tokens_antes, tokens_antes
+
+    # Primeiro corte que deixa no máximo `turnos_recentes` turnos...
+    corte = next((j for j in cortes if len(conversa) - j <= turnos_recentes), cortes[-1])
+    # ...e que cabe no orçamento (reserva ~20% para o resumo), se possível
+    for j in cortes:
+        if j >= corte and sum(tokens_conversa[j:]) <= limite_tokens * 0.8:
+            corte = j
+            break
+    else:
+        corte = cortes[-1]
+
+    linhas = resumo_anterior.splitlines() if resumo_anterior else []
+    for c in conversa[:corte]:
+        linhas.extend(_linhas_resumo(c))
+    while linhas and len("\n".join(linhas)) > MAX_CHARS_RESUMO:
+        linhas.pop(0)
+
+    novos_turnos_resumo = [
+        Content(role='user', parts=[protos.Part(text=f"{MARCADOR_RESUMO}\n" + "\n".join(linhas))]),
+        Content(role='model', parts=[protos.Part(text=CONFIRMACAO_RESUMO)]),
+    ]
+    novo_historico = fixos + novos_turnos_resumo + conversa[corte:]
+    tokens_depois = sum(estimar_tokens(c) for c in novos_turnos_resumo) + sum(tokens_conversa[corte:])
+    return novo_historico, tokens_antes, tokens_depois
+
+
+def compactar_se_preciso(chave, historico, limite_tokens=None, turnos_recentes=None):
+    """
+    Aplica `compactar` com o orçamento da loja (ou o padrão do config) e, se houve
+    compactação, regrava a conversa. Retorna o histórico a ser usado no start_chat.
+    """
+    config = current_app.config
+    limite_tokens = int(limite_tokens or config.get('HISTORICO_LIMITE_TOKENS', 6000))
+    turnos_recentes = int(turnos_recentes or config.get('HISTORICO_TURNOS_RECENTES', 12))
+
+    novo, tokens_antes, tokens_depois = compactar(historico, limite_tokens, turnos_recentes)
+    if novo is historico:
+        return historico
+
+    reescrever(chave, novo)
+    economia = tokens_antes - tokens_depois
+    metricas.incrementar('historico_tokens_economizados', max(economia, 0))
+    logging.info(
+        f"✂️ Histórico '{chave}' compactado: {len(historico)} -> {len(novo)} turnos, "
+        f"~{tokens_antes} -> ~{tokens_depois} tokens (economia de ~{economia} tokens por mensagem)"
+    )
+    return novo
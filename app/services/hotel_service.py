@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from app.models.tables import Agendamento, Profissional, Servico, Barbearia
 from app.extensions import db
+from app.services import reserva_service, inventario_quartos
 import logging
 import traceback
 
@@ -33,51 +34,17 @@ def verificar_disponibilidade_hotel(barbearia_id: int, data_entrada_str: str, qt
             return f"❌ REGRA: A pousada exige um mínimo de {min_dias_real:g} diárias. Avise o cliente com simpatia, NÃO encerre a conversa, e pergunte se ele gostaria de estender a estadia."
             
         # 🌟 LÓGICA DE HORÁRIOS EXATOS DA DONA 🌟
-        if qtd_dias_float == 1.5:
-            # 1.5 Diária: Sexta 10h até Sábado 17h
-            dt_entrada = datetime.strptime(data_entrada_str, '%Y-%m-%d').replace(hour=10, minute=0, second=0)
-            dt_saida = dt_entrada + timedelta(days=1)
-            dt_saida = dt_saida.replace(hour=17, minute=0, second=0)
-        elif qtd_dias_float == 2.0:
-            # 2 Diárias: Sexta 12h até Domingo 17h
-            dt_entrada = datetime.strptime(data_entrada_str, '%Y-%m-%d').replace(hour=12, minute=0, second=0)
-            dt_saida = dt_entrada + timedelta(days=2)
-            dt_saida = dt_saida.replace(hour=17, minute=0, second=0)
-        else:
-            # 1 Diária (ou padrão): Sexta 12h até Sábado 14h
-            dt_entrada = datetime.strptime(data_entrada_str, '%Y-%m-%d').replace(hour=12, minute=0, second=0)
-            dt_saida = dt_entrada + timedelta(days=int(qtd_dias_float))
-            dt_saida = dt_saida.replace(hour=14, minute=0, second=0) 
-
-        quartos_candidatos = Profissional.query.filter(
-            Profissional.barbearia_id == barbearia_id,
-            Profissional.tipo == 'quarto',
-            Profissional.capacidade >= qtd_pessoas_int
-        ).all()
-        
-        disponiveis = []
+        dt_entrada, dt_saida = inventario_quartos.periodo_estadia(data_entrada_str, qtd_dias_float)
 
-        for quarto in quartos_candidatos:
-            agendamentos = Agendamento.query.filter(
-                Agendamento.profissional_id == quarto.id,
-                Agendamento.data_hora >= datetime.now().replace(hour=0, minute=0)
-            ).all()
-            
-            ocupado = False
-            for ag in agendamentos:
-                ag_inicio = ag.data_hora
-                duracao = ag.servico.duracao if ag.servico else 1440
-                ag_fim = ag_inicio + timedelta(minutes=duracao)
-                
-                # Teste de colisão
-                if dt_entrada < ag_fim and dt_saida > ag_inicio:
-                    ocupado = True
-                    break  
-            
-            if not ocupado:
-                disponiveis.append(quarto.nome)
+        # Uma consulta só para todos os quartos livres no período (qualquer capacidade: grupos
+        # grandes podem ser divididos em vários quartos). Pousada: direto no inventário de noites
+        if barbearia.business_type == 'pousada':
+            livres = inventario_quartos.quartos_livres_por_noite(barbearia_id, dt_entrada, dt_saida)
+        else:
+            livres = inventario_quartos.quartos_livres(barbearia_id, dt_entrada, dt_saida)
+        escolhidos = inventario_quartos.combinar_quartos(livres, qtd_pessoas_int)
 
-        if not disponiveis:
+        if not escolhidos:
             return f"Infelizmente não temos nenhuma acomodação disponível para {qtd_pessoas_int} pessoas nestas datas."
 
         # 🌟 MAGIA DA IA: Procurar o Pacote exato para dar o preço ao cliente 🌟
@@ -90,10 +57,13 @@ def verificar_disponibilidade_hotel(barbearia_id: int, data_entrada_str: str, qt
         else:
             info_pacote = " ⚠️ Informe que temos acomodação e diga que a receção confirmará o valor final, mas pergunte se quer garantir a pré-reserva."
 
-        quarto_para_reserva = disponiveis[0]
+        quarto_para_reserva = ", ".join(q.nome for q in escolhidos)
+        info_grupo = ""
+        if len(escolhidos) > 1:
+            info_grupo = f" Para {qtd_pessoas_int} pessoas a reserva usa {len(escolhidos)} acomodações (o grupo fica dividido)."
 
         # MÁGICA: Instrução oculta para a IA esconder o número do quarto
-        return (f"✅ Vaga Encontrada! [INSTRUÇÃO INTERNA DA IA: Para concluir a reserva, use o quarto '{quarto_para_reserva}' na ferramenta]. "
+        return (f"✅ Vaga Encontrada!{info_grupo} [INSTRUÇÃO INTERNA DA IA: Para concluir a reserva, use exatamente '{quarto_para_reserva}' no campo quarto_nome da ferramenta]. "
                 f"🚨 REGRA OBRIGATÓRIA DA POUSADA: NUNCA diga o nome ou número do quarto (ex: Quarto 01) para o cliente! Diga apenas que tem disponibilidade "
                 f"e descreva a estrutura se for necessário (ex: 'Quarto com beliche', 'Suíte com ar', etc).{info_pacote}")
 
@@ -125,15 +95,19 @@ def realizar_reserva_quarto(barbearia_id: int, nome_cliente: str, telefone: str,
              if qtd_dias_float < min_dias_real:
                  return f"A Pousada exige um mínimo de {min_dias_real:g} diárias. Por favor, informe um período maior para prosseguir."
 
-        quarto = Profissional.query.filter_by(barbearia_id=barbearia_id, nome=quarto_nome).first()
-        if not quarto:
+        # Grupo grande: vários quartos separados por vírgula (como devolvido pela disponibilidade)
+        nomes = [nome.strip() for nome in quarto_nome.split(',') if nome.strip()]
+        quartos = Profissional.query.filter(
+            Profissional.barbearia_id == barbearia_id, Profissional.nome.in_(nomes)
+        ).all()
+        if not nomes or len(quartos) != len(set(nomes)):
             return "Erro: Quarto não encontrado no sistema. Por favor, escolha um da lista disponível."
+        if sum(q.capacidade or 0 for q in quartos) < qtd_pessoas_int:
+            return "❌ As acomodações escolhidas não comportam todas as pessoas. Consulte a disponibilidade novamente."
 
-        # 3. Define datas de entrada baseadas na regra da dona
-        if qtd_dias_float == 1.5:
-            dt_entrada = datetime.strptime(data_entrada_str, '%Y-%m-%d').replace(hour=10, minute=0)
-        else:
-            dt_entrada = datetime.strptime(data_entrada_str, '%Y-%m-%d').replace(hour=12, minute=0)
+        # 3. Define datas de entrada e saída baseadas na regra da dona (a saída fica gravada
+        # na reserva: é o mesmo período que a disponibilidade consulta)
+        dt_entrada, dt_saida = inventario_quartos.periodo_estadia(data_entrada_str, qtd_dias_float)
         
         duracao_total_minutos = int(qtd_dias_float * 1440)
         dias_formatado = f"{qtd_dias_float:g}"
@@ -152,19 +126,28 @@ def realizar_reserva_quarto(barbearia_id: int, nome_cliente: str, telefone: str,
                 db.session.commit()
 
         # Adicionar a quantidade de pessoas ao nome do cliente para a dona ver rápido no calendário
-        nome_cliente_formatado = f"{nome_cliente} ({qtd_pessoas_int} pess.)"
-
-        nova_reserva = Agendamento(
-            nome_cliente=nome_cliente_formatado,
-            telefone_cliente=telefone,
-            data_hora=dt_entrada,
-            profissional_id=quarto.id,
-            servico_id=servico.id,
-            barbearia_id=barbearia_id
-        )
-
-        db.session.add(nova_reserva)
-        db.session.commit()
+        hospedes = inventario_quartos.distribuir_hospedes(quartos, qtd_pessoas_int)
+        sufixo_grupo = f", grupo de {qtd_pessoas_int}" if len(quartos) > 1 else ""
+
+        novas_reservas = [
+            inventario_quartos.pre_reserva(Agendamento(
+                nome_cliente=f"{nome_cliente} ({hospedes[quarto.id]} pess.{sufixo_grupo})",
+                telefone_cliente=telefone,
+                data_hora=dt_entrada,
+                data_hora_fim=dt_saida,
+                profissional_id=quarto.id,
+                servico_id=servico.id,
+                barbearia_id=barbearia_id
+            ))
+            for quarto in quartos
+        ]
+
+        try:
+            # Todos os quartos do grupo na mesma transação: ou reserva tudo ou nada
+            reserva_service.salvar_varios(novas_reservas)
+        except reserva_service.ConflitoHorario:
+            logging.warning(f"[CONFLITO] Quarto(s) '{quarto_nome}' já reservado(s) a partir de {dt_entrada} (loja {barbearia_id})")
+            return "❌ Esta acomodação acabou de ser reservada para essas datas. Consulte a disponibilidade novamente antes de confirmar com o cliente."
         
         return f"✅ Tudo certo! Pré-reserva confirmada para o dia {data_entrada_str} ({dias_formatado} diárias para {qtd_pessoas_int} pessoas). O pacote vinculado foi: {servico.nome}."
 
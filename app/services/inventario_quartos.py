@@ -0,0 +1,224 @@
+# app/services/inventario_quartos.py
+# Inventário de quartos da pousada/hotel: "quais quartos com capacidade >= P estão livres do
+# check-in ao check-out?" numa única consulta para todos os quartos da loja (anti-join com os
+# agendamentos que cruzam o período, pelo fim gravado em cada reserva — sem N+1 e sem
+# carregar reservas antigas).
+# - periodo_estadia: horários de entrada/saída pela regra da dona (1, 1.5, 2+ diárias)
+# - quartos_livres: a consulta única
+# - combinar_quartos: grupos grandes divididos em vários quartos (menos quartos, menos sobra)
+#
+# Pousadas (business_type == 'pousada') têm ainda o inventário por noite (InventarioNoite):
+# uma linha por quarto × data ocupada, gravada/apagada por listeners na MESMA transação da
+# reserva, edição ou cancelamento. Disponibilidade vira um AND sobre as noites da estadia.
+# "Noite" é toda data que a estadia toca: como o check-in da dona é 10h/12h e o check-out
+# 14h/17h, duas estadias na mesma data sempre se cruzam — para reservas da IA o resultado é
+# o mesmo da checagem por horário, e para horários avulsos do painel é conservador (nunca
+# diz livre o que está ocupado).
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, delete, func, event, inspect
+
+from app.extensions import db
+from app.models.tables import Agendamento, Profissional, Barbearia, InventarioNoite
+from app.services import reserva_service
+
+ESTADO_PRE_RESERVA = 'pre_reserva'
+ESTADO_RESERVADO = 'reservado'
+
+
+# ==============================================================================
+# 📅 PERÍODO DA ESTADIA (regra de horários da dona)
+# ==============================================================================
+def periodo_estadia(data_entrada_str, qtd_dias):
+    """(check-in, check-out) da estadia: 1.5 diária 10h-17h, 2 diárias 12h-17h, demais 12h-14h."""
+    qtd_dias = float(qtd_dias)
+    dia = datetime.strptime(data_entrada_str, '%Y-%m-%d')
+    if qtd_dias == 1.5:
+        # 1.5 Diária: Sexta 10h até Sábado 17h
+        return dia.replace(hour=10), (dia + timedelta(days=1)).replace(hour=17)
+    if qtd_dias == 2.0:
+        # 2 Diárias: Sexta 12h até Domingo 17h
+        return dia.replace(hour=12), (dia + timedelta(days=2)).replace(hour=17)
+    # 1 Diária (ou padrão): Sexta 12h até Sábado 14h
+    return dia.replace(hour=12), (dia + timedelta(days=int(qtd_dias))).replace(hour=14)
+
+
+# ==============================================================================
+# 🔎 CONSULTA ÚNICA
+# ==============================================================================
+def quartos_livres(barbearia_id, entrada, saida, capacidade_minima=1):
+    """Quartos da loja com capacidade >= capacidade_minima sem reserva cruzando [entrada, saida)."""
+    reservados = select(Agendamento.id).where(
+        Agendamento.profissional_id == Profissional.id,
+        reserva_service.cruza(entrada, saida)
+    )
+    return (
+        Profissional.query
+        .filter(
+            Profissional.barbearia_id == barbearia_id,
+            Profissional.tipo == 'quarto',
+            Profissional.capacidade >= capacidade_minima,
+            ~reservados.exists()
+        )
+        .order_by(Profissional.capacidade, Profissional.nome)
+        .all()
+    )
+
+
+# ==============================================================================
+# 👨‍👩‍👧‍👦 GRUPOS (vários quartos)
+# ==============================================================================
+def combinar_quartos(quartos, pessoas):
+    """
+    Menor conjunto de quartos cuja capacidade somada acomoda `pessoas` (empate: menos camas
+    sobrando). Um quarto que comporta o grupo sozinho sempre ganha. None se não couber.
+    """
+    quartos = [q for q in quartos if (q.capacidade or 0) > 0]
+    if pessoas <= 0 or not quartos:
+        return None
+    teto = pessoas + max(q.capacidade for q in quartos)
+
+    # Mochila 0/1 sobre a capacidade total: melhor[s] = menor lista de quartos que soma s
+    melhor = {0: []}
+    for quarto in quartos:
+        for soma, escolhidos in sorted(melhor.items(), reverse=True):
+            nova = min(soma + quarto.capacidade, teto)
+            if soma >= pessoas:
+                continue
+            if nova not in melhor or len(melhor[nova]) > len(escolhidos) + 1:
+                melhor[nova] = escolhidos + [quarto]
+
+    candidatos = [(len(escolhidos), soma, escolhidos) for soma, escolhidos in melhor.items() if soma >= pessoas]
+    if not candidatos:
+        return None
+    return min(candidatos, key=lambda c: (c[0], c[1]))[2]
+
+
+def distribuir_hospedes(quartos, pessoas):
+    """Quantos hóspedes vão em cada quarto escolhido (enche os maiores primeiro)."""
+    restantes = pessoas
+    distribuicao = {}
+    for quarto in sorted(quartos, key=lambda q: q.capacidade, reverse=True):
+        distribuicao[quarto.id] = min(quarto.capacidade, restantes)
+        restantes -= distribuicao[quarto.id]
+    return distribuicao
+
+
+# ==============================================================================
+# 🌙 INVENTÁRIO POR NOITE (pousadas)
+# ==============================================================================
+def noites(entrada, saida):
+    """Datas que a estadia [entrada, saida) toca."""
+    ultima = (saida - timedelta(microseconds=1)).date() if saida > entrada else entrada.date()
+    dia = entrada.date()
+    datas = []
+    while dia <= ultima:
+        datas.append(dia)
+        dia += timedelta(days=1)
+    return datas
+
+
+def pre_reserva(agendamento):
+    """Marca a reserva (ainda não gravada) como pré-reserva no inventário (a IA reserva assim)."""
+    agendamento._estado_inventario = ESTADO_PRE_RESERVA
+    return agendamento
+
+
+def quartos_livres_por_noite(barbearia_id, entrada, saida, capacidade_minima=1):
+    """Como quartos_livres, mas pelo inventário: nenhuma noite da estadia ocupada."""
+    datas = noites(entrada, saida)
+    ocupadas = select(InventarioNoite.id).where(
+        InventarioNoite.profissional_id == Profissional.id,
+        InventarioNoite.data >= datas[0],
+        InventarioNoite.data <= datas[-1]
+    )
+    return (
+        Profissional.query
+        .filter(
+            Profissional.barbearia_id == barbearia_id,
+            Profissional.tipo == 'quarto',
+            Profissional.capacidade >= capacidade_minima,
+            ~ocupadas.exists()
+        )
+        .order_by(Profissional.capacidade, Profissional.nome)
+        .all()
+    )
+
+
+def mapa_ocupacao(barbearia_id, data_inicio, data_fim):
+    """{data: {'pre_reserva': quartos, 'reservado': quartos}} do período, numa consulta agregada."""
+    linhas = db.session.execute(
+        select(InventarioNoite.data, InventarioNoite.estado, func.count(func.distinct(InventarioNoite.profissional_id)))
+        .where(
+            InventarioNoite.barbearia_id == barbearia_id,
+            InventarioNoite.data >= data_inicio,
+            InventarioNoite.data <= data_fim
+        )
+        .group_by(InventarioNoite.data, InventarioNoite.estado)
+    ).all()
+    mapa = {}
+    for data, estado, quartos in linhas:
+        mapa.setdefault(data, {})[estado] = quartos
+    return mapa
+
+
+def _quarto_de_pousada(connection, profissional_id):
+    return connection.execute(
+        select(Profissional.barbearia_id)
+        .join(Barbearia, Barbearia.id == Profissional.barbearia_id)
+        .where(Profissional.id == profissional_id, Profissional.tipo == 'quarto', Barbearia.business_type == 'pousada')
+    ).first() is not None
+
+
+def _gravar_noites(connection, agendamento, estado):
+    if agendamento.data_hora is None or not _quarto_de_pousada(connection, agendamento.profissional_id):
+        return
+    connection.execute(insert(InventarioNoite), [
+        dict(barbearia_id=agendamento.barbearia_id, profissional_id=agendamento.profissional_id,
+             agendamento_id=agendamento.id, data=data, estado=estado)
+        for data in noites(agendamento.data_hora, agendamento.fim)
+    ])
+
+
+def _apagar_noites(connection, agendamento_id):
+    connection.execute(delete(InventarioNoite).where(InventarioNoite.agendamento_id == agendamento_id))
+
+
+def _apos_inserir(mapper, connection, target):
+    _gravar_noites(connection, target, getattr(target, '_estado_inventario', ESTADO_RESERVADO))
+
+
+def _apos_atualizar(mapper, connection, target):
+    estado = inspect(target)
+    if not any(estado.attrs[a].history.has_changes() for a in ('data_hora', 'data_hora_fim', 'profissional_id')):
+        return
+    # Mantém o estado que a reserva já tinha (pré-reserva continua pré-reserva)
+    anterior = connection.execute(
+        select(InventarioNoite.estado).where(InventarioNoite.agendamento_id == target.id).limit(1)
+    ).scalar()
+    _apagar_noites(connection, target.id)
+    _gravar_noites(connection, target, anterior or getattr(target, '_estado_inventario', ESTADO_RESERVADO))
+
+
+def _antes_de_apagar(mapper, connection, target):
+    _apagar_noites(connection, target.id)
+
+
+event.listen(Agendamento, 'after_insert', _apos_inserir)
+event.listen(Agendamento, 'after_update', _apos_atualizar)
+event.listen(Agendamento, 'before_delete', _antes_de_apagar)
+
+
+def reconstruir(barbearia_id):
+    """Refaz o inventário da pousada a partir das reservas (carga inicial ou conferência). Retorna noites gravadas."""
+    db.session.execute(delete(InventarioNoite).where(InventarioNoite.barbearia_id == barbearia_id))
+    quartos = select(Profissional.id).where(Profissional.barbearia_id == barbearia_id, Profissional.tipo == 'quarto')
+    linhas = [
+        dict(barbearia_id=barbearia_id, profissional_id=ag.profissional_id, agendamento_id=ag.id, data=data, estado=ESTADO_RESERVADO)
+        for ag in Agendamento.query.filter(Agendamento.profissional_id.in_(quartos)).all()
+        for data in noites(ag.data_hora, ag.fim)
+    ]
+    if linhas:
+        db.session.execute(insert(InventarioNoite), linhas)
+    db.session.commit()
+    return len(linhas)
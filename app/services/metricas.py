@@ -0,0 +1,86 @@
+# app/services/metricas.py
+# Registro de métricas em memória (por processo) para filas, transporte HTTP e ferramentas.
+import threading
+import time
+
+# Faixas (ms) dos histogramas de latência
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_lock = threading.Lock()
+_contadores = {}
+_medidores = {}
+_histogramas = {}
+
+
+def _chave(nome, rotulos):
+    if not rotulos:
+        return nome
+    partes = ",".join(f"{k}={rotulos[k]}" for k in sorted(rotulos))
+    return f"{nome}{{{partes}}}"
+
+
+def incrementar(nome, valor=1, **rotulos):
+    """Soma `valor` ao contador `nome` (com rótulos opcionais, ex: fila='mensagens')."""
+    chave = _chave(nome, rotulos)
+    with _lock:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+
+def definir(nome, valor, **rotulos):
+    """Define o valor atual de um medidor (ex: profundidade da fila)."""
+    chave = _chave(nome, rotulos)
+    with _lock:
+        _medidores[chave] = valor
+
+
+def observar(nome, valor_ms, **rotulos):
+    """Registra uma amostra de latência (ms) no histograma `nome`."""
+    chave = _chave(nome, rotulos)
+    with _lock:
+        h = _histogramas.get(chave)
+        if h is None:
+            h = {'qtd': 0, 'soma_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1)}
+            _histogramas[chave] = h
+        h['qtd'] += 1
+        h['soma_ms'] += valor_ms
+        h['max_ms'] = max(h['max_ms'], valor_ms)
+        for i, limite in enumerate(BUCKETS_MS):
+            if valor_ms <= limite:
+                h['buckets'][i] += 1
+                break
+        else:
+            h['buckets'][-1] += 1
+
+
+class cronometro:
+    """Context manager que mede o bloco e registra em `observar(nome)`."""
+
+    def __init__(self, nome, **rotulos):
+        self.nome = nome
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar(self.nome, (time.perf_counter() - self.inicio) * 1000, **self.rotulos)
+        return False
+
+
+def instantaneo():
+    """Retorna uma cópia serializável (JSON) de todas as métricas do processo."""
+    with _lock:
+        histogramas = {}
+        for chave, h in _histogramas.items():
+            histogramas[chave] = {
+                'qtd': h['qtd'],
+                'media_ms': round(h['soma_ms'] / h['qtd'], 2) if h['qtd'] else 0,
+                'max_ms': round(h['max_ms'], 2),
+                'buckets': dict(zip([f"<={b}" for b in BUCKETS_MS] + ['+inf'], h['buckets'])),
+            }
+        return {
+            'contadores': dict(_contadores),
+            'medidores': dict(_medidores),
+            'histogramas': histogramas,
+        }
@@ -0,0 +1,212 @@
+# app/services/monitor_eventos.py
+# Monitor de conversas ao vivo por Server-Sent Events, no lugar do XHR a cada 3s:
+# - O chatlog_sink avisa (publicar) as lojas de cada lote gravado: neste processo na hora e
+#   nos demais pelo pub/sub do Redis. Uma única thread assinante por processo acorda todas
+#   as conexões SSE abertas daquela loja (não é uma conexão Redis por painel aberto)
+# - Cada conexão só lê o que é novo: mensagens do contato aberto com id > cursor e conversas
+#   com ultima_mensagem_em posterior à última vista (índices da loja, sem agregação)
+# - Sem aviso (Redis fora / outro processo sem Redis) a conexão confere de qualquer jeito a
+#   cada MONITOR_SSE_INTERVALO segundos, que também serve de batimento
+# - A conexão fecha depois de MONITOR_SSE_DURACAO segundos; o EventSource reconecta sozinho
+#   e manda o Last-Event-ID (id da última mensagem) como cursor
+# - historico: rolagem para trás por keyset (data_hora, id), 50 mensagens por vez
+# - Cada conexão ao vivo ocupa uma thread do servidor (gunicorn gthread, ver gunicorn.conf.py):
+#   acima de MONITOR_SSE_MAX_CONEXOES por processo, a conexão responde na hora e fecha,
+#   e o navegador volta em MONITOR_SSE_INTERVALO segundos (polling) — sobra thread para os webhooks
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+from flask import current_app
+from sqlalchemy import select, and_, or_
+
+from app.extensions import db, obter_redis
+from app.models.tables import ChatLog, Conversa, Cliente
+from app.services import conversas
+
+CANAL = 'monitor_chat'
+POR_PAGINA = 50
+# Mensagens/conversas gravadas até este tanto antes da abertura da conexão ainda são lidas
+# (limita a busca às partições recentes e cobre o intervalo de reconexão)
+MARGEM = timedelta(minutes=10)
+FUSO = pytz.timezone('America/Sao_Paulo')
+
+_cond = threading.Condition()
+_versoes = {}
+_assinante = {'thread': None}
+_conexoes = {'abertas': 0}
+
+
+# ==============================================================================
+# 📣 AVISOS (chatlog_sink -> conexões abertas)
+# ==============================================================================
+def _avisar(barbearia_ids):
+    with _cond:
+        for barbearia_id in barbearia_ids:
+            _versoes[barbearia_id] = _versoes.get(barbearia_id, 0) + 1
+        _cond.notify_all()
+
+
+def publicar(barbearia_ids):
+    """Chamar depois do commit de um lote de ChatLog."""
+    barbearia_ids = sorted({b for b in barbearia_ids if b})
+    if not barbearia_ids:
+        return
+    _avisar(barbearia_ids)
+    redis_client = obter_redis()
+    if redis_client is not None:
+        try:
+            redis_client.publish(CANAL, json.dumps(barbearia_ids))
+        except Exception as e:
+            logging.warning(f"Falha ao publicar aviso do monitor: {e}")
+
+
+def _ouvir(redis_client):
+    while True:
+        try:
+            assinatura = redis_client.pubsub(ignore_subscribe_messages=True)
+            assinatura.subscribe(CANAL)
+            for mensagem in assinatura.listen():
+                _avisar(json.loads(mensagem['data']))
+        except Exception as e:
+            logging.warning(f"Pub/sub do monitor caiu ({e}); nova assinatura em 5s.")
+            time.sleep(5)
+
+
+def _garantir_assinante():
+    if _assinante['thread'] is not None:
+        return
+    redis_client = obter_redis()
+    with _cond:
+        if _assinante['thread'] is not None or redis_client is None:
+            return
+        _assinante['thread'] = threading.Thread(target=_ouvir, args=(redis_client,), name='monitor-chat', daemon=True)
+        _assinante['thread'].start()
+
+
+def _aguardar(barbearia_id, versao, timeout):
+    with _cond:
+        _cond.wait_for(lambda: _versoes.get(barbearia_id, 0) != versao, timeout)
+        return _versoes.get(barbearia_id, 0)
+
+
+# ==============================================================================
+# 💬 MENSAGENS PARA EXIBIÇÃO
+# ==============================================================================
+def hora_local(data_hora):
+    """Horário gravado (sem fuso, tratado como UTC, como o monitor sempre fez) em São Paulo."""
+    if data_hora is None:
+        return None
+    hora_utc = data_hora.replace(tzinfo=pytz.utc) if data_hora.tzinfo is None else data_hora
+    return hora_utc.astimezone(FUSO)
+
+
+def _para_exibicao(linhas):
+    # Dicionários (não objetos do ORM): o fuso convertido nunca volta para o banco
+    return [
+        {'id': linha.id, 'tipo': linha.tipo, 'mensagem': linha.mensagem, 'data_hora': hora_local(linha.data_hora),
+         'gravada_em': linha.data_hora}
+        for linha in linhas
+    ]
+
+
+def _colunas():
+    return select(ChatLog.id, ChatLog.tipo, ChatLog.mensagem, ChatLog.data_hora)
+
+
+def historico(barbearia_id, cliente_telefone, antes=None, por_pagina=POR_PAGINA):
+    """
+    Uma página de mensagens do contato, em ordem cronológica, anteriores ao cursor
+    `antes` = (data_hora, id) — None traz as mais recentes. Retorna (mensagens, tem_mais).
+    """
+    consulta = _colunas().where(ChatLog.barbearia_id == barbearia_id, ChatLog.cliente_telefone == cliente_telefone)
+    if antes is not None:
+        data_hora, id_ = antes
+        consulta = consulta.where(or_(ChatLog.data_hora < data_hora, and_(ChatLog.data_hora == data_hora, ChatLog.id < id_)))
+    linhas = db.session.execute(
+        consulta.order_by(ChatLog.data_hora.desc(), ChatLog.id.desc()).limit(por_pagina + 1)
+    ).all()
+    return _para_exibicao(reversed(linhas[:por_pagina])), len(linhas) > por_pagina
+
+
+def _novas_mensagens(barbearia_id, cliente_telefone, cursor, desde):
+    return _para_exibicao(db.session.execute(
+        _colunas()
+        .where(ChatLog.barbearia_id == barbearia_id, ChatLog.cliente_telefone == cliente_telefone,
+               ChatLog.data_hora >= desde, ChatLog.id > cursor)
+        .order_by(ChatLog.id)
+    ).all())
+
+
+def _conversas_alteradas(barbearia_id, desde):
+    return db.session.execute(
+        select(Conversa, Cliente.nome)
+        .outerjoin(Cliente, and_(Cliente.barbearia_id == Conversa.barbearia_id, Cliente.telefone == Conversa.telefone))
+        .where(Conversa.barbearia_id == barbearia_id, Conversa.ultima_mensagem_em > desde)
+        .order_by(Conversa.ultima_mensagem_em)
+        .limit(POR_PAGINA)
+    ).all()
+
+
+# ==============================================================================
+# 📡 FLUXO SSE
+# ==============================================================================
+def _evento(nome, dados, id_=None):
+    cabecalho = f"id: {id_}\n" if id_ is not None else ''
+    return f"{cabecalho}event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def fluxo(barbearia_id, cliente_telefone, cursor, renderizar_mensagens):
+    """
+    Gerador de eventos SSE da loja: 'mensagem' (HTML das mensagens novas do contato aberto,
+    com id = cursor) e 'conversa' (contato com mensagem nova, para a lista lateral).
+    """
+    _garantir_assinante()
+    config = current_app.config
+    intervalo = float(config.get('MONITOR_SSE_INTERVALO', 15))
+    fim = time.monotonic() + float(config.get('MONITOR_SSE_DURACAO', 55))
+    aberto_em = datetime.now()
+    desde_conversas = aberto_em - MARGEM
+    cursor = cursor or 0
+    versao = _versoes.get(barbearia_id, 0)
+
+    with _cond:
+        ao_vivo = _conexoes['abertas'] < int(config.get('MONITOR_SSE_MAX_CONEXOES', 8))
+        if ao_vivo:
+            _conexoes['abertas'] += 1
+    try:
+        # Sem vaga: uma leitura só e o navegador reconecta depois do intervalo
+        yield "retry: 3000\n\n" if ao_vivo else f"retry: {int(intervalo * 1000)}\n\n"
+        while True:
+            if cliente_telefone:
+                novas = _novas_mensagens(barbearia_id, cliente_telefone, cursor, aberto_em - MARGEM)
+                if novas:
+                    cursor = novas[-1]['id']
+                    if any(m['tipo'] == 'cliente' for m in novas):
+                        conversas.marcar_lida(barbearia_id, cliente_telefone)
+                    yield _evento('mensagem', {'html': renderizar_mensagens(novas)}, id_=cursor)
+
+            for conversa, nome in _conversas_alteradas(barbearia_id, desde_conversas):
+                desde_conversas = max(desde_conversas, conversa.ultima_mensagem_em)
+                hora = hora_local(conversa.ultima_mensagem_em)
+                yield _evento('conversa', {
+                    'telefone': conversa.cliente_telefone, 'nome': nome, 'previa': conversa.ultima_previa,
+                    'nao_lidas': conversa.nao_lidas, 'hora': hora.strftime('%H:%M') if hora else ''
+                })
+
+            # Devolve a conexão ao pool enquanto espera
+            db.session.close()
+            restante = fim - time.monotonic()
+            if not ao_vivo or restante <= 0:
+                return
+            nova_versao = _aguardar(barbearia_id, versao, min(intervalo, restante))
+            if nova_versao == versao:
+                yield ": ping\n\n"
+            versao = nova_versao
+    finally:
+        if ao_vivo:
+            with _cond:
+                _conexoes['abertas'] -= 1
@@ -0,0 +1,346 @@
+# app/services/ocupacao.py
+# Cache materializado da ocupação de cada (profissional, dia) como bitmap de 5 em 5 minutos
+# (288 bits por dia). Bit ligado = slot ocupado por algum agendamento.
+# - Camada local (LRU por processo, validade curta) -> Redis -> banco (uma consulta por período)
+# - Inserções de agendamento fazem OR incremental no bitmap; edições e exclusões descartam o dia
+#   (dois agendamentos podem se sobrepor, então não dá para "desligar" bits com segurança)
+# - Um contador de geração por dia impede que uma reconstrução lenta (que leu o banco antes
+#   do commit) grave por cima de um bitmap já atualizado
+# - A chave inclui a versão da config da loja: mudar a duração de um serviço reconstrói tudo
+# Disponibilidade e conflito viram operações de bits; o motor de intervalos recebe os
+# intervalos ocupados já mesclados.
+import re
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from cachetools import LRUCache
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.extensions import cache, obter_redis
+from app.models.tables import Agendamento
+from app.services import metricas
+from app.services.cache_modelos import versao_config
+
+SLOT_MINUTOS = 5
+SLOTS_DIA = 24 * 60 // SLOT_MINUTOS
+BYTES_DIA = SLOTS_DIA // 8
+MAX_LOCAL = 4096
+
+_lock = threading.Lock()
+_local = LRUCache(maxsize=MAX_LOCAL)
+_RUN_OCUPADO = re.compile('1+')
+
+# Grava o bitmap só se ninguém mexeu no dia desde que a leitura do banco começou
+_LUA_SALVAR = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+    return 1
+end
+return 0
+"""
+# Novo agendamento: avança a geração e liga os bits (só se o bitmap já existir)
+_LUA_OCUPAR = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    for i = tonumber(ARGV[1]), tonumber(ARGV[2]) - 1 do
+        redis.call('SETBIT', KEYS[1], i, 1)
+    end
+    return 1
+end
+return 0
+"""
+_scripts = {}
+
+
+# ==============================================================================
+# ⚙️ BITS
+# ==============================================================================
+# Slot i = bit (SLOTS_DIA - 1 - i), a mesma ordem do SETBIT do Redis: o bitmap em bytes
+# (big-endian) é exatamente o valor guardado lá.
+def _slots(inicio_min, fim_min):
+    """Minutos [inicio, fim) -> slots [a, b), arredondando para fora (nunca subestima a ocupação)."""
+    return max(inicio_min // SLOT_MINUTOS, 0), min(-(-fim_min // SLOT_MINUTOS), SLOTS_DIA)
+
+
+def mascara(inicio_min, fim_min):
+    a, b = _slots(inicio_min, fim_min)
+    if b <= a:
+        return 0
+    return ((1 << (b - a)) - 1) << (SLOTS_DIA - b)
+
+
+def de_intervalos(intervalos):
+    bits = 0
+    for inicio, fim in intervalos:
+        bits |= mascara(inicio, fim)
+    return bits
+
+
+def intervalos(bits):
+    """Bitmap -> intervalos ocupados (inicio, fim) em minutos, já mesclados e ordenados."""
+    if not bits:
+        return []
+    return [
+        (m.start() * SLOT_MINUTOS, m.end() * SLOT_MINUTOS)
+        for m in _RUN_OCUPADO.finditer(format(bits, f'0{SLOTS_DIA}b'))
+    ]
+
+
+def _de_bytes(valor):
+    return int.from_bytes(bytes(valor).ljust(BYTES_DIA, b'\0')[:BYTES_DIA], 'big')
+
+
+def _para_bytes(bits):
+    return bits.to_bytes(BYTES_DIA, 'big')
+
+
+# ==============================================================================
+# 🗝️ CHAVES E CAMADAS
+# ==============================================================================
+def _chave(barbearia_id, versao, profissional_id, data):
+    return f"ocupacao:{barbearia_id}:{versao}:{profissional_id}:{data:%Y%m%d}"
+
+
+def _chave_geracao(profissional_id, data):
+    return f"ocupacao_g:{profissional_id}:{data:%Y%m%d}"
+
+
+def _ttl():
+    return int(current_app.config.get('OCUPACAO_TTL', 6 * 3600))
+
+
+def _ttl_local():
+    return float(current_app.config.get('OCUPACAO_TTL_LOCAL', 10))
+
+
+def _script(redis_client, nome, fonte):
+    script = _scripts.get(nome)
+    if script is None:
+        script = _scripts[nome] = redis_client.register_script(fonte)
+    return script
+
+
+def _ler_local(chave):
+    with _lock:
+        item = _local.get(chave)
+    if item is None or item[0] < time.monotonic():
+        return None
+    return item[1]
+
+
+def _gravar_local(chave, bits):
+    with _lock:
+        _local[chave] = (time.monotonic() + _ttl_local(), bits)
+
+
+def _ler_compartilhado(chaves):
+    """{chave: (bits | None, geração)} lendo bitmaps e gerações numa ida só."""
+    redis_client = obter_redis()
+    if redis_client is not None:
+        valores = redis_client.mget([c for c, _ in chaves] + [g for _, g in chaves])
+        n = len(chaves)
+        return {
+            chave: (None if valores[i] is None else _de_bytes(valores[i]), (valores[n + i] or b'0').decode())
+            for i, (chave, _) in enumerate(chaves)
+        }
+    lista = [c for c, _ in chaves]
+    return {chave: (bits, None) for chave, bits in zip(lista, cache.get_many(*lista))}
+
+
+def _gravar_compartilhado(itens):
+    """itens: [(chave, chave_geracao, geracao_lida, bits)]."""
+    redis_client = obter_redis()
+    if redis_client is not None:
+        salvar = _script(redis_client, 'salvar', _LUA_SALVAR)
+        pipe = redis_client.pipeline(transaction=False)
+        for chave, chave_g, geracao, bits in itens:
+            salvar(keys=[chave, chave_g], args=[geracao, _para_bytes(bits), _ttl()], client=pipe)
+        pipe.execute()
+        return
+    for chave, _, _, bits in itens:
+        cache.set(chave, bits, timeout=_ttl())
+
+
+# ==============================================================================
+# 🔎 LEITURA
+# ==============================================================================
+def bitmaps_do_periodo(barbearia_id, profissional_ids, data_inicio, data_fim, fresco=False):
+    """
+    {(profissional_id, date): bitmap} para todos os pares do período.
+    `fresco=True` ignora a camada local (para checagem de conflito antes de gravar).
+    """
+    from app.core.disponibilidade import consultar_ocupados
+
+    profissional_ids = list(profissional_ids)
+    datas = [data_inicio + timedelta(days=i) for i in range((data_fim - data_inicio).days + 1)]
+    versao = versao_config(barbearia_id)
+    pares = {(p, d): _chave(barbearia_id, versao, p, d) for p in profissional_ids for d in datas}
+
+    resultado, faltando = {}, {}
+    for par, chave in pares.items():
+        bits = None if fresco else _ler_local(chave)
+        if bits is None:
+            faltando[par] = chave
+        else:
+            resultado[par] = bits
+    if resultado:
+        metricas.incrementar('ocupacao_cache', len(resultado), camada='local')
+    if not faltando:
+        return resultado
+
+    try:
+        compartilhado = _ler_compartilhado([(c, _chave_geracao(*par)) for par, c in faltando.items()])
+    except Exception as e:
+        logging.warning(f"Cache de ocupação indisponível ({e}); lendo do banco.")
+        compartilhado = {}
+
+    geracoes = {}
+    do_compartilhado = 0
+    for par, chave in list(faltando.items()):
+        bits, geracoes[par] = compartilhado.get(chave, (None, None))
+        if bits is not None:
+            resultado[par] = bits
+            _gravar_local(chave, bits)
+            del faltando[par]
+            do_compartilhado += 1
+    if do_compartilhado:
+        metricas.incrementar('ocupacao_cache', do_compartilhado, camada='redis')
+    if not faltando:
+        return resultado
+
+    # O que faltou vem do banco numa consulta só (menor período que cobre os dias faltantes)
+    metricas.incrementar('ocupacao_cache', len(faltando), camada='banco')
+    datas_faltando = [d for _, d in faltando]
+    ocupados = consultar_ocupados(
+        barbearia_id, {p for p, _ in faltando}, min(datas_faltando), max(datas_faltando)
+    )
+    itens = []
+    for par, chave in faltando.items():
+        bits = de_intervalos(ocupados.get(par, []))
+        resultado[par] = bits
+        _gravar_local(chave, bits)
+        itens.append((chave, _chave_geracao(*par), geracoes.get(par) or '0', bits))
+    try:
+        _gravar_compartilhado(itens)
+    except Exception as e:
+        logging.warning(f"Falha ao gravar cache de ocupação: {e}")
+    return resultado
+
+
+def bitmap_do_dia(barbearia_id, profissional_id, data, fresco=False):
+    return bitmaps_do_periodo(barbearia_id, [profissional_id], data, data, fresco=fresco)[(profissional_id, data)]
+
+
+def conflita(barbearia_id, profissional_id, inicio, duracao):
+    """True se [inicio, inicio + duracao) sobrepõe algum slot ocupado (ignora a camada local)."""
+    minuto = inicio.hour * 60 + inicio.minute
+    bits = bitmap_do_dia(barbearia_id, profissional_id, inicio.date(), fresco=True)
+    return bool(bits & mascara(minuto, minuto + duracao))
+
+
+# ==============================================================================
+# ✍️ ATUALIZAÇÃO INCREMENTAL (aplicada só depois do commit)
+# ==============================================================================
+def _ocupar(barbearia_id, profissional_id, data, inicio_min, fim_min):
+    chave = _chave(barbearia_id, versao_config(barbearia_id), profissional_id, data)
+    bits = mascara(inicio_min, fim_min)
+    with _lock:
+        item = _local.get(chave)
+        if item is not None:
+            _local[chave] = (item[0], item[1] | bits)
+
+    redis_client = obter_redis()
+    if redis_client is not None:
+        a, b = _slots(inicio_min, fim_min)
+        _script(redis_client, 'ocupar', _LUA_OCUPAR)(
+            keys=[chave, _chave_geracao(profissional_id, data)], args=[a, b, _ttl() * 2]
+        )
+        return
+    atual = cache.get(chave)
+    if atual is not None:
+        cache.set(chave, atual | bits, timeout=_ttl())
+
+
+def _descartar(barbearia_id, profissional_id, data):
+    chave = _chave(barbearia_id, versao_config(barbearia_id), profissional_id, data)
+    with _lock:
+        _local.pop(chave, None)
+
+    redis_client = obter_redis()
+    if redis_client is not None:
+        chave_g = _chave_geracao(profissional_id, data)
+        pipe = redis_client.pipeline()
+        pipe.incr(chave_g)
+        pipe.expire(chave_g, _ttl() * 2)
+        pipe.delete(chave)
+        pipe.execute()
+        return
+    cache.delete(chave)
+
+
+# ==============================================================================
+# 👂 LISTENERS: AGENDAMENTO CRIADO / EDITADO / APAGADO
+# ==============================================================================
+def _pendentes(target):
+    sessao = Session.object_session(target)
+    if sessao is None:
+        return None
+    return sessao.info.setdefault('ocupacao_pendente', [])
+
+
+def _apos_inserir(mapper, connection, target):
+    pendentes = _pendentes(target)
+    if pendentes is None or target.data_hora is None:
+        return
+    inicio = target.data_hora.hour * 60 + target.data_hora.minute
+    fim = inicio + int((target.fim - target.data_hora).total_seconds() // 60)
+    pendentes.append(('ocupar', target.barbearia_id, target.profissional_id, target.data_hora.date(), inicio, fim))
+
+
+def _valores(target, atributo):
+    """Valores atual e anterior (se mudou) de um atributo."""
+    historico = inspect(target).attrs[atributo].history
+    return set(historico.added or ()) | set(historico.deleted or ()) | set(historico.unchanged or ())
+
+
+def _apos_atualizar(mapper, connection, target):
+    estado = inspect(target)
+    if not any(estado.attrs[a].history.has_changes() for a in ('data_hora', 'data_hora_fim', 'profissional_id')):
+        return
+    pendentes = _pendentes(target)
+    if pendentes is None:
+        return
+    for profissional_id in _valores(target, 'profissional_id'):
+        for data_hora in _valores(target, 'data_hora'):
+            if profissional_id and data_hora:
+                pendentes.append(('descartar', target.barbearia_id, profissional_id, data_hora.date()))
+
+
+def _apos_apagar(mapper, connection, target):
+    pendentes = _pendentes(target)
+    if pendentes is not None and target.data_hora is not None:
+        pendentes.append(('descartar', target.barbearia_id, target.profissional_id, target.data_hora.date()))
+
+
+def _apos_commit(sessao):
+    for operacao, *args in sessao.info.pop('ocupacao_pendente', None) or ():
+        try:
+            (_ocupar if operacao == 'ocupar' else _descartar)(*args)
+        except Exception as e:
+            logging.warning(f"Falha ao atualizar cache de ocupação ({operacao} {args}): {e}")
+
+
+def _apos_rollback(sessao):
+    sessao.info.pop('ocupacao_pendente', None)
+
+
+event.listen(Agendamento, 'after_insert', _apos_inserir)
+event.listen(Agendamento, 'after_update', _apos_atualizar)
+event.listen(Agendamento, 'after_delete', _apos_apagar)
+event.listen(Session, 'after_commit', _apos_commit)
+event.listen(Session, 'after_rollback', _apos_rollback)
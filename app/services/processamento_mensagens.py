@@ -0,0 +1,133 @@
+# app/services/processamento_mensagens.py
+# Tarefas executadas pelos workers da fila (fila_service): turno da IA + envio da resposta.
+# Os webhooks (app/routes.py) apenas validam e enfileiram estas tarefas.
+import re
+import logging
+
+from app.models.tables import Barbearia
+from app.services import chatlog_sink
+from app.services.fila_service import tarefa_conversa
+
+
+def chave_conversa(barbearia_id, telefone):
+    """Chave da conversa (loja + número limpo) usada na execução em série."""
+    numero_limpo = re.sub(r'\D', '', str(telefone).split('@')[0])
+    return f"{barbearia_id}:{numero_limpo}"
+
+
+# ==============================================================================
+# 🚀 WAHA
+# ==============================================================================
+@tarefa_conversa('waha.mensagem')
+def processar_lote_waha(lote):
+    """
+    Processa, em ordem, as mensagens de UMA conversa recebidas na janela de agrupamento.
+    Os textos viram uma única chamada da IA (a rajada "oi" / "quero cortar" / "amanhã").
+    """
+    session_id = lote[-1]['session_id']
+    barbearia_id = lote[-1]['barbearia_id']
+    from_number = lote[-1]['payload'].get('from') or lote[-1]['payload'].get('chatId')
+
+    barbearia = Barbearia.query.get(barbearia_id)
+    if not barbearia:
+        logging.error(f"❌ ERRO WAHA: A loja ID {barbearia_id} não existe no banco!")
+        return
+
+    from app.services.waha_utils import extrair_e_filtrar_mensagem_waha
+    from app.services.waha_service import enviar_mensagem_waha
+
+    textos = []
+    recebeu_audio = False
+    for dados in lote:
+        payload = dados['payload']
+        # Download/transcrição de mídia acontece aqui, fora do request
+        sucesso, resultado = extrair_e_filtrar_mensagem_waha(payload, dados['session_id'])
+        if not sucesso:
+            logging.info(f"🚫 WAHA: mensagem ignorada ({resultado})")
+            continue
+
+        msg_type = payload.get('type', 'text')
+        if msg_type in ['chat', 'text', 'image', 'video', 'document']:
+            logging.info(f"📝 DEBUG WAHA: Texto lido com sucesso: '{resultado}'")
+            textos.append(resultado)
+        elif msg_type == 'ptt' or msg_type == 'audio':
+            recebeu_audio = True
+
+    if textos:
+        logging.info(f"✅ WAHA: {len(textos)} mensagem(ns) de {from_number} para a loja {barbearia.nome_fantasia}")
+        # Só grava depois de ler o lote inteiro: se uma mídia falhar, o lote volta sem duplicar o histórico
+        for texto in textos:
+            chatlog_sink.registrar(barbearia.id, from_number, texto, 'cliente')
+
+        from app.services import ai_service
+        resposta_ia = ai_service.processar_ia_gemini(
+            user_message="\n".join(textos),
+            barbearia_id=barbearia.id,
+            cliente_whatsapp=from_number,
+            waha_session_id=session_id
+        )
+
+        if resposta_ia:
+            chatlog_sink.registrar(barbearia.id, from_number, resposta_ia, 'ia')
+            enviar_mensagem_waha(session_id, from_number, resposta_ia)
+
+    if recebeu_audio:
+        logging.info("🔊 Áudio recebido via WAHA (Ainda em implementação)")
+        enviar_mensagem_waha(session_id, from_number, "Desculpe, ainda estou aprendendo a ouvir áudios por este novo sistema! Poderia digitar? ✨")
+
+
+# ==============================================================================
+# ✨ META (CLOUD API)
+# ==============================================================================
+@tarefa_conversa('meta.mensagem')
+def processar_lote_meta(lote):
+    from flask import current_app
+    from app.routes import enviar_mensagem_whatsapp_meta, marcar_como_lido, processar_audio_background
+    from app.services import ai_service
+
+    barbearia_id = lote[-1]['barbearia_id']
+    remetente = lote[-1]['remetente']
+
+    barbearia = Barbearia.query.get(barbearia_id)
+    if not barbearia:
+        logging.error(f"❌ ERRO META: A loja ID {barbearia_id} não existe no banco!")
+        return
+
+    def responder_textos(textos):
+        # Grava as mensagens do cliente só aqui, junto da chamada da IA (lote repetido não duplica)
+        for texto in textos:
+            chatlog_sink.registrar(barbearia.id, remetente, texto, 'cliente')
+        resposta_ia = ai_service.processar_ia_gemini(
+            user_message="\n".join(textos),
+            barbearia_id=barbearia.id,
+            cliente_whatsapp=remetente
+        )
+        if resposta_ia:
+            chatlog_sink.registrar(barbearia.id, remetente, resposta_ia, 'ia')
+            enviar_mensagem_whatsapp_meta(remetente, resposta_ia, barbearia)
+
+    textos = []
+    for dados in lote:
+        if dados.get('message_id'):
+            marcar_como_lido(dados['message_id'], barbearia)
+
+        # TEXTO (acumula para uma única chamada da IA)
+        if dados['msg_type'] == 'text' and dados.get('texto'):
+            textos.append(dados['texto'])
+
+        # ÁUDIO (responde os textos anteriores primeiro, para manter a ordem)
+        elif dados['msg_type'] == 'audio' and dados.get('audio_id'):
+            if textos:
+                responder_textos(textos)
+                textos = []
+            processar_audio_background(
+                dados['audio_id'],
+                remetente,
+                barbearia.meta_access_token,
+                barbearia.meta_phone_number_id,
+                barbearia.id,
+                current_app._get_current_object()
+            )
+
+    if textos:
+        responder_textos(textos)
@@ -0,0 +1,204 @@
+# app/services/reserva_service.py
+# Gravação de agendamentos/reservas sem corrida entre workers (duas conversas de WhatsApp
+# pedindo o mesmo horário ao mesmo tempo).
+# - Todo agendamento guarda duracao_minutos e data_hora_fim (data_hora + duração), preenchidos
+#   aqui num listener antes de inserir/atualizar — vale para qualquer caminho de escrita. A
+#   duração é a do serviço na hora de agendar; editar o serviço depois não muda agendamentos.
+# - PostgreSQL: a constraint de exclusão agendamento_sem_sobreposicao
+#   (profissional_id =, tsrange(data_hora, data_hora_fim) &&) recusa a sobreposição na
+#   própria escrita; a violação vira ConflitoHorario. Nenhuma leitura antes do INSERT.
+# - Outros bancos (SQLite em dev/testes): trava por profissional (Redis se houver, senão
+#   por processo) com a checagem de sobreposição em SQL dentro da trava.
+import logging
+import threading
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import timedelta
+
+from sqlalchemy import and_, event, inspect, select, func, literal, literal_column, DateTime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+from app.extensions import db, obter_redis
+from app.models.tables import Agendamento, Servico
+from app.services import metricas
+
+NOME_CONSTRAINT = 'agendamento_sem_sobreposicao'
+# SQLSTATE de exclusion_violation no PostgreSQL
+PGCODE_EXCLUSAO = '23P01'
+DURACAO_PADRAO = 30
+TRAVA_TIMEOUT = 15
+TRAVA_ESPERA = 10
+
+_travas_locais = defaultdict(threading.Lock)
+_travas_lock = threading.Lock()
+
+
+class ConflitoHorario(Exception):
+    """O horário pedido sobrepõe outro agendamento do mesmo profissional/quarto."""
+
+
+# ==============================================================================
+# ⏱️ FIM DO AGENDAMENTO (sempre coerente com a duração do serviço)
+# ==============================================================================
+def _duracao(connection, servico_id):
+    duracao = connection.execute(select(Servico.duracao).where(Servico.id == servico_id)).scalar()
+    return duracao or DURACAO_PADRAO
+
+
+def _preencher_fim(mapper, connection, target):
+    """Grava duracao_minutos e data_hora_fim no agendamento (a duração do serviço vale na hora de agendar)."""
+    if target.data_hora is None:
+        return
+    estado = inspect(target)
+
+    def mudou(atributo):
+        return estado.attrs[atributo].history.has_changes()
+
+    novo = estado.key is None
+    if not (novo or mudou('data_hora') or mudou('servico_id') or mudou('duracao_minutos') or mudou('data_hora_fim')):
+        return
+    if target.data_hora_fim is not None and mudou('data_hora_fim') and not mudou('duracao_minutos'):
+        # fim informado explicitamente por quem gravou: a duração sai dele
+        target.duracao_minutos = int((target.data_hora_fim - target.data_hora).total_seconds() // 60)
+        return
+    if target.duracao_minutos is None or (mudou('servico_id') and not mudou('duracao_minutos')):
+        target.duracao_minutos = _duracao(connection, target.servico_id)
+    target.data_hora_fim = target.data_hora + timedelta(minutes=target.duracao_minutos)
+
+
+event.listen(Agendamento, 'before_insert', _preencher_fim)
+event.listen(Agendamento, 'before_update', _preencher_fim)
+
+
+# ==============================================================================
+# 🔒 GRAVAÇÃO
+# ==============================================================================
+def _usa_constraint():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def _eh_sobreposicao(erro):
+    orig = getattr(erro, 'orig', None)
+    return getattr(orig, 'pgcode', None) == PGCODE_EXCLUSAO or NOME_CONSTRAINT in str(orig)
+
+
+class _Trava:
+    """Trava por profissional: Redis (entre processos) ou threading.Lock (só este processo)."""
+
+    def __init__(self, profissional_id):
+        self.profissional_id = profissional_id
+        self._trava = None
+
+    def __enter__(self):
+        redis_client = obter_redis()
+        if redis_client is not None:
+            self._trava = redis_client.lock(
+                f"trava_agenda:{self.profissional_id}", timeout=TRAVA_TIMEOUT, blocking_timeout=TRAVA_ESPERA
+            )
+            adquirida = self._trava.acquire()
+        else:
+            with _travas_lock:
+                self._trava = _travas_locais[self.profissional_id]
+            adquirida = self._trava.acquire(timeout=TRAVA_ESPERA)
+        if not adquirida:
+            # Mesmo contrato dos outros conflitos: sessão limpa (nada pendente para um commit seguinte)
+            db.session.rollback()
+            metricas.incrementar('agendamento_conflito', via='trava_ocupada')
+            raise ConflitoHorario("Agenda ocupada por outra gravação. Tente novamente.")
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._trava.release()
+        except Exception as e:
+            logging.warning(f"Falha ao liberar trava da agenda {self.profissional_id}: {e}")
+        return False
+
+
+class _FimEfetivo(ColumnElement):
+    """data_hora_fim ou, se nulo (encaixes antigos), data_hora + duração — igual a Agendamento.fim."""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(_FimEfetivo)
+def _fim_efetivo_padrao(elemento, compilador, **kw):
+    return compilador.process(func.coalesce(
+        Agendamento.data_hora_fim,
+        Agendamento.data_hora + func.coalesce(Agendamento.duracao_minutos, DURACAO_PADRAO) * literal_column("interval '1 minute'")
+    ), **kw)
+
+
+@compiles(_FimEfetivo, 'sqlite')
+def _fim_efetivo_sqlite(elemento, compilador, **kw):
+    minutos = literal('+').concat(func.coalesce(Agendamento.duracao_minutos, DURACAO_PADRAO)).concat(' minutes')
+    return compilador.process(func.coalesce(Agendamento.data_hora_fim, func.datetime(Agendamento.data_hora, minutos)), **kw)
+
+
+def fim_efetivo():
+    """Expressão SQL do fim do agendamento (mesma regra de Agendamento.fim e da grade)."""
+    return _FimEfetivo()
+
+
+def cruza(inicio, fim):
+    """Filtro SQL dos agendamentos que cruzam [inicio, fim): só colunas do agendamento, sem JOIN."""
+    return and_(
+        Agendamento.data_hora < fim,
+        fim_efetivo() > inicio
+    )
+
+
+def ocupado(profissional_id, inicio, fim, ignorar_id=None):
+    """Existe agendamento do profissional/quarto que cruza [inicio, fim)?"""
+    consulta = Agendamento.query.filter(Agendamento.profissional_id == profissional_id, cruza(inicio, fim))
+    if ignorar_id is not None:
+        consulta = consulta.filter(Agendamento.id != ignorar_id)
+    return db.session.query(consulta.exists()).scalar()
+
+
+def _sobrepoe(agendamento):
+    """Existe outro agendamento do profissional que cruza [data_hora, data_hora_fim)?"""
+    return ocupado(agendamento.profissional_id, agendamento.data_hora, agendamento.data_hora_fim, agendamento.id)
+
+
+def salvar(agendamento):
+    """
+    Grava (insere ou atualiza) o agendamento e faz commit.
+    Levanta ConflitoHorario (com a sessão já em rollback) se sobrepõe outro agendamento.
+    """
+    return salvar_varios([agendamento])[0]
+
+
+def salvar_varios(agendamentos):
+    """
+    Grava vários agendamentos numa única transação (ex.: grupo em vários quartos): ou todos
+    entram ou nenhum. Levanta ConflitoHorario (sessão em rollback) se qualquer um sobrepõe.
+    """
+    for agendamento in agendamentos:
+        if agendamento not in db.session:
+            db.session.add(agendamento)
+
+    if _usa_constraint():
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if _eh_sobreposicao(e):
+                metricas.incrementar('agendamento_conflito', via='constraint')
+                raise ConflitoHorario("Horário já ocupado.") from e
+            raise
+        return agendamentos
+
+    # Travas sempre na mesma ordem (por id) para dois grupos não se travarem mutuamente
+    with ExitStack() as travas:
+        for profissional_id in sorted({ag.profissional_id for ag in agendamentos}):
+            travas.enter_context(_Trava(profissional_id))
+        db.session.flush()
+        if any(_sobrepoe(ag) for ag in agendamentos):
+            db.session.rollback()
+            metricas.incrementar('agendamento_conflito', via='trava')
+            raise ConflitoHorario("Horário já ocupado.")
+        db.session.commit()
+    return agendamentos
@@ -0,0 +1,135 @@
+# app/services/transporte_http.py
+# Camada única de HTTP de saída (WAHA, Meta Graph e downloads de mídia):
+# sessões com keep-alive e pool de conexões por provedor, timeouts padrão,
+# retry com backoff + jitter e métricas por host.
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.util import reraise
+
+from app.services import metricas
+
+# Configuração por provedor: (timeout conexão, timeout leitura), tamanho do pool e retries
+PROVEDORES = {
+    'waha': {'timeout': (3, 20), 'pool': 20, 'tentativas': 3},
+    'meta': {'timeout': (3, 15), 'pool': 20, 'tentativas': 3},
+    'midia': {'timeout': (5, 45), 'pool': 10, 'tentativas': 2},
+}
+
+STATUS_RETRY = (429, 500, 502, 503, 504)
+
+
+class _RetryEnvio(Retry):
+    """
+    POST (envio de mensagem) não é idempotente: só repete quando o servidor
+    recusou explicitamente (429) ou quando a conexão nem abriu (nada foi enviado).
+    Timeout de leitura ou conexão caída depois do envio sobem na hora: o servidor
+    pode ter recebido, e repetir mandaria a mensagem duas vezes.
+    """
+    STATUS_POST_SEGURO = frozenset([429])
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == 'POST':
+            return bool(self.total) and status_code in self.STATUS_POST_SEGURO
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if error is not None and method and method.upper() == 'POST' and not self._is_connection_error(error):
+            # Equivale a read=0 e other=0 só para POST
+            raise reraise(type(error), error, _stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+_sessoes = {}
+_lock = threading.Lock()
+
+
+def _criar_sessao(provedor):
+    conf = PROVEDORES[provedor]
+    retry = _RetryEnvio(
+        total=conf['tentativas'],
+        connect=conf['tentativas'],
+        read=conf['tentativas'],
+        status=conf['tentativas'],
+        backoff_factor=0.5,
+        backoff_jitter=0.3,
+        status_forcelist=STATUS_RETRY,
+        allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'POST']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=conf['pool'], pool_maxsize=conf['pool'], max_retries=retry)
+    sessao = requests.Session()
+    sessao.mount('http://', adapter)
+    sessao.mount('https://', adapter)
+    return sessao
+
+
+def obter_sessao(provedor):
+    """Sessão compartilhada (por processo) do provedor: 'waha', 'meta' ou 'midia'."""
+    sessao = _sessoes.get(provedor)
+    if sessao is None:
+        with _lock:
+            sessao = _sessoes.get(provedor)
+            if sessao is None:
+                sessao = _criar_sessao(provedor)
+                _sessoes[provedor] = sessao
+    return sessao
+
+
+def requisitar(provedor, metodo, url, **kwargs):
+    """
+    Faz a requisição pela sessão do provedor. Aplica o timeout padrão se nenhum
+    for passado e registra latência/status por host. Exceções do requests sobem normalmente.
+    """
+    kwargs.setdefault('timeout', PROVEDORES[provedor]['timeout'])
+    host = urlparse(url).netloc
+    inicio = time.perf_counter()
+    try:
+        resposta = obter_sessao(provedor).request(metodo, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        metricas.incrementar('http_erros', provedor=provedor, host=host, erro=type(e).__name__)
+        raise
+    finally:
+        metricas.observar('http_latencia_ms', (time.perf_counter() - inicio) * 1000, provedor=provedor, host=host)
+    metricas.incrementar('http_respostas', provedor=provedor, host=host, status=resposta.status_code)
+    return resposta
+
+
+def get(provedor, url, **kwargs):
+    return requisitar(provedor, 'GET', url, **kwargs)
+
+
+def post(provedor, url, **kwargs):
+    return requisitar(provedor, 'POST', url, **kwargs)
+
+
+def delete(provedor, url, **kwargs):
+    return requisitar(provedor, 'DELETE', url, **kwargs)
+
+
+def metricas_pools():
+    """Estado dos pools urllib3 por provedor/host (conexões abertas, ociosas e requisições)."""
+    resultado = {}
+    for provedor, sessao in list(_sessoes.items()):
+        adapter = sessao.get_adapter('https://')
+        try:
+            pools = adapter.poolmanager.pools
+            for chave in list(pools.keys()):
+                pool = pools.get(chave)
+                if pool is None:
+                    continue
+                resultado[f"{provedor}:{pool.host}:{pool.port}"] = {
+                    'conexoes_criadas': pool.num_connections,
+                    'requisicoes': pool.num_requests,
+                    'ociosas': pool.pool.qsize() if pool.pool else 0,
+                    'maximo': pool.pool.maxsize if pool.pool else 0,
+                }
+        except Exception as e:
+            logging.warning(f"Não foi possível ler o pool HTTP de '{provedor}': {e}")
+    return resultado
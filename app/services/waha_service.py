@@ -1,9 +1,15 @@
 import os
 import requests
+from app.services import transporte_http
 import time
 import logging
 import base64
 import re
+import threading
+from flask import has_app_context
+from app.extensions import obter_redis
+from app.services import fila_service
+from app.services.fila_service import tarefa
 
 # Configurações do WAHA (Puxamos do ambiente, se não houver, usa a porta 10000 confirmada na Render)
 WAHA_BASE_URL = os.environ.get('WAHA_BASE_URL', 'http://waha-agendamento-ia:10000')
@@ -29,45 +35,79 @@ def formatar_numero_waha(numero):
     return f"{numero_limpo}@c.us"
 
 
-def enviar_mensagem_waha(session_id, to_number, text):
-    """Envia uma mensagem de texto simulando o comportamento humano (Typing...)"""
-    chat_id = formatar_numero_waha(to_number)
-    
-    # 👇 ALTERAÇÃO CIRÚRGICA: Injeta a assinatura invisível da IA (Zero-Width Space)
-    if text and not text.endswith('\u200B'):
-        text = text + "\u200B"
-    
-    # --- ESTRATÉGIA ANTI-BAN: Simular digitação humana ---
+# ==============================================================================
+# ⏱️ ENTREGA AGENDADA (DIGITAÇÃO HUMANA SEM PRENDER THREAD)
+# ==============================================================================
+# Intervalo mínimo entre duas entregas para o mesmo chat (preserva a ordem texto -> mídia)
+INTERVALO_MINIMO_ENVIO = 0.3
+
+_LUA_RESERVAR_ENVIO = """
+local ultimo = tonumber(redis.call('GET', KEYS[1]) or '0')
+local t = math.max(tonumber(ARGV[1]) + tonumber(ARGV[2]), ultimo + tonumber(ARGV[3]))
+redis.call('SET', KEYS[1], tostring(t), 'EX', 120)
+return tostring(t)
+"""
+_proximo_envio_local = {}
+_proximo_envio_lock = threading.Lock()
+
+
+def _reservar_horario_envio(session_id, chat_id, atraso):
+    """
+    Reserva o próximo horário de entrega do chat: agora + atraso, mas nunca antes da
+    entrega anterior já agendada para o mesmo chat (mensagens saem na ordem em que foram pedidas).
+    """
+    agora = time.time()
+    cliente_redis = obter_redis()
+    if cliente_redis:
+        try:
+            return float(cliente_redis.eval(
+                _LUA_RESERVAR_ENVIO, 1, f"waha:proximo_envio:{session_id}:{chat_id}",
+                agora, atraso, INTERVALO_MINIMO_ENVIO
+            ))
+        except Exception as e:
+            logging.warning(f"[WAHA] Falha ao reservar horário no Redis, usando relógio local: {e}")
+    with _proximo_envio_lock:
+        chave = (session_id, chat_id)
+        t = max(agora + atraso, _proximo_envio_local.get(chave, 0) + INTERVALO_MINIMO_ENVIO)
+        _proximo_envio_local[chave] = t
+        return t
+
+
+def _iniciar_digitacao(session_id, chat_id):
     try:
-        requests.post(
+        transporte_http.post(
+            'waha',
             f"{WAHA_BASE_URL}/api/startTyping",
             json={"session": session_id, "chatId": chat_id},
             headers=get_waha_headers(),
             timeout=10
         )
-        # Calcula um tempo de pausa realista baseado no tamanho da frase (max 3 segundos)
-        tempo_pausa = min(len(text) * 0.05, 3) 
-        time.sleep(tempo_pausa)
-        
-        # Para a digitação
-        requests.post(
+    except Exception as e:
+        logging.warning(f"Aviso WAHA (Ignorável): Falha ao simular digitação: {e}")
+
+
+def _parar_digitacao(session_id, chat_id):
+    try:
+        transporte_http.post(
+            'waha',
             f"{WAHA_BASE_URL}/api/stopTyping",
             json={"session": session_id, "chatId": chat_id},
             headers=get_waha_headers(),
             timeout=10
         )
     except Exception as e:
-        logging.warning(f"Aviso WAHA (Ignorável): Falha ao simular digitação: {e}")
+        logging.warning(f"Aviso WAHA (Ignorável): Falha ao parar digitação: {e}")
+
 
-    # --- ENVIO REAL DA MENSAGEM ---
+def _enviar_texto_agora(session_id, chat_id, text):
     payload = {
         "session": session_id,
         "chatId": chat_id,
         "text": text
     }
-    
     try:
-        response = requests.post(
+        response = transporte_http.post(
+            'waha',
             f"{WAHA_BASE_URL}/api/sendText",
             json=payload,
             headers=get_waha_headers(),
@@ -76,15 +116,13 @@ def enviar_mensagem_waha(session_id, to_number, text):
         response.raise_for_status() # Dispara erro se não for Status 200
         logging.info(f"[WAHA] Mensagem enviada com sucesso para {chat_id}")
         return True, response.json()
-    
+
     except requests.exceptions.RequestException as e:
         logging.error(f"[WAHA] Erro crítico ao enviar mensagem: {e}")
         return False, str(e)
 
 
-def enviar_midia_waha(session_id, to_number, url_arquivo, caption=""):
-    """Envia imagem/mídia via WAHA forçando o formato de Imagem (Foto nativa)"""
-    chat_id = formatar_numero_waha(to_number)
+def _enviar_midia_agora(session_id, chat_id, url_arquivo, caption=""):
     payload = {
         "session": session_id,
         "chatId": chat_id,
@@ -92,8 +130,9 @@ def enviar_midia_waha(session_id, to_number, url_arquivo, caption=""):
         "caption": caption
     }
     try:
-        response = requests.post(
-            f"{WAHA_BASE_URL}/api/sendImage", 
+        response = transporte_http.post(
+            'waha',
+            f"{WAHA_BASE_URL}/api/sendImage",
             json=payload,
             headers=get_waha_headers(),
             timeout=30
@@ -106,10 +145,68 @@ def enviar_midia_waha(session_id, to_number, url_arquivo, caption=""):
         return False
 
 
+@tarefa('waha.enviar_texto')
+def _tarefa_enviar_texto(session_id, chat_id, text):
+    _parar_digitacao(session_id, chat_id)
+    _enviar_texto_agora(session_id, chat_id, text)
+
+
+@tarefa('waha.enviar_midia')
+def _tarefa_enviar_midia(session_id, chat_id, url_arquivo, caption=""):
+    _enviar_midia_agora(session_id, chat_id, url_arquivo, caption)
+
+
+def enviar_mensagem_waha(session_id, to_number, text):
+    """
+    Envia uma mensagem de texto simulando o comportamento humano (Typing...).
+    A digitação começa na hora; a pausa e o envio real são agendados na fila de envios,
+    então nenhuma thread fica parada durante o atraso anti-ban.
+    """
+    chat_id = formatar_numero_waha(to_number)
+    
+    # 👇 ALTERAÇÃO CIRÚRGICA: Injeta a assinatura invisível da IA (Zero-Width Space)
+    if text and not text.endswith('\u200B'):
+        text = text + "\u200B"
+    
+    # --- ESTRATÉGIA ANTI-BAN: Simular digitação humana ---
+    _iniciar_digitacao(session_id, chat_id)
+    # Calcula um tempo de pausa realista baseado no tamanho da frase (max 3 segundos)
+    tempo_pausa = min(len(text) * 0.05, 3)
+
+    # Fora de um app context (ex: threads antigas do painel) não há fila: envio síncrono
+    if not has_app_context():
+        time.sleep(tempo_pausa)
+        _parar_digitacao(session_id, chat_id)
+        return _enviar_texto_agora(session_id, chat_id, text)
+
+    executar_em = _reservar_horario_envio(session_id, chat_id, tempo_pausa)
+    fila_service.agendar_em(
+        'waha.enviar_texto', executar_em, fila=fila_service.FILA_ENVIOS,
+        session_id=session_id, chat_id=chat_id, text=text
+    )
+    return True, {"status": "agendado", "executar_em": executar_em}
+
+
+def enviar_midia_waha(session_id, to_number, url_arquivo, caption=""):
+    """Envia imagem/mídia via WAHA forçando o formato de Imagem (Foto nativa)"""
+    chat_id = formatar_numero_waha(to_number)
+
+    if not has_app_context():
+        return _enviar_midia_agora(session_id, chat_id, url_arquivo, caption)
+
+    # Mesma fila/ordem dos textos: a foto nunca chega antes da frase que a anuncia
+    executar_em = _reservar_horario_envio(session_id, chat_id, 0)
+    fila_service.agendar_em(
+        'waha.enviar_midia', executar_em, fila=fila_service.FILA_ENVIOS,
+        session_id=session_id, chat_id=chat_id, url_arquivo=url_arquivo, caption=caption
+    )
+    return True
+
+
 def status_sessao_waha(session_id):
     """Verifica o status no WAHA antes de tomar qualquer atitude destrutiva."""
     try:
-        response = requests.get(f"{WAHA_BASE_URL}/api/sessions", headers=get_waha_headers(), timeout=5)
+        response = transporte_http.get('waha', f"{WAHA_BASE_URL}/api/sessions", headers=get_waha_headers(), timeout=5)
         if response.status_code == 200:
             sessoes = response.json()
             for s in sessoes:
@@ -137,7 +234,7 @@ def criar_sessao_waha(session_id):
     if status_atual == 'STOPPED':
         logging.info(f"🚀 [WAHA] Sessão estava pausada. A dar a ignição...")
         try:
-            requests.post(f"{WAHA_BASE_URL}/api/sessions/{session_id}/start", headers=get_waha_headers(), timeout=5)
+            transporte_http.post('waha', f"{WAHA_BASE_URL}/api/sessions/{session_id}/start", headers=get_waha_headers(), timeout=5)
         except:
             pass
         return True, {"status": "starting"}
@@ -147,8 +244,8 @@ def criar_sessao_waha(session_id):
     # =====================================================================
     logging.info(f"🧹 [WAHA] Sessão morta ou inexistente. Limpando e recriando...")
     try:
-        requests.post(f"{WAHA_BASE_URL}/api/sessions/{session_id}/stop", headers=get_waha_headers(), timeout=3)
-        requests.delete(f"{WAHA_BASE_URL}/api/sessions/{session_id}", headers=get_waha_headers(), timeout=3)
+        transporte_http.post('waha', f"{WAHA_BASE_URL}/api/sessions/{session_id}/stop", headers=get_waha_headers(), timeout=3)
+        transporte_http.delete('waha', f"{WAHA_BASE_URL}/api/sessions/{session_id}", headers=get_waha_headers(), timeout=3)
     except:
         pass # Ignora erros de limpeza se não havia nada para limpar
 
@@ -169,7 +266,8 @@ def criar_sessao_waha(session_id):
     
     try:
         # 1. Cria a sessão e avisa para onde mandar as mensagens
-        response = requests.post(
+        response = transporte_http.post(
+            'waha',
             f"{WAHA_BASE_URL}/api/sessions/",
             json=payload,
             headers=get_waha_headers(),
@@ -177,7 +275,8 @@ def criar_sessao_waha(session_id):
         )
         
         # 2. Gira a Chave de Ignição
-        requests.post(
+        transporte_http.post(
+            'waha',
             f"{WAHA_BASE_URL}/api/sessions/{session_id}/start",
             headers=get_waha_headers(),
             timeout=10
@@ -216,7 +315,8 @@ def obter_qr_code_waha(session_id):
     # 2. SE ESTIVER PRONTO (SCAN_QR_CODE), PUXA A FOTO
     try:
         logging.info(f"📸 [WAHA] Motor pronto! Baixando a imagem do QR Code...")
-        response = requests.get(
+        response = transporte_http.get(
+            'waha',
             f"{WAHA_BASE_URL}/api/{session_id}/auth/qr",
             headers=get_waha_headers(),
             timeout=10
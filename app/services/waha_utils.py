@@ -1,11 +1,11 @@
 # app/services/waha_utils.py
 import logging
-import requests
 import tempfile
 import os
 import urllib.parse
 import google.generativeai as genai
 from app.services.waha_service import WAHA_BASE_URL, get_waha_headers
+from app.services import transporte_http
 
 def transcrever_audio_gemini(audio_bytes):
     """Usa a IA nativa do Gemini para ouvir e transcrever o áudio"""
@@ -72,7 +72,7 @@ def extrair_e_filtrar_mensagem_waha(payload, session_id=None):
             logging.info(f"🔗 Baixando áudio da URL oficial: {url_download}")
             
             # Baixa o áudio com a API Key correta
-            response = requests.get(url_download, headers=get_waha_headers(), timeout=45)
+            response = transporte_http.get('midia', url_download, headers=get_waha_headers(), timeout=45)
             
             if response.status_code == 200:
                 logging.info("✅ Áudio baixado com sucesso da API!")
@@ -0,0 +1,95 @@
+# benchmark_disponibilidade.py
+# Compara o motor de disponibilidade (app/core/disponibilidade.py) com o loop antigo
+# (cada horário de 30 em 30 testado contra cada agendamento, com localize() a cada passo)
+# em dias cheios. Confere também que os dois devolvem exatamente os mesmos horários.
+#
+# Uso: python benchmark_disponibilidade.py [repeticoes]
+import sys
+import random
+import timeit
+from types import SimpleNamespace
+from datetime import datetime, time, timedelta
+
+from app.core import disponibilidade, horarios
+from app.core.disponibilidade import BR_TZ
+
+
+def loop_antigo(dia, agora, abre, fecha, ocupados_min, duracao, eh_carol):
+    """Cópia fiel do cálculo anterior (sem o acesso ao banco)."""
+    dia_base = datetime.combine(dia.date(), time.min)
+    horario_iteracao = BR_TZ.localize(dia_base + timedelta(minutes=abre), is_dst=None)
+    fim_do_dia = BR_TZ.localize(dia_base + timedelta(minutes=fecha), is_dst=None)
+    almoco_inicio = almoco_fim = None
+    if eh_carol:
+        almoco_inicio = BR_TZ.localize(dia_base.replace(hour=12, minute=0), is_dst=None)
+        almoco_fim = BR_TZ.localize(dia_base.replace(hour=13, minute=0), is_dst=None)
+
+    intervalos_ocupados = []
+    for inicio, fim in ocupados_min:
+        inicio_ocupado = BR_TZ.localize(dia_base + timedelta(minutes=inicio), is_dst=None)
+        intervalos_ocupados.append((inicio_ocupado, inicio_ocupado + timedelta(minutes=fim - inicio)))
+
+    horarios = []
+    while horario_iteracao + timedelta(minutes=duracao) <= fim_do_dia:
+        fim_slot = horario_iteracao + timedelta(minutes=duracao)
+        esta_ocupado = False
+        for inicio_oc, fim_oc in intervalos_ocupados:
+            if horario_iteracao < fim_oc and fim_slot > inicio_oc:
+                esta_ocupado = True
+                break
+        if not esta_ocupado and eh_carol and almoco_inicio:
+            if horario_iteracao < almoco_fim and fim_slot > almoco_inicio:
+                esta_ocupado = True
+        if not esta_ocupado and dia.date() == agora.date():
+            if horario_iteracao < agora + timedelta(minutes=15):
+                esta_ocupado = True
+        if not esta_ocupado:
+            horarios.append(horario_iteracao)
+        horario_iteracao += timedelta(minutes=30)
+    return horarios
+
+
+def dia_cheio(rng, abre, fecha, qtd):
+    """Agendamentos aleatórios (podem se sobrepor, como encaixes e bloqueios administrativos)."""
+    ocupados = []
+    for _ in range(qtd):
+        inicio = rng.randrange(abre, fecha, 15)
+        ocupados.append((inicio, inicio + rng.choice([15, 30, 45, 60, 90, 120])))
+    return ocupados
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+
+    # Terça-feira da Carol: 09h-22h, almoço 12h-13h
+    barbearia = SimpleNamespace(
+        id=1, horario_abertura='09:00', horario_fechamento='19:00',
+        horario_fechamento_sabado='14:00', dias_funcionamento='Carol: Terça a Sábado (Misto)'
+    )
+    dia = BR_TZ.localize(datetime(2030, 1, 8))
+    agora = BR_TZ.localize(datetime(2030, 1, 8, 10, 7, 30))
+    calendario = horarios.compilar(barbearia)
+    abre, fecha, _ = calendario.expediente(dia)
+
+    print(f"{'agendamentos':>12} {'duração':>8} {'antigo (µs)':>12} {'motor (µs)':>11} {'ganho':>6}")
+    for qtd in (5, 20, 60, 150):
+        for duracao in (30, 90):
+            ocupados = dia_cheio(rng, abre, fecha, qtd)
+
+            antigo = loop_antigo(dia, agora, abre, fecha, ocupados, duracao, True)
+            novo = disponibilidade.calcular_horarios(barbearia, 1, dia, duracao, ocupados=ocupados, agora=agora, calendario=calendario)
+            assert antigo == novo, f"Resultados diferentes ({qtd} agendamentos, {duracao} min)"
+
+            t_antigo = timeit.timeit(
+                lambda: loop_antigo(dia, agora, abre, fecha, ocupados, duracao, True), number=repeticoes
+            ) / repeticoes * 1e6
+            t_novo = timeit.timeit(
+                lambda: disponibilidade.calcular_horarios(barbearia, 1, dia, duracao, ocupados=ocupados, agora=agora, calendario=calendario),
+                number=repeticoes
+            ) / repeticoes * 1e6
+            print(f"{qtd:>12} {duracao:>8} {t_antigo:>12.1f} {t_novo:>11.1f} {t_antigo / t_novo:>5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# benchmark_quartos.py
+# Compara o inventário de quartos (app/services/inventario_quartos.py, uma consulta para todos
+# os quartos) com o loop antigo do hotel_service (para cada quarto candidato, todas as reservas
+# futuras e ag.servico carregado um a um para saber a duração) numa pousada com centenas de
+# reservas. Confere também que os dois devolvem exatamente os mesmos quartos livres.
+#
+# Usa o banco de DATABASE_URL. Cria uma pousada temporária e apaga tudo no fim.
+#
+# Uso: python benchmark_quartos.py [quartos] [reservas] [consultas]
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+from app import create_app
+from app.extensions import db
+from app.models.tables import Barbearia, Profissional, Servico, Agendamento
+from app.services import inventario_quartos
+
+
+def loop_antigo(barbearia_id, entrada, saida, pessoas):
+    """Como verificar_disponibilidade_hotel fazia: N+1 consultas e reservas sem limite de data."""
+    candidatos = Profissional.query.filter(
+        Profissional.barbearia_id == barbearia_id,
+        Profissional.tipo == 'quarto',
+        Profissional.capacidade >= pessoas
+    ).all()
+    livres = []
+    for quarto in candidatos:
+        agendamentos = Agendamento.query.filter(
+            Agendamento.profissional_id == quarto.id,
+            Agendamento.data_hora >= datetime.now().replace(hour=0, minute=0)
+        ).all()
+        ocupado = False
+        for ag in agendamentos:
+            duracao = ag.servico.duracao if ag.servico else 1440
+            if entrada < ag.data_hora + timedelta(minutes=duracao) and saida > ag.data_hora:
+                ocupado = True
+                break
+        if not ocupado:
+            livres.append(quarto.id)
+    return sorted(livres)
+
+
+def main():
+    qtd_quartos = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    qtd_reservas = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    qtd_consultas = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    rng = random.Random(42)
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        loja = Barbearia(nome_fantasia='Benchmark Pousada', telefone_whatsapp=f'bench{int(time.time())}', business_type='pousada')
+        db.session.add(loja)
+        db.session.commit()
+        quartos = [
+            Profissional(nome=f'Quarto {i:02d}', tipo='quarto', capacidade=rng.choice([2, 2, 3, 4, 6]), barbearia_id=loja.id)
+            for i in range(qtd_quartos)
+        ]
+        pacotes = {d: Servico(nome=f'{d} diária(s)', duracao=d * 1440, preco=200 * d, barbearia_id=loja.id) for d in (1, 2, 3)}
+        db.session.add_all(quartos + list(pacotes.values()))
+        db.session.commit()
+
+        # Reservas futuras sem sobreposição por quarto (fim gravado = duração do pacote)
+        amanha = (datetime.now() + timedelta(days=1)).replace(hour=12, minute=0, second=0, microsecond=0)
+        livre_a_partir = {q.id: amanha for q in quartos}
+        linhas = []
+        for _ in range(qtd_reservas):
+            quarto = rng.choice(quartos)
+            dias = rng.choice([1, 2, 3])
+            entrada = livre_a_partir[quarto.id] + timedelta(days=rng.randrange(0, 3))
+            livre_a_partir[quarto.id] = entrada + timedelta(days=dias)
+            linhas.append(Agendamento(
+                nome_cliente='Hóspede', telefone_cliente='0', data_hora=entrada,
+                data_hora_fim=entrada + timedelta(days=dias), profissional_id=quarto.id,
+                servico_id=pacotes[dias].id, barbearia_id=loja.id
+            ))
+        db.session.add_all(linhas)
+        db.session.commit()
+        horizonte = max(livre_a_partir.values())
+
+        consultas = []
+        for _ in range(qtd_consultas):
+            dia = amanha + timedelta(days=rng.randrange(0, max((horizonte - amanha).days, 1)))
+            qtd_dias = rng.choice([1, 1.5, 2])
+            consultas.append((dia.strftime('%Y-%m-%d'), qtd_dias, rng.choice([1, 2, 4, 6])))
+
+        t_antigo = t_novo = 0.0
+        for data_entrada, qtd_dias, pessoas in consultas:
+            entrada, saida = inventario_quartos.periodo_estadia(data_entrada, qtd_dias)
+
+            db.session.expire_all()
+            inicio = time.perf_counter()
+            antigo = loop_antigo(loja.id, entrada, saida, pessoas)
+            t_antigo += time.perf_counter() - inicio
+
+            db.session.expire_all()
+            inicio = time.perf_counter()
+            novo = sorted(q.id for q in inventario_quartos.quartos_livres(loja.id, entrada, saida, pessoas))
+            t_novo += time.perf_counter() - inicio
+
+            assert antigo == novo, f"Resultados diferentes em {data_entrada} ({qtd_dias} diárias, {pessoas} pessoas)"
+
+        # Grupo grande: precisa dividir em vários quartos
+        entrada, saida = inventario_quartos.periodo_estadia(consultas[0][0], 2)
+        grupo = inventario_quartos.combinar_quartos(inventario_quartos.quartos_livres(loja.id, entrada, saida), 15)
+        grupo = [q.capacidade for q in grupo] if grupo else None
+        dialeto = db.engine.dialect.name
+
+        Agendamento.query.filter_by(barbearia_id=loja.id).delete()
+        Servico.query.filter_by(barbearia_id=loja.id).delete()
+        Profissional.query.filter_by(barbearia_id=loja.id).delete()
+        db.session.delete(db.session.get(Barbearia, loja.id))
+        db.session.commit()
+
+    print(f"banco: {dialeto}")
+    print(f"{qtd_quartos} quartos, {qtd_reservas} reservas, {qtd_consultas} consultas")
+    print(f"loop antigo: {t_antigo / qtd_consultas * 1000:.1f} ms/consulta")
+    print(f"inventário:  {t_novo / qtd_consultas * 1000:.1f} ms/consulta ({t_antigo / t_novo:.1f}x)")
+    if grupo:
+        print(f"grupo de 15 pessoas: {len(grupo)} quarto(s), capacidades {grupo}")
+    else:
+        print("grupo de 15 pessoas: sem combinação livre")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# carga_reservas.py
+# Teste de carga da gravação de agendamentos (app/services/reserva_service.py):
+# várias threads disputam os mesmos horários do mesmo profissional ao mesmo tempo e, no
+# fim, o banco é conferido por uma auto-junção: não pode existir nenhum par sobreposto.
+#
+# Usa o banco de DATABASE_URL (PostgreSQL -> constraint de exclusão; SQLite -> trava).
+# Cria uma loja temporária e apaga tudo no fim.
+#
+# Uso: python carga_reservas.py [threads] [tentativas_por_thread]
+import sys
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_
+from sqlalchemy.orm import aliased
+
+from app import create_app
+from app.extensions import db
+from app.models.tables import Barbearia, Profissional, Servico, Agendamento
+from app.services import reserva_service
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    tentativas = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        loja = Barbearia(nome_fantasia='Carga Reservas', telefone_whatsapp=f'carga{int(time.time())}')
+        db.session.add(loja)
+        db.session.commit()
+        prof = Profissional(nome='Carga', barbearia_id=loja.id)
+        servicos = [Servico(nome=f'Carga {d}', duracao=d, preco=0, barbearia_id=loja.id) for d in (30, 45, 60, 90)]
+        db.session.add_all([prof] + servicos)
+        db.session.commit()
+        loja_id, prof_id, servico_ids = loja.id, prof.id, [s.id for s in servicos]
+
+    # 20 horários de 30 em 30 a partir de amanhã 09h, disputados por todas as threads
+    base = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    horarios = [base + timedelta(minutes=30 * i) for i in range(20)]
+    contagem = {'ok': 0, 'conflito': 0, 'erro': 0}
+    lock = threading.Lock()
+    largada = threading.Barrier(threads)
+
+    def cliente(n):
+        rng = random.Random(n)
+        largada.wait()
+        for _ in range(tentativas):
+            with app.app_context():
+                ag = Agendamento(
+                    nome_cliente=f'cliente {n}', telefone_cliente='0', data_hora=rng.choice(horarios),
+                    profissional_id=prof_id, servico_id=rng.choice(servico_ids), barbearia_id=loja_id
+                )
+                try:
+                    reserva_service.salvar(ag)
+                    resultado = 'ok'
+                except reserva_service.ConflitoHorario:
+                    resultado = 'conflito'
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"erro: {e}")
+                    resultado = 'erro'
+            with lock:
+                contagem[resultado] += 1
+
+    inicio = time.perf_counter()
+    pool = [threading.Thread(target=cliente, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    with app.app_context():
+        a, b = aliased(Agendamento), aliased(Agendamento)
+        sobrepostos = db.session.query(a.id, b.id).filter(
+            a.profissional_id == prof_id,
+            b.profissional_id == prof_id,
+            a.id < b.id,
+            and_(a.data_hora < b.data_hora_fim, b.data_hora < a.data_hora_fim)
+        ).count()
+        gravados = Agendamento.query.filter_by(profissional_id=prof_id).count()
+        dialeto = db.engine.dialect.name
+
+        Agendamento.query.filter_by(barbearia_id=loja_id).delete()
+        db.session.delete(db.session.get(Barbearia, loja_id))
+        db.session.commit()
+
+    total = threads * tentativas
+    print(f"banco: {dialeto}")
+    print(f"{total} tentativas em {duracao:.2f}s ({total / duracao:.0f}/s) com {threads} threads")
+    print(f"gravados={gravados} ok={contagem['ok']} conflitos={contagem['conflito']} erros={contagem['erro']}")
+    print(f"pares sobrepostos no banco: {sobrepostos}")
+    assert sobrepostos == 0, "Agendamento duplo detectado!"
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -55,6 +56,69 @@ class Config:
     CACHE_REDIS_URL: str | None = os.environ.get('CACHE_REDIS_URL', None)
     # --- FIM DA IMPLEMENTAÇÃO ---
 
+    # --- FILA DE MENSAGENS (WEBHOOKS ASSÍNCRONOS) ---
+    # 'auto' usa Redis (REDIS_URL) se existir, senão uma fila local em memória.
+    FILA_BACKEND: str = os.environ.get('FILA_BACKEND', 'auto')
+    # Threads consumidoras por fila (em cada processo que roda workers).
+    FILA_WORKERS: int = int(os.environ.get('FILA_WORKERS', 4))
+    # True: o próprio processo web sobe os workers. False: só `flask worker` consome.
+    FILA_WORKERS_EMBUTIDOS: bool = os.environ.get('FILA_WORKERS_EMBUTIDOS', 'true').lower() == 'true'
+    FILA_MAX_TENTATIVAS: int = int(os.environ.get('FILA_MAX_TENTATIVAS', 3))
+    # Janela (s) de silêncio para juntar rajadas ("oi" / "quero cortar" / "amanhã") numa única
+    # chamada da IA. 0 desativa. JANELA_MAXIMA limita a espera em rajadas longas.
+    CONVERSA_JANELA_AGRUPAMENTO: float = float(os.environ.get('CONVERSA_JANELA_AGRUPAMENTO', 1.5))
+    CONVERSA_JANELA_MAXIMA: float = float(os.environ.get('CONVERSA_JANELA_MAXIMA', 6))
+
+    # --- HISTÓRICO DA IA (COMPACTAÇÃO) ---
+    # Orçamento padrão (tokens ≈ caracteres/4) da parte variável da conversa enviada ao Gemini.
+    # Cada loja pode sobrescrever com Barbearia.limite_tokens_historico.
+    HISTORICO_LIMITE_TOKENS: int = int(os.environ.get('HISTORICO_LIMITE_TOKENS', 6000))
+    # Turnos mais recentes mantidos na íntegra; os anteriores viram resumo.
+    HISTORICO_TURNOS_RECENTES: int = int(os.environ.get('HISTORICO_TURNOS_RECENTES', 12))
+
+    # --- CACHE DO PREFIXO DO PROMPT NO PROVEDOR (system prompt + tools) ---
+    # 'gemini' (cached content), 'local' (fake em memória, testes) ou 'desligado'
+    IA_CACHE_PREFIXO: str = os.environ.get('IA_CACHE_PREFIXO', 'gemini')
+    IA_CACHE_PREFIXO_TTL: int = int(os.environ.get('IA_CACHE_PREFIXO_TTL', 3600))
+    # Prompts menores que isso (tokens ≈ caracteres/4) não são cacheados
+    IA_CACHE_PREFIXO_MIN_TOKENS: int = int(os.environ.get('IA_CACHE_PREFIXO_MIN_TOKENS', 1024))
+
+    # --- CACHE DE OCUPAÇÃO (bitmap por profissional/dia, 5 min por bit) ---
+    # Validade no Redis e na camada local (por processo) em segundos
+    OCUPACAO_TTL: int = int(os.environ.get('OCUPACAO_TTL', 6 * 3600))
+    OCUPACAO_TTL_LOCAL: float = float(os.environ.get('OCUPACAO_TTL_LOCAL', 10))
+
+    # --- FEED DO CALENDÁRIO DE RESERVAS ---
+    # Dias que as lápides de agendamentos apagados ficam guardadas; um ?since= mais antigo
+    # que isso faz o calendário recarregar a janela inteira
+    CALENDARIO_DELTA_MAX_DIAS: int = int(os.environ.get('CALENDARIO_DELTA_MAX_DIAS', 7))
+
+    # --- DIRETÓRIO DE LOJAS (roteamento dos webhooks em memória) ---
+    # Recarga completa do snapshot em segundos; edições chegam antes pelo pub/sub do Redis
+    DIRETORIO_LOJAS_TTL: int = int(os.environ.get('DIRETORIO_LOJAS_TTL', 300))
+
+    # --- HISTÓRICO DAS CONVERSAS (ChatLog gravado em lote) ---
+    # Intervalo máximo (ms) entre gravações; 0 grava cada linha na hora
+    CHATLOG_FLUSH_MS: int = int(os.environ.get('CHATLOG_FLUSH_MS', 500))
+    # Linhas que disparam a gravação antes do intervalo / teto do buffer em memória
+    CHATLOG_LOTE: int = int(os.environ.get('CHATLOG_LOTE', 200))
+    CHATLOG_BUFFER_MAX: int = int(os.environ.get('CHATLOG_BUFFER_MAX', 5000))
+    # Pasta do despejo em arquivo (buffer cheio ou banco fora do ar); padrão: pasta temporária do sistema
+    CHATLOG_DESPEJO_DIR: str | None = os.environ.get('CHATLOG_DESPEJO_DIR', None)
+    # Guarda do histórico (dias) e prazo por nome do plano, ex.: '{"Básico": 90, "Premium": 730}'
+    CHATLOG_RETENCAO_DIAS: int = int(os.environ.get('CHATLOG_RETENCAO_DIAS', 365))
+    CHATLOG_RETENCAO_POR_PLANO: dict = json.loads(os.environ.get('CHATLOG_RETENCAO_POR_PLANO', '{}'))
+    # Destino dos arquivos JSONL.gz exportados por `flask arquivar-chatlogs`
+    CHATLOG_ARQUIVO_DIR: str = os.environ.get('CHATLOG_ARQUIVO_DIR', str(BASE_DIR / 'arquivo_chatlogs'))
+
+    # --- MONITOR DE CONVERSAS AO VIVO (SSE) ---
+    # Duração de cada conexão (s) antes do navegador reconectar; conferência/batimento sem aviso (s)
+    MONITOR_SSE_DURACAO: int = int(os.environ.get('MONITOR_SSE_DURACAO', 55))
+    MONITOR_SSE_INTERVALO: int = int(os.environ.get('MONITOR_SSE_INTERVALO', 15))
+    # Conexões ao vivo por processo (cada uma ocupa uma thread do gunicorn, ver gunicorn.conf.py);
+    # acima disso o monitor cai para polling a cada MONITOR_SSE_INTERVALO
+    MONITOR_SSE_MAX_CONEXOES: int = int(os.environ.get('MONITOR_SSE_MAX_CONEXOES', 8))
+
     @classmethod
     def init_app(cls) -> None:
         """
@@ -0,0 +1,10 @@
+# gunicorn.conf.py
+# Lido automaticamente pelo gunicorn quando ele sobe na raiz do projeto.
+# O monitor de conversas ao vivo (/dashboard/monitor/eventos, SSE) mantém uma conexão
+# aberta por painel. Com workers sync cada painel prenderia um processo inteiro e os
+# webhooks ficariam na fila atrás deles; com gthread cada conexão ocupa só uma thread.
+# O número de processos continua vindo de WEB_CONCURRENCY (padrão do gunicorn).
+import os
+
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
@@ -0,0 +1,161 @@
+"""chat_logs com char_count/token_count gravados; no PostgreSQL, particionada por mês
+
+Revision ID: 3c8e5a1f7d42
+Revises: f1c9a27e4b80
+Create Date: 2026-10-17 21:05:37.604118
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e5a1f7d42'
+down_revision = 'f1c9a27e4b80'
+branch_labels = None
+depends_on = None
+
+COLUNAS = 'id, barbearia_id, cliente_telefone, mensagem, tipo, data_hora, char_count, token_count'
+
+
+def _meses(primeiro, ultimo):
+    atual = datetime(primeiro.year, primeiro.month, 1)
+    while atual <= ultimo:
+        proximo = datetime(atual.year + atual.month // 12, atual.month % 12 + 1, 1)
+        yield atual, proximo
+        atual = proximo
+
+
+def _indices():
+    op.create_index('ix_chat_logs_loja_tel_data', 'chat_logs', ['barbearia_id', 'cliente_telefone', 'data_hora'], unique=False)
+    op.create_index('ix_chat_logs_data_tipo', 'chat_logs', ['data_hora', 'tipo'], unique=False)
+
+
+def _remover_indices():
+    # Os índices podem faltar em bancos onde chat_logs nasceu via create_all antes deles
+    existentes = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('chat_logs')}
+    for nome in ('ix_chat_logs_loja_tel_data', 'ix_chat_logs_data_tipo'):
+        if nome in existentes:
+            op.drop_index(nome, table_name='chat_logs')
+
+
+def _tabela_particionada(sequencia):
+    op.execute(f"""
+        CREATE TABLE chat_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequencia}'),
+            barbearia_id INTEGER REFERENCES barbearia (id),
+            cliente_telefone VARCHAR(30),
+            mensagem TEXT,
+            tipo VARCHAR(10),
+            data_hora TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            char_count INTEGER,
+            token_count INTEGER,
+            CONSTRAINT chat_logs_pkey PRIMARY KEY (id, data_hora)
+        ) PARTITION BY RANGE (data_hora)
+    """)
+    op.execute(f"ALTER SEQUENCE {sequencia} OWNED BY chat_logs.id")
+    op.execute("CREATE TABLE chat_logs_padrao PARTITION OF chat_logs DEFAULT")
+
+
+def _particoes_mensais(primeiro):
+    agora = datetime.now()
+    indice = agora.year * 12 + agora.month - 1 + 2  # partições até 2 meses adiante
+    ultimo = datetime(indice // 12, indice % 12 + 1, 1)
+    for inicio, fim in _meses(min(primeiro or agora, agora), ultimo):
+        op.execute(
+            f"CREATE TABLE chat_logs_{inicio:%Y_%m} PARTITION OF chat_logs "
+            f"FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')"
+        )
+
+
+def upgrade():
+    bind = op.get_bind()
+    postgres = bind.dialect.name == 'postgresql'
+
+    # chat_logs pode não existir em bancos criados só pelas migrações (a tabela nasceu via create_all)
+    if 'chat_logs' not in sa.inspect(bind).get_table_names():
+        if postgres:
+            op.execute("CREATE SEQUENCE chat_logs_id_seq")
+            _tabela_particionada('chat_logs_id_seq')
+            _particoes_mensais(None)
+        else:
+            op.create_table(
+                'chat_logs',
+                sa.Column('id', sa.Integer(), nullable=False),
+                sa.Column('barbearia_id', sa.Integer(), nullable=True),
+                sa.Column('cliente_telefone', sa.String(length=30), nullable=True),
+                sa.Column('mensagem', sa.Text(), nullable=True),
+                sa.Column('tipo', sa.String(length=10), nullable=True),
+                sa.Column('data_hora', sa.DateTime(), nullable=False),
+                sa.Column('char_count', sa.Integer(), nullable=True),
+                sa.Column('token_count', sa.Integer(), nullable=True),
+                sa.ForeignKeyConstraint(['barbearia_id'], ['barbearia.id']),
+                sa.PrimaryKeyConstraint('id')
+            )
+        _indices()
+        return
+
+    if not postgres:
+        # SQLite: tabela comum, só as colunas novas
+        op.execute("UPDATE chat_logs SET data_hora = CURRENT_TIMESTAMP WHERE data_hora IS NULL")
+        with op.batch_alter_table('chat_logs', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('char_count', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('token_count', sa.Integer(), nullable=True))
+            batch_op.alter_column('data_hora', existing_type=sa.DateTime(), nullable=False)
+        op.execute("UPDATE chat_logs SET char_count = length(coalesce(mensagem, '')), "
+                   "token_count = (length(coalesce(mensagem, '')) + 3) / 4")
+        return
+
+    # PostgreSQL: recria como tabela particionada (a chave da partição entra na PK) e copia
+    sequencia = bind.execute(sa.text("SELECT pg_get_serial_sequence('chat_logs', 'id')")).scalar()
+    _remover_indices()
+    op.execute("ALTER TABLE chat_logs RENAME TO chat_logs_antiga")
+    op.execute("ALTER TABLE chat_logs_antiga RENAME CONSTRAINT chat_logs_pkey TO chat_logs_antiga_pkey")
+    op.execute(f"ALTER SEQUENCE {sequencia} OWNED BY NONE")
+    _tabela_particionada(sequencia)
+    _particoes_mensais(bind.execute(sa.text("SELECT min(data_hora) FROM chat_logs_antiga")).scalar())
+
+    op.execute(f"""
+        INSERT INTO chat_logs ({COLUNAS})
+        SELECT id, barbearia_id, cliente_telefone, mensagem, tipo, coalesce(data_hora, now()),
+               length(coalesce(mensagem, '')), (length(coalesce(mensagem, '')) + 3) / 4
+        FROM chat_logs_antiga
+    """)
+    op.execute("DROP TABLE chat_logs_antiga")
+    _indices()
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('chat_logs', schema=None) as batch_op:
+            batch_op.alter_column('data_hora', existing_type=sa.DateTime(), nullable=True)
+            batch_op.drop_column('token_count')
+            batch_op.drop_column('char_count')
+        return
+
+    sequencia = bind.execute(sa.text("SELECT pg_get_serial_sequence('chat_logs', 'id')")).scalar()
+    _remover_indices()
+    op.execute("ALTER TABLE chat_logs RENAME TO chat_logs_particionada")
+    op.execute("ALTER TABLE chat_logs_particionada RENAME CONSTRAINT chat_logs_pkey TO chat_logs_particionada_pkey")
+    op.execute(f"ALTER SEQUENCE {sequencia} OWNED BY NONE")
+    op.execute(f"""
+        CREATE TABLE chat_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequencia}'),
+            barbearia_id INTEGER REFERENCES barbearia (id),
+            cliente_telefone VARCHAR(30),
+            mensagem TEXT,
+            tipo VARCHAR(10),
+            data_hora TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT chat_logs_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f"ALTER SEQUENCE {sequencia} OWNED BY chat_logs.id")
+    op.execute("""
+        INSERT INTO chat_logs (id, barbearia_id, cliente_telefone, mensagem, tipo, data_hora)
+        SELECT id, barbearia_id, cliente_telefone, mensagem, tipo, data_hora FROM chat_logs_particionada
+    """)
+    op.execute("DROP TABLE chat_logs_particionada CASCADE")
+    _indices()
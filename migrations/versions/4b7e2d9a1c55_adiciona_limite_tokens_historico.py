@@ -0,0 +1,26 @@
+"""Adiciona limite_tokens_historico na barbearia
+
+Revision ID: 4b7e2d9a1c55
+Revises: c111b46dc006
+Create Date: 2026-10-17 09:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2d9a1c55'
+down_revision = 'c111b46dc006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('barbearia', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('limite_tokens_historico', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('barbearia', schema=None) as batch_op:
+        batch_op.drop_column('limite_tokens_historico')
@@ -0,0 +1,52 @@
+"""Índice de conversas do monitor (conversa) e clientes por telefone normalizado (cliente)
+
+Revision ID: 5d2b9e7c4a13
+Revises: 3c8e5a1f7d42
+Create Date: 2026-10-17 22:31:12.480913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2b9e7c4a13'
+down_revision = '3c8e5a1f7d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cliente',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('barbearia_id', sa.Integer(), nullable=False),
+        sa.Column('telefone', sa.String(length=20), nullable=False),
+        sa.Column('nome', sa.String(length=100), nullable=True),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['barbearia_id'], ['barbearia.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('barbearia_id', 'telefone', name='uq_cliente_loja_telefone')
+    )
+    op.create_table(
+        'conversa',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('barbearia_id', sa.Integer(), nullable=False),
+        sa.Column('telefone', sa.String(length=20), nullable=False),
+        sa.Column('cliente_telefone', sa.String(length=30), nullable=False),
+        sa.Column('ultima_mensagem_em', sa.DateTime(), nullable=False),
+        sa.Column('ultima_previa', sa.String(length=120), nullable=True),
+        sa.Column('ultimo_tipo', sa.String(length=10), nullable=True),
+        sa.Column('nao_lidas', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['barbearia_id'], ['barbearia.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('barbearia_id', 'telefone', name='uq_conversa_loja_telefone')
+    )
+    op.create_index('ix_conversa_loja_ultima', 'conversa', ['barbearia_id', 'ultima_mensagem_em', 'id'], unique=False)
+    # Carga inicial a partir de agendamentos e chat_logs: `flask conversas`
+
+
+def downgrade():
+    op.drop_index('ix_conversa_loja_ultima', table_name='conversa')
+    op.drop_table('conversa')
+    op.drop_table('cliente')
@@ -0,0 +1,53 @@
+"""Adiciona grade_horarios (loja/profissional) e tabela excecao_horario
+
+Revision ID: 6c3f1a8e2d47
+Revises: 4b7e2d9a1c55
+Create Date: 2026-10-17 11:40:03.551920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c3f1a8e2d47'
+down_revision = '4b7e2d9a1c55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('barbearia', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('grade_horarios', sa.JSON(), nullable=True))
+
+    with op.batch_alter_table('profissional', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('grade_horarios', sa.JSON(), nullable=True))
+
+    op.create_table('excecao_horario',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('barbearia_id', sa.Integer(), nullable=False),
+    sa.Column('profissional_id', sa.Integer(), nullable=True),
+    sa.Column('data', sa.Date(), nullable=False),
+    sa.Column('fechado', sa.Boolean(), nullable=False),
+    sa.Column('abertura', sa.String(length=5), nullable=True),
+    sa.Column('fechamento', sa.String(length=5), nullable=True),
+    sa.Column('motivo', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['barbearia_id'], ['barbearia.id'], ),
+    sa.ForeignKeyConstraint(['profissional_id'], ['profissional.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('excecao_horario', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_excecao_horario_barbearia_id'), ['barbearia_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('excecao_horario', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_excecao_horario_barbearia_id'))
+
+    op.drop_table('excecao_horario')
+
+    with op.batch_alter_table('profissional', schema=None) as batch_op:
+        batch_op.drop_column('grade_horarios')
+
+    with op.batch_alter_table('barbearia', schema=None) as batch_op:
+        batch_op.drop_column('grade_horarios')
@@ -0,0 +1,69 @@
+"""Adiciona data_hora_fim no agendamento e constraint de exclusão contra sobreposição
+
+Revision ID: 9a5d0e3b7f12
+Revises: 6c3f1a8e2d47
+Create Date: 2026-10-17 14:05:27.904118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a5d0e3b7f12'
+down_revision = '6c3f1a8e2d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('agendamento', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_hora_fim', sa.DateTime(), nullable=True))
+
+    postgres = op.get_bind().dialect.name == 'postgresql'
+
+    # Preenche o fim dos agendamentos existentes pela duração do serviço
+    if postgres:
+        op.execute("""
+            UPDATE agendamento a
+               SET data_hora_fim = a.data_hora + (COALESCE(s.duracao, 30) * INTERVAL '1 minute')
+              FROM servico s
+             WHERE s.id = a.servico_id
+        """)
+    else:
+        op.execute("""
+            UPDATE agendamento
+               SET data_hora_fim = datetime(data_hora, '+' || COALESCE(
+                   (SELECT duracao FROM servico WHERE servico.id = agendamento.servico_id), 30) || ' minutes')
+        """)
+
+    # Encaixes antigos que já se sobrepõem ficam fora da constraint (fim nulo): sempre se mantém
+    # o agendamento mais antigo (menor id) de cada sobreposição
+    op.execute("""
+        UPDATE agendamento
+           SET data_hora_fim = NULL
+         WHERE EXISTS (
+               SELECT 1 FROM agendamento b
+                WHERE b.profissional_id = agendamento.profissional_id
+                  AND b.id < agendamento.id
+                  AND b.data_hora < agendamento.data_hora_fim
+                  AND agendamento.data_hora < b.data_hora_fim
+         )
+    """)
+
+    if postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute("""
+            ALTER TABLE agendamento
+              ADD CONSTRAINT agendamento_sem_sobreposicao
+              EXCLUDE USING gist (profissional_id WITH =, tsrange(data_hora, data_hora_fim, '[)') WITH &&)
+              WHERE (data_hora_fim IS NOT NULL)
+        """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE agendamento DROP CONSTRAINT IF EXISTS agendamento_sem_sobreposicao")
+
+    with op.batch_alter_table('agendamento', schema=None) as batch_op:
+        batch_op.drop_column('data_hora_fim')
@@ -0,0 +1,55 @@
+"""Índices compostos/parciais das consultas quentes (agendamento, chat_logs, servico, profissional, barbearia)
+
+Revision ID: b2e8c4f61a09
+Revises: 9a5d0e3b7f12
+Create Date: 2026-10-17 15:31:52.310447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e8c4f61a09'
+down_revision = '9a5d0e3b7f12'
+branch_labels = None
+depends_on = None
+
+META_NAO_NULO = sa.text('meta_phone_number_id IS NOT NULL')
+
+INDICES = [
+    ('ix_agendamento_loja_prof_data', 'agendamento', ['barbearia_id', 'profissional_id', 'data_hora'], {}),
+    ('ix_agendamento_prof_data', 'agendamento', ['profissional_id', 'data_hora'], {}),
+    ('ix_agendamento_loja_data', 'agendamento', ['barbearia_id', 'data_hora'], {}),
+    ('ix_agendamento_loja_telefone', 'agendamento', ['barbearia_id', 'telefone_cliente'], {}),
+    # chat_logs pode não existir em bancos criados só pelas migrações (a tabela nasceu via create_all)
+    ('ix_chat_logs_loja_tel_data', 'chat_logs', ['barbearia_id', 'cliente_telefone', 'data_hora'], {}),
+    ('ix_chat_logs_data_tipo', 'chat_logs', ['data_hora', 'tipo'], {}),
+    ('ix_servico_loja_nome', 'servico', ['barbearia_id', 'nome'], {}),
+    ('ix_profissional_loja_nome', 'profissional', ['barbearia_id', 'nome'], {}),
+    ('ix_barbearia_meta_phone_number_id', 'barbearia', ['meta_phone_number_id'],
+     {'postgresql_where': META_NAO_NULO, 'sqlite_where': META_NAO_NULO}),
+]
+
+
+def _existentes():
+    inspetor = sa.inspect(op.get_bind())
+    tabelas = set(inspetor.get_table_names())
+    indices = {
+        (tabela, ix['name']) for tabela in tabelas for ix in inspetor.get_indexes(tabela)
+    }
+    return tabelas, indices
+
+
+def upgrade():
+    tabelas, indices = _existentes()
+    for nome, tabela, colunas, opcoes in INDICES:
+        if tabela in tabelas and (tabela, nome) not in indices:
+            op.create_index(nome, tabela, colunas, unique=False, **opcoes)
+
+
+def downgrade():
+    tabelas, indices = _existentes()
+    for nome, tabela, _, _ in reversed(INDICES):
+        if (tabela, nome) in indices:
+            op.drop_index(nome, table_name=tabela)
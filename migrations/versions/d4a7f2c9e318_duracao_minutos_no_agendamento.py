@@ -0,0 +1,43 @@
+"""Adiciona duracao_minutos no agendamento (duração gravada no momento do agendamento)
+
+Revision ID: d4a7f2c9e318
+Revises: b2e8c4f61a09
+Create Date: 2026-10-17 16:42:11.530874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7f2c9e318'
+down_revision = 'b2e8c4f61a09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('agendamento', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duracao_minutos', sa.Integer(), nullable=True))
+
+    # Congela nos agendamentos existentes a duração atual do serviço (a mesma usada no
+    # preenchimento de data_hora_fim)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("""
+            UPDATE agendamento a
+               SET duracao_minutos = COALESCE(s.duracao, 30)
+              FROM servico s
+             WHERE s.id = a.servico_id
+        """)
+    else:
+        op.execute("""
+            UPDATE agendamento
+               SET duracao_minutos = COALESCE(
+                   (SELECT duracao FROM servico WHERE servico.id = agendamento.servico_id), 30)
+        """)
+    op.execute("UPDATE agendamento SET duracao_minutos = 30 WHERE duracao_minutos IS NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('agendamento', schema=None) as batch_op:
+        batch_op.drop_column('duracao_minutos')
@@ -0,0 +1,68 @@
+"""Cria inventario_noite (quarto x noite ocupados das pousadas) e preenche pelas reservas
+
+Revision ID: e7b3d15a9c62
+Revises: d4a7f2c9e318
+Create Date: 2026-10-17 18:20:45.118302
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d15a9c62'
+down_revision = 'd4a7f2c9e318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inventario = op.create_table(
+        'inventario_noite',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('barbearia_id', sa.Integer(), nullable=False),
+        sa.Column('profissional_id', sa.Integer(), nullable=False),
+        sa.Column('agendamento_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.Date(), nullable=False),
+        sa.Column('estado', sa.String(length=20), nullable=False),
+        sa.ForeignKeyConstraint(['barbearia_id'], ['barbearia.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['profissional_id'], ['profissional.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['agendamento_id'], ['agendamento.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('profissional_id', 'data', 'agendamento_id', name='uq_inventario_noite_quarto_data_reserva')
+    )
+    op.create_index('ix_inventario_noite_loja_data', 'inventario_noite', ['barbearia_id', 'data'], unique=False)
+
+    # Carga inicial pelas reservas dos quartos das pousadas (bancos sem as colunas business_type
+    # ou tipo, criadas fora das migrações, ficam para o `flask inventario-quartos`)
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'business_type' not in {c['name'] for c in inspector.get_columns('barbearia')} \
+            or 'tipo' not in {c['name'] for c in inspector.get_columns('profissional')}:
+        return
+    reservas = bind.execute(sa.text("""
+        SELECT a.id, a.barbearia_id, a.profissional_id, a.data_hora, a.data_hora_fim, a.duracao_minutos
+          FROM agendamento a
+          JOIN profissional p ON p.id = a.profissional_id
+          JOIN barbearia b ON b.id = p.barbearia_id
+         WHERE p.tipo = 'quarto' AND b.business_type = 'pousada'
+    """).columns(data_hora=sa.DateTime, data_hora_fim=sa.DateTime)).all()
+
+    linhas = []
+    for agendamento_id, barbearia_id, profissional_id, data_hora, data_hora_fim, duracao in reservas:
+        fim = data_hora_fim or data_hora + timedelta(minutes=duracao or 30)
+        ultima = (fim - timedelta(microseconds=1)).date() if fim > data_hora else data_hora.date()
+        dia = data_hora.date()
+        while dia <= ultima:
+            linhas.append(dict(barbearia_id=barbearia_id, profissional_id=profissional_id,
+                               agendamento_id=agendamento_id, data=dia, estado='reservado'))
+            dia += timedelta(days=1)
+    if linhas:
+        op.bulk_insert(inventario, linhas)
+
+
+def downgrade():
+    op.drop_index('ix_inventario_noite_loja_data', table_name='inventario_noite')
+    op.drop_table('inventario_noite')
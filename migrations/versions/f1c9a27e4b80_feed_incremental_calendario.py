@@ -0,0 +1,42 @@
+"""Feed incremental do calendário: atualizado_em no agendamento e lápides de removidos
+
+Revision ID: f1c9a27e4b80
+Revises: e7b3d15a9c62
+Create Date: 2026-10-17 19:48:03.227415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c9a27e4b80'
+down_revision = 'e7b3d15a9c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('agendamento', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('atualizado_em', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_agendamento_loja_atualizado', ['barbearia_id', 'atualizado_em'], unique=False)
+
+    op.create_table(
+        'agendamento_removido',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('barbearia_id', sa.Integer(), nullable=False),
+        sa.Column('agendamento_id', sa.Integer(), nullable=False),
+        sa.Column('removido_em', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['barbearia_id'], ['barbearia.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_agendamento_removido_loja_data', 'agendamento_removido', ['barbearia_id', 'removido_em'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_agendamento_removido_loja_data', table_name='agendamento_removido')
+    op.drop_table('agendamento_removido')
+
+    with op.batch_alter_table('agendamento', schema=None) as batch_op:
+        batch_op.drop_index('ix_agendamento_loja_atualizado')
+        batch_op.drop_column('atualizado_em')
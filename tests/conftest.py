@@ -0,0 +1,19 @@
+# tests/conftest.py
+# App mínimo (sem banco nem blueprints) para testar os serviços com os fakes em memória.
+import pytest
+from flask import Flask
+
+from app.extensions import cache
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        CACHE_TYPE='SimpleCache',
+        FILA_WORKERS_EMBUTIDOS=False,
+    )
+    cache.init_app(app)
+    with app.app_context():
+        yield app
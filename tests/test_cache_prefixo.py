@@ -0,0 +1,94 @@
+# tests/test_cache_prefixo.py
+# Cache do prefixo do prompt com o ProvedorLocal (IA_CACHE_PREFIXO='local').
+import pytest
+from cachetools import LRUCache
+
+from app.services import cache_prefixo
+
+PROMPT = "Você é a recepcionista virtual da Barbearia Teste. " * 20
+MODELO = 'gemini-2.5-flash'
+
+
+@pytest.fixture
+def provedor(app, monkeypatch):
+    app.config.update(IA_CACHE_PREFIXO='local', IA_CACHE_PREFIXO_MIN_TOKENS=50, IA_CACHE_PREFIXO_TTL=3600)
+    monkeypatch.setattr(cache_prefixo, '_provedor', None)
+    monkeypatch.setattr(cache_prefixo, '_modelos', LRUCache(maxsize=128))
+    provedor = cache_prefixo.obter_provedor()
+    assert isinstance(provedor, cache_prefixo.ProvedorLocal)
+
+    criados = []
+    criar_original = provedor.criar
+
+    def criar(*args):
+        nome = criar_original(*args)
+        criados.append(nome)
+        return nome
+
+    monkeypatch.setattr(provedor, 'criar', criar)
+    provedor.criados = criados
+    return provedor
+
+
+def _modelo(barbearia_id=1, modo='padrao', prompt=PROMPT):
+    return cache_prefixo.modelo_com_prefixo(
+        barbearia_id, modo, prompt, MODELO, None, {'temperature': 0.2}, None
+    )
+
+
+def test_registra_o_prefixo_uma_vez_e_reaproveita(provedor):
+    primeiro = _modelo()
+    assert primeiro is not None
+    assert len(provedor.criados) == 1
+    assert provedor.registrados[provedor.criados[0]]['system_instruction'] == PROMPT
+
+    assert _modelo() is primeiro
+    assert len(provedor.criados) == 1
+
+
+def test_outro_worker_usa_o_nome_do_cache_compartilhado(provedor, monkeypatch):
+    _modelo()
+    # Outro processo: sem o modelo local, mas com o nome no cache compartilhado
+    monkeypatch.setattr(cache_prefixo, '_modelos', LRUCache(maxsize=128))
+    assert _modelo() is not None
+    assert len(provedor.criados) == 1
+
+
+def test_prompt_alterado_registra_outro_prefixo(provedor):
+    _modelo()
+    _modelo(prompt=PROMPT + "Novo serviço: barba.")
+    assert len(provedor.criados) == 2
+    assert provedor.criados[0] != provedor.criados[1]
+
+
+def test_lojas_e_modos_nao_se_misturam(provedor):
+    _modelo(barbearia_id=1)
+    _modelo(barbearia_id=2)
+    _modelo(barbearia_id=1, modo='pousada')
+    assert len(provedor.criados) == 3
+
+
+def test_descartar_faz_o_proximo_uso_registrar_de_novo(provedor):
+    _modelo()
+    cache_prefixo.descartar(1, 'padrao', PROMPT)
+    assert _modelo() is not None
+    assert len(provedor.criados) == 2
+
+
+def test_prompt_pequeno_nao_usa_cache(provedor):
+    assert _modelo(prompt="Curto.") is None
+    assert provedor.criados == []
+
+
+def test_falha_do_provedor_cai_para_o_prompt_completo(provedor, monkeypatch):
+    def falhar(*args):
+        raise RuntimeError("API de cache fora do ar")
+
+    monkeypatch.setattr(provedor, 'criar', falhar)
+    assert _modelo() is None
+
+
+def test_desligado_nao_usa_provedor(app, provedor):
+    app.config['IA_CACHE_PREFIXO'] = 'desligado'
+    assert cache_prefixo.obter_provedor() is None
+    assert _modelo() is None
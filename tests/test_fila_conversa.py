@@ -0,0 +1,157 @@
+# tests/test_fila_conversa.py
+# Execução em série por conversa (enfileirar_conversa + conversa.drenar) na FilaLocal:
+# ordem, agrupamento em lotes, janela, retentativa do lote e fila de mortas.
+import json
+import time
+
+import pytest
+
+from app.services import fila_service
+from app.services.fila_service import FILA_PADRAO
+
+# (tarefa, [textos]) na ordem em que os lotes rodaram
+_execucoes = []
+_falhas = {'instavel': 0}
+
+
+@fila_service.tarefa_conversa('teste.eco')
+def _eco(lote):
+    _execucoes.append(('eco', [d['texto'] for d in lote]))
+
+
+@fila_service.tarefa_conversa('teste.outra')
+def _outra(lote):
+    _execucoes.append(('outra', [d['texto'] for d in lote]))
+
+
+@fila_service.tarefa_conversa('teste.instavel')
+def _instavel(lote):
+    _execucoes.append(('instavel', [d['texto'] for d in lote]))
+    if _falhas['instavel'] > 0:
+        _falhas['instavel'] -= 1
+        raise RuntimeError('falha transitória')
+
+
+@fila_service.tarefa_conversa('teste.quebrada')
+def _quebrada(lote):
+    _execucoes.append(('quebrada', [d['texto'] for d in lote]))
+    raise RuntimeError('sempre falha')
+
+
+@fila_service.tarefa_conversa('teste.chega_outra')
+def _chega_outra(lote):
+    # Simula mensagem nova do cliente enquanto o lote está sendo processado
+    _execucoes.append(('chega_outra', [d['texto'] for d in lote]))
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='durante')
+
+
+@pytest.fixture
+def fila(app, monkeypatch):
+    backend = fila_service.FilaLocal()
+    monkeypatch.setattr(fila_service, '_backend', backend)
+    app.config.update(CONVERSA_JANELA_AGRUPAMENTO=0, CONVERSA_JANELA_MAXIMA=0, FILA_MAX_TENTATIVAS=3)
+    _execucoes.clear()
+    _falhas['instavel'] = 0
+    return backend
+
+
+def _rodar(app, backend, limite=5.0):
+    """Executa a fila (promovendo as agendadas) até não sobrar nada."""
+    pool = fila_service.PoolWorkers(app, [FILA_PADRAO], 1)
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        backend.promover_vencidas(FILA_PADRAO, time.time())
+        item = backend.consumir(FILA_PADRAO, timeout=0.02)
+        if item is not None:
+            pool._executar(backend, FILA_PADRAO, item)
+        elif not backend._agendadas[FILA_PADRAO]:
+            return
+    pytest.fail("a fila não esvaziou")
+
+
+def _mortas(backend):
+    return [json.loads(item) for item in reversed(backend._filas[f"{FILA_PADRAO}:mortas"])]
+
+
+def test_mensagens_da_conversa_viram_um_lote_em_ordem(app, fila):
+    for texto in ('oi', 'quero cortar', 'amanhã'):
+        fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto=texto)
+
+    # Só a primeira mensagem agenda drenagem: a conversa já tem dono
+    assert fila.profundidade(FILA_PADRAO) == 1
+    _rodar(app, fila)
+    assert _execucoes == [('eco', ['oi', 'quero cortar', 'amanhã'])]
+
+
+def test_tipos_diferentes_viram_lotes_separados_na_ordem(app, fila):
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='a')
+    fila_service.enfileirar_conversa('1:5511', 'teste.outra', texto='b')
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='c')
+    _rodar(app, fila)
+    assert _execucoes == [('eco', ['a']), ('outra', ['b']), ('eco', ['c'])]
+
+
+def test_conversas_diferentes_sao_drenadas_separadamente(app, fila):
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='a1')
+    fila_service.enfileirar_conversa('1:5522', 'teste.eco', texto='b1')
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='a2')
+    assert fila.profundidade(FILA_PADRAO) == 2
+    _rodar(app, fila)
+    assert sorted(_execucoes) == [('eco', ['a1', 'a2']), ('eco', ['b1'])]
+
+
+def test_mensagem_durante_o_lote_gera_nova_rodada(app, fila):
+    fila_service.enfileirar_conversa('1:5511', 'teste.chega_outra', texto='primeira')
+    _rodar(app, fila)
+    assert _execucoes == [('chega_outra', ['primeira']), ('eco', ['durante'])]
+    # Conversa solta no fim: a próxima mensagem agenda uma drenagem nova
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='depois')
+    assert fila.profundidade(FILA_PADRAO) == 1
+
+
+def test_janela_agrupa_rajada_sem_prender_o_worker(app, fila):
+    app.config.update(CONVERSA_JANELA_AGRUPAMENTO=0.2, CONVERSA_JANELA_MAXIMA=2)
+    pool = fila_service.PoolWorkers(app, [FILA_PADRAO], 1)
+
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='oi')
+    inicio = time.monotonic()
+    pool._executar(fila, FILA_PADRAO, fila.consumir(FILA_PADRAO, timeout=0))
+    # A drenagem se reagendou para o fim da janela em vez de dormir
+    assert time.monotonic() - inicio < 0.1
+    assert _execucoes == [] and len(fila._agendadas[FILA_PADRAO]) == 1
+
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='quero cortar')
+    _rodar(app, fila)
+    assert _execucoes == [('eco', ['oi', 'quero cortar'])]
+
+
+def test_lote_com_erro_e_repetido_antes_das_mensagens_seguintes(app, fila):
+    _falhas['instavel'] = 1
+    fila_service.enfileirar_conversa('1:5511', 'teste.instavel', texto='a')
+    fila_service.enfileirar_conversa('1:5511', 'teste.instavel', texto='b')
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='c')
+    _rodar(app, fila)
+    assert _execucoes == [('instavel', ['a', 'b']), ('instavel', ['a', 'b']), ('eco', ['c'])]
+    assert _mortas(fila) == []
+
+
+def test_lote_que_sempre_falha_vai_para_mortas_e_a_conversa_segue(app, fila):
+    fila_service.enfileirar_conversa('1:5511', 'teste.quebrada', texto='a')
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='b')
+    _rodar(app, fila)
+
+    assert _execucoes == [('quebrada', ['a'])] * 3 + [('eco', ['b'])]
+    mortas = _mortas(fila)
+    assert len(mortas) == 1
+    assert mortas[0]['tarefa'] == 'teste.quebrada'
+    assert mortas[0]['dados'] == {'texto': 'a'}
+    assert mortas[0]['tentativas'] == 3
+    assert mortas[0]['chave'] == '1:5511'
+
+
+def test_tarefa_nao_registrada_vai_para_mortas(app, fila):
+    fila_service.enfileirar_conversa('1:5511', 'teste.inexistente', texto='a')
+    fila_service.enfileirar_conversa('1:5511', 'teste.eco', texto='b')
+    _rodar(app, fila)
+    assert _execucoes == [('eco', ['b'])]
+    assert [m['tarefa'] for m in _mortas(fila)] == ['teste.inexistente']